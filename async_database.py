@@ -0,0 +1,169 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from database import (
+    CATEGORIES_QUERY, POOL_MAX_SIZE, POOL_MIN_SIZE, POOL_TIMEOUT, RECIPE_INGREDIENTS_QUERY,
+    get_connection_params, group_ingredients, recipe_cache, recipe_details_query, recipes_query,
+    reference_cache, search_query
+)
+from instrumentation import bind_context, instrument, record_acquire, record_rows
+
+# The async pool is separate from the psycopg2 one, so it is sized on its own
+ASYNC_POOL_MIN_SIZE = int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', str(POOL_MIN_SIZE)))
+ASYNC_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', str(POOL_MAX_SIZE)))
+
+# Async connections and the pool belong to one event loop, which runs in a
+# background thread so synchronous callers (Streamlit reruns) can share it
+_loop = None
+_loop_lock = threading.Lock()
+_pool = None
+_pool_lock = None
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='async-database', daemon=True).start()
+    return _loop
+
+def run(coro):
+    """Run a coroutine on the shared database event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(bind_context(coro), _get_loop()).result()
+
+def _conninfo():
+    params = get_connection_params()
+    params['dbname'] = params.pop('database')
+    return make_conninfo(**{key: value for key, value in params.items() if value})
+
+async def get_pool():
+    """Return the async connection pool, opening it on first use."""
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    _conninfo(), min_size=ASYNC_POOL_MIN_SIZE, max_size=ASYNC_POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT, open=False
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+async def _close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+def close_pool():
+    """Close the async pool if it was opened."""
+    if _pool is not None and _loop is not None and _loop.is_running():
+        run(_close_pool())
+
+atexit.register(close_pool)
+
+@asynccontextmanager
+async def get_db_connection():
+    """Borrow a pooled async connection; commits on success and rolls back on error."""
+    start = time.perf_counter()
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        record_acquire(time.perf_counter() - start)
+        yield conn
+
+async def _fetch_all(query, params=None):
+    async with get_db_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(query, params)
+        rows = await cur.fetchall()
+    record_rows(rows)
+    return rows
+
+@instrument()
+async def get_categories():
+    """Async get_categories(); shares the reference-data cache with database.py."""
+    return list(await reference_cache.get_or_load_async('categories', lambda: _fetch_all(CATEGORIES_QUERY)))
+
+@instrument()
+async def get_recipes(user_id=None, search=None, category_id=None, after=None, limit=None):
+    """Async get_recipes(); shares the recipe cache with database.py."""
+    query, params = recipes_query(user_id, search, category_id, after, limit)
+    key = (user_id, 'list', search, category_id, tuple(after) if after else None, limit)
+    return list(await recipe_cache.get_or_load_async(key, lambda: _fetch_all(query, params)))
+
+@instrument()
+async def search_recipes(user_id, query, limit=50, category_id=None):
+    """Async search_recipes(); shares the recipe cache with database.py."""
+    sql, params = search_query(user_id, query, limit, category_id)
+    key = (user_id, 'search', query, limit, category_id)
+    return list(await recipe_cache.get_or_load_async(key, lambda: _fetch_all(sql, params)))
+
+async def _fetch_ingredients_by_recipe(recipe_ids):
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if not recipe_ids:
+        return {}
+    return group_ingredients(recipe_ids, await _fetch_all(RECIPE_INGREDIENTS_QUERY, (recipe_ids,)))
+
+@instrument()
+async def get_recipe_ingredients(recipe_id):
+    """Async get_recipe_ingredients()."""
+    return (await _fetch_ingredients_by_recipe([recipe_id]))[recipe_id]
+
+@instrument()
+async def get_recipes_with_ingredients(user_id=None, recipe_ids=None):
+    """Async get_recipes_with_ingredients().
+
+    When the ids are known up front the recipe rows and their ingredients are
+    read concurrently on two connections.
+    """
+    query, params = recipe_details_query(user_id, recipe_ids)
+
+    async def load():
+        if recipe_ids is None:
+            recipes = await _fetch_all(query, params)
+            grouped = await _fetch_ingredients_by_recipe([recipe['id'] for recipe in recipes])
+        else:
+            recipes, grouped = await asyncio.gather(
+                _fetch_all(query, params), _fetch_ingredients_by_recipe(recipe_ids)
+            )
+        for recipe in recipes:
+            recipe['ingredients'] = grouped.get(recipe['id'], [])
+        return recipes
+
+    key = (user_id, 'details', tuple(recipe_ids) if recipe_ids is not None else None)
+    return list(await recipe_cache.get_or_load_async(key, load))
+
+async def with_details(user_id, recipes):
+    """Async database.with_details()."""
+    details = {
+        recipe['id']: recipe
+        for recipe in await get_recipes_with_ingredients(
+            user_id=user_id, recipe_ids=[recipe['id'] for recipe in recipes]
+        )
+    }
+    return [details[recipe['id']] for recipe in recipes]
+
+async def load_recipe_pages(user_id, category_id, pages, page_size):
+    """Async database.load_recipe_pages().
+
+    Each page's details load while the next keyset page is being read.
+    """
+    details, after, has_more = [], None, False
+    for _ in range(pages):
+        page = await get_recipes(user_id=user_id, category_id=category_id, after=after, limit=page_size + 1)
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        details.append(asyncio.create_task(with_details(user_id, page)))
+        if not has_more:
+            break
+        after = (page[-1]['title'], page[-1]['id'])
+    recipes = [recipe for page in await asyncio.gather(*details) for recipe in page]
+    return recipes, has_more
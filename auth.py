@@ -1,66 +1,161 @@
+import base64
 import hashlib
+import hmac
+import json
 import os
-from database import get_db_connection
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from instrumentation import instrument
+from repository import get_repository
 import streamlit as st
 
+# scrypt cost parameters; the defaults take 16 MiB and about 50 ms per hash
+SCRYPT_N = int(os.getenv('SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.getenv('SCRYPT_R', '8'))
+SCRYPT_P = int(os.getenv('SCRYPT_P', '1'))
+# Hashes computed at the same time; further logins queue for a worker
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Signs session tokens; set it (the same on every replica) so logins survive restarts
+SESSION_SECRET = os.getenv('SESSION_SECRET') or secrets.token_hex(32)
+# Seconds a login lasts across refreshes and new tabs
+SESSION_TTL = int(os.getenv('SESSION_TTL', '86400'))
+SESSION_COOKIE = 'recipe_session'
+
+# hashlib.scrypt releases the GIL, so other sessions keep running while a hash is computed
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
 def hash_password(password: str) -> str:
-    """Hash a password using SHA-256."""
-    salt = os.environ.get('PGPASSWORD', 'default-salt')  # Using DB password as salt
+    """Hash a password with scrypt and a random salt, as 'scrypt$N$r$p$salt$hash'."""
+    salt = os.urandom(16)
+    digest = _hash_pool.submit(_scrypt, password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P).result()
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+def _legacy_hash(password: str) -> str:
+    """The former scheme (SHA-256 with the DB password as salt), kept to verify old hashes."""
+    salt = os.environ.get('PGPASSWORD', 'default-salt')
     return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
 
+def check_password(password: str, stored: str) -> bool:
+    """Check a password against a stored hash of either scheme."""
+    if stored.startswith('scrypt$'):
+        _, n, r, p, salt, digest = stored.split('$')
+        computed = _hash_pool.submit(_scrypt, password, _b64decode(salt), int(n), int(r), int(p)).result()
+        return hmac.compare_digest(computed, _b64decode(digest))
+    return hmac.compare_digest(stored, _legacy_hash(password))
+
+def needs_rehash(stored: str) -> bool:
+    """True for legacy hashes and scrypt hashes with other cost parameters."""
+    return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    """Checked for unknown usernames, so they take as long as a wrong password."""
+    return hash_password(secrets.token_hex(16))
+
+@instrument()
 def register_user(username: str, password: str) -> bool:
-    """Register a new user."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+    """Register a new user; returns False if the username already exists."""
+    return get_repository().create_user(username, hash_password(password))
+
+@instrument()
+def verify_credentials(username: str, password: str):
+    """Return the user's row if the password matches, else None.
+
+    A matching hash from the legacy scheme or older scrypt parameters is replaced.
+    """
+    repo = get_repository()
+    user = repo.get_user(username)
+    if user is None:
+        check_password(password, _dummy_hash())
+        return None
+    if not check_password(password, user['password_hash']):
+        return None
+    if needs_rehash(user['password_hash']):
+        user['password_hash'] = hash_password(password)
+        repo.update_password_hash(user['id'], user['password_hash'])
+    return user
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest())
+
+def create_session_token(user_id: int, username: str, now=None) -> str:
+    """A signed 'payload.signature' token naming the user, expiring after SESSION_TTL.
+
+    The nonce makes every login's token unique, so per-login state such as
+    revoked snapshot links (pwa.revoke_snapshot_session) never carries over.
+    """
+    now = time.time() if now is None else now
+    claims = {'uid': user_id, 'usr': username, 'exp': int(now) + SESSION_TTL, 'nonce': secrets.token_urlsafe(8)}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    return f"{payload}.{_sign(payload)}"
+
+def validate_session_token(token, now=None):
+    """(user_id, username) for a correctly signed, unexpired token, else None; no database query."""
+    if not isinstance(token, str):
+        return None
+    payload, _, signature = token.partition('.')
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters, which a cookie may hold
+    if not payload or not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
     try:
-        # Check if username exists
-        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
-        if cur.fetchone() is not None:
-            return False
-        
-        # Insert new user
-        password_hash = hash_password(password)
-        cur.execute(
-            "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
-            (username, password_hash)
-        )
-        conn.commit()
-        return True
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if claims['exp'] < (time.time() if now is None else now):
+        return None
+    return claims['uid'], claims['usr']
+
+def _start_session(user_id: int, username: str, token: str):
+    st.session_state['user_id'] = user_id
+    st.session_state['username'] = username
+    st.session_state['session_token'] = token
+    st.session_state['authenticated'] = True
+    st.session_state.pop('logged_out', None)
 
 def login_user(username: str, password: str) -> bool:
     """Verify user credentials."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        password_hash = hash_password(password)
-        cur.execute(
-            "SELECT id, username FROM users WHERE username = %s AND password_hash = %s",
-            (username, password_hash)
-        )
-        user = cur.fetchone()
-        if user:
-            st.session_state['user_id'] = user[0]
-            st.session_state['username'] = user[1]
-            st.session_state['authenticated'] = True
-            return True
+    user = verify_credentials(username, password)
+    if user:
+        _start_session(user['id'], user['username'], create_session_token(user['id'], user['username']))
+        return True
+    return False
+
+def restore_session() -> bool:
+    """Log in from the session cookie of an earlier login (set by templates/base.html).
+
+    Used by new browser sessions, e.g. after a refresh or in a new tab; the
+    token is checked without a database query.
+    """
+    if is_authenticated():
+        return True
+    # Cookies are read once per browser session, so a removed cookie may still show up here
+    if st.session_state.get('logged_out'):
+        return False
+    token = st.context.cookies.get(SESSION_COOKIE)
+    session = validate_session_token(token)
+    if session is None:
         return False
-    finally:
-        cur.close()
-        conn.close()
+    _start_session(*session, token)
+    return True
 
 def logout_user():
     """Log out the current user."""
-    for key in ['user_id', 'username', 'authenticated']:
+    for key in ['user_id', 'username', 'authenticated', 'session_token']:
         if key in st.session_state:
             del st.session_state[key]
+    # Lets the page remove the session cookie and the offline recipes
+    st.session_state['logged_out'] = True
 
 def is_authenticated() -> bool:
     """Check if user is authenticated."""
@@ -0,0 +1,80 @@
+"""Wall-clock latency of loading the View Recipes page data through the
+sequential psycopg2 path (database.py) and the concurrent async path
+(async_database.py).
+
+Caches are cleared before every render so each one reaches the database. Run
+it against a database that already has recipes, e.g. after index_benchmark:
+
+    python -m benchmarks.async_benchmark --renders 200 --pages 3
+"""
+import argparse
+import asyncio
+import json
+import async_database
+import database
+from benchmarks.index_benchmark import time_calls
+from database import get_db_connection, recipe_cache, reference_cache
+
+def busiest_users(count):
+    """Ids of the users with the most recipes."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT user_id FROM recipes
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id
+            ORDER BY count(*) DESC
+            LIMIT %s
+        """, (count,))
+        return [row[0] for row in cur.fetchall()]
+
+def clear_caches():
+    recipe_cache.invalidate()
+    reference_cache.invalidate()
+
+def render_sequential(user_id, pages, page_size):
+    clear_caches()
+    database.get_categories()
+    database.load_recipe_pages(user_id, None, pages, page_size)
+
+async def _render_async(user_id, pages, page_size):
+    await asyncio.gather(
+        async_database.get_categories(),
+        async_database.load_recipe_pages(user_id, None, pages, page_size),
+    )
+
+def render_async(user_id, pages, page_size):
+    clear_caches()
+    async_database.run(_render_async(user_id, pages, page_size))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--renders', type=int, default=200, help="timed renders per path")
+    parser.add_argument('--users', type=int, default=20, help="rotate renders over this many users")
+    parser.add_argument('--pages', type=int, default=3, help="keyset pages shown per render")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    user_ids = busiest_users(args.users)
+    if not user_ids:
+        parser.error("no recipes to load; seed the database first")
+    calls = [(user_ids[i % len(user_ids)], args.pages, args.page_size) for i in range(args.renders)]
+
+    # Open both pools before timing
+    render_sequential(*calls[0])
+    render_async(*calls[0])
+
+    results = {
+        'sequential': time_calls(render_sequential, calls),
+        'async': time_calls(render_async, calls),
+    }
+    for name, stats in results.items():
+        print(f"{name}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+              f"p95 {stats['p95_ms']:.2f} ms over {stats['calls']} renders")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Per-query latency of the storage backends behind repository.py, through the
+same calls the app makes.
+
+Seeds a benchmark user through add_recipe() on first run. The SQLite backend
+needs no server, so this also runs in CI:
+
+    python -m benchmarks.backend_benchmark --backend sqlite --sqlite-path /tmp/bench.db
+    python -m benchmarks.backend_benchmark --backend postgres
+"""
+import argparse
+import json
+import random
+from benchmarks.async_benchmark import clear_caches
+from benchmarks.index_benchmark import time_calls
+from repository import PostgresRepository
+
+BENCH_USERNAME = 'bench_backend_user'
+WORDS = ['apple', 'basil', 'butter', 'carrot', 'chicken', 'garlic', 'lemon', 'onion', 'pepper', 'rice',
+         'salmon', 'spinach', 'sugar', 'thyme', 'tomato', 'yogurt']
+UNITS = ['g', 'ml', 'cup', 'tbsp', 'tsp', '']
+
+def make_repository(args):
+    if args.backend == 'sqlite':
+        from sqlite_backend import SQLiteRepository
+        return SQLiteRepository(args.sqlite_path)
+    return PostgresRepository()
+
+def seed(repo, recipes, ingredients_per_recipe, rng):
+    """Create the benchmark user and its recipes, unless they already exist; returns the user id."""
+    if repo.create_user(BENCH_USERNAME, 'x'):
+        user_id = repo.get_user(BENCH_USERNAME)['id']
+        category_ids = [category['id'] for category in repo.get_categories()]
+        for n in range(recipes):
+            words = rng.sample(WORDS, 2)
+            repo.add_recipe(
+                title=f"{words[0].title()} {words[1]} {n}",
+                description=f"Seeded recipe with {words[0]} and {words[1]}",
+                instructions="Stir the pot and simmer gently. " * 20,
+                cooking_time=10 + n % 120,
+                servings=1 + n % 8,
+                category_id=rng.choice(category_ids),
+                ingredients_data=[
+                    {'name': name, 'quantity': rng.randint(1, 500), 'unit': rng.choice(UNITS)}
+                    for name in rng.sample(WORDS, ingredients_per_recipe)
+                ],
+                user_id=user_id,
+            )
+        return user_id
+    print("Benchmark data already present, skipping seed")
+    return repo.get_user(BENCH_USERNAME)['id']
+
+def uncached(func):
+    def call(*args):
+        clear_caches()
+        return func(*args)
+    return call
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=['postgres', 'sqlite'], default='sqlite')
+    parser.add_argument('--sqlite-path', default='benchmark.db')
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+    parser.add_argument('--calls', type=int, default=200, help="timed calls per query")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    repo = make_repository(args)
+    repo.init_db()
+    rng = random.Random(0)
+    user_id = seed(repo, args.recipes, args.ingredients_per_recipe, rng)
+    recipe_ids = [recipe['id'] for recipe in repo.get_recipes(user_id=user_id)]
+    if not recipe_ids:
+        parser.error("the benchmark user has no recipes")
+    words = [(rng.choice(WORDS),) for _ in range(args.calls)]
+
+    results = {
+        'backend': repo.name,
+        'latency': {
+            'load_recipe_pages': time_calls(
+                uncached(lambda: repo.load_recipe_pages(user_id, None, 1, args.page_size)),
+                [()] * args.calls
+            ),
+            'search_recipes': time_calls(
+                uncached(lambda word: repo.search_recipes(user_id, word, limit=args.page_size)), words
+            ),
+            'get_recipe': time_calls(
+                uncached(repo.get_recipe), [(rng.choice(recipe_ids),) for _ in range(args.calls)]
+            ),
+            'get_shopping_list': time_calls(
+                uncached(lambda ids: repo.get_shopping_list(user_id, ids)),
+                [(rng.sample(recipe_ids, min(10, len(recipe_ids))),) for _ in range(args.calls)]
+            ),
+            'find_recipes_by_pantry': time_calls(
+                uncached(lambda names: repo.find_recipes_by_pantry(user_id, names)),
+                [(rng.sample(WORDS, 5),) for _ in range(args.calls)]
+            ),
+        },
+    }
+    for name, stats in results['latency'].items():
+        print(f"{repo.name} {name}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+              f"p95 {stats['p95_ms']:.2f} ms over {stats['calls']} calls")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Query plans and latency for get_recipes() and get_recipe_ingredients() with
+and without the indexes from migrations/0003_hot_path_indexes.sql.
+
+Seeds synthetic data on first run, so point the PG* variables at a scratch
+database:
+
+    python -m benchmarks.index_benchmark --recipes 200000 --ingredients-per-recipe 5
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import time
+from database import (
+    MIGRATIONS_DIR, RECIPE_INGREDIENTS_QUERY, apply_migrations, get_db_connection,
+    get_recipe_ingredients, get_recipes, recipes_query
+)
+
+INDEX_MIGRATION = os.path.join(MIGRATIONS_DIR, '0003_hot_path_indexes.sql')
+BENCH_USER_PREFIX = 'bench_user_'
+
+def index_statements():
+    """(name, CREATE INDEX statement) pairs from the index migration."""
+    with open(INDEX_MIGRATION, 'r') as f:
+        sql = f.read()
+    return [
+        (match.group(2), match.group(1))
+        for match in re.finditer(r'(CREATE INDEX IF NOT EXISTS (\w+) [^;]+;)', sql)
+    ]
+
+def seed(users, recipes, ingredients, ingredients_per_recipe):
+    """Insert synthetic users, ingredients, recipes and recipe_ingredients set-wise."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM users WHERE username LIKE %s", (BENCH_USER_PREFIX + '%',))
+        if cur.fetchone()[0]:
+            print("Benchmark data already present, skipping seed")
+            return
+        
+        # Per-row search triggers would dominate the load; the derived columns are backfilled below
+        cur.execute("ALTER TABLE recipes DISABLE TRIGGER USER")
+        cur.execute("ALTER TABLE recipe_ingredients DISABLE TRIGGER USER")
+        cur.execute("""
+            INSERT INTO users (username, password_hash)
+            SELECT %s || g, 'x' FROM generate_series(1, %s) g
+        """, (BENCH_USER_PREFIX, users))
+        cur.execute("""
+            INSERT INTO ingredients (name)
+            SELECT 'bench ingredient ' || g FROM generate_series(1, %s) g
+            ON CONFLICT (name) DO NOTHING
+        """, (ingredients,))
+        cur.execute("""
+            WITH u AS (
+                SELECT array_agg(id ORDER BY id) AS ids FROM users WHERE username LIKE %s
+            ), c AS (
+                SELECT array_agg(id ORDER BY id) AS ids FROM categories
+            )
+            INSERT INTO recipes (title, description, instructions, cooking_time, servings, category_id, user_id)
+            SELECT 'Recipe ' || md5(g::text), 'Seeded recipe ' || g,
+                   repeat('Stir the pot and simmer gently. ', 20),
+                   10 + g %% 120, 1 + g %% 8,
+                   c.ids[1 + g %% array_length(c.ids, 1)],
+                   u.ids[1 + g %% array_length(u.ids, 1)]
+            FROM generate_series(1, %s) g, u, c
+        """, (BENCH_USER_PREFIX + '%', recipes))
+        cur.execute("""
+            WITH i AS (
+                SELECT array_agg(id ORDER BY id) AS ids FROM ingredients WHERE name LIKE 'bench ingredient %%'
+            )
+            INSERT INTO recipe_ingredients (recipe_id, ingredient_id, quantity, unit)
+            SELECT r.id,
+                   i.ids[1 + (r.id + k * (array_length(i.ids, 1) / %s)) %% array_length(i.ids, 1)],
+                   1 + k, 'g'
+            FROM recipes r
+            JOIN users u ON u.id = r.user_id AND u.username LIKE %s
+            CROSS JOIN i
+            CROSS JOIN generate_series(0, %s - 1) k
+            ON CONFLICT DO NOTHING
+        """, (ingredients_per_recipe, BENCH_USER_PREFIX + '%', ingredients_per_recipe))
+        cur.execute("""
+            UPDATE recipes
+            SET search_vector = recipe_search_vector(id, title, description, instructions),
+                ingredient_ids = recipe_ingredient_ids(id)
+            WHERE search_vector IS NULL
+        """)
+        cur.execute("ALTER TABLE recipes ENABLE TRIGGER USER")
+        cur.execute("ALTER TABLE recipe_ingredients ENABLE TRIGGER USER")
+
+def sample_ids(count, rng):
+    """Pick benchmark user ids and recipe ids to query."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE username LIKE %s", (BENCH_USER_PREFIX + '%',))
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT max(id) FROM recipes")
+        max_recipe_id = cur.fetchone()[0]
+    return (
+        [rng.choice(user_ids) for _ in range(count)],
+        [rng.randint(1, max_recipe_id) for _ in range(count)],
+    )
+
+def set_indexes(enabled):
+    """Create or drop the indexes under test, then refresh planner statistics."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        for name, statement in index_statements():
+            cur.execute(statement if enabled else f"DROP INDEX IF EXISTS {name}")
+        cur.execute("ANALYZE recipes")
+        cur.execute("ANALYZE recipe_ingredients")
+
+def explain(query, params):
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+        return "\n".join(row[0] for row in cur.fetchall())
+
+def time_calls(func, args_list):
+    """Latency summary in milliseconds for calling func once per argument."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': samples[len(samples) // 2],
+        'p95_ms': samples[int(len(samples) * 0.95) - 1],
+    }
+
+def run_phase(enabled, user_ids, recipe_ids, page_size):
+    set_indexes(enabled)
+    return {
+        'plans': {
+            'get_recipes': explain(*recipes_query(user_id=user_ids[0], limit=page_size)),
+            'get_recipe_ingredients': explain(RECIPE_INGREDIENTS_QUERY, ([recipe_ids[0]],)),
+        },
+        'latency': {
+            'get_recipes': time_calls(
+                lambda user_id: get_recipes(user_id=user_id, limit=page_size),
+                [(user_id,) for user_id in user_ids]
+            ),
+            'get_recipe_ingredients': time_calls(
+                get_recipe_ingredients, [(recipe_id,) for recipe_id in recipe_ids]
+            ),
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=200_000)
+    parser.add_argument('--ingredients', type=int, default=5000)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=5)
+    parser.add_argument('--calls', type=int, default=200, help="timed calls per query and phase")
+    parser.add_argument('--page-size', type=int, default=21)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+    
+    apply_migrations()
+    seed(args.users, args.recipes, args.ingredients, args.ingredients_per_recipe)
+    user_ids, recipe_ids = sample_ids(args.calls, random.Random(0))
+    
+    # Finish with the indexes in place so the database matches the migrations
+    results = {
+        'before': run_phase(False, user_ids, recipe_ids, args.page_size),
+        'after': run_phase(True, user_ids, recipe_ids, args.page_size),
+    }
+    
+    for phase, result in results.items():
+        print(f"=== {phase} ===")
+        for name, plan in result['plans'].items():
+            print(f"--- {name} plan ---\n{plan}")
+        for name, stats in result['latency'].items():
+            print(f"{name}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+                  f"p95 {stats['p95_ms']:.2f} ms over {stats['calls']} calls")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Concurrent load test of one replica: scripted login/list/search/add workloads
+through auth.py, the storage repository, UnitConverter and utils, run on a
+thread or process pool, plus optional headless app sessions via
+streamlit.testing.
+
+Seeds synthetic users (all with the password LOAD_PASSWORD), ingredients and
+recipes on first run, using whichever backend DB_BACKEND selects. Reports
+p50/p95/p99 latency and throughput per operation as JSON, and with --baseline
+exits non-zero when p95 latency or throughput regressed:
+
+    python -m benchmarks.load_test --users 50 --recipes-per-user 200 --workers 8 --duration 30
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/load.db python -m benchmarks.load_test --executor process
+    python -m benchmarks.load_test --app-sessions 4 --json run.json --baseline last.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from auth import hash_password, verify_credentials
+from database import invalidate_user_recipes
+from repository import get_repository
+from utils import parse_ingredient_line, scale_recipes
+
+LOAD_USER_PREFIX = 'load_user_'
+LOAD_PASSWORD = 'load-test-password'
+DEFAULT_MIX = 'login=5,list=50,search=30,add=15'
+APP_PAGES = ["View Recipes", "What Can I Cook", "Shopping List"]
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+WORDS = ['apple', 'basil', 'butter', 'carrot', 'chicken', 'garlic', 'lemon', 'onion', 'pepper', 'rice',
+         'salmon', 'spinach', 'sugar', 'thyme', 'tomato', 'yogurt', 'flour', 'milk', 'egg', 'cheese']
+UNITS = ['g', 'ml', 'cups', 'tbsp', 'tsp', 'oz', 'lb', 'pinch']
+QUANTITIES = ['1', '2', '1/2', '1 1/2', '3/4', '250', '½', '0.5']
+
+def parse_mix(text):
+    """'login=5,list=50' -> {'login': 5.0, 'list': 50.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name.strip()}'")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def ingredient_lines(rng, count):
+    """Free-text ingredient lines in the forms the importer and parser accept."""
+    return [
+        f"{rng.choice(QUANTITIES)} {rng.choice(UNITS)} {name}"
+        for name in rng.sample(WORDS, count)
+    ]
+
+def random_recipe(rng, category_ids, ingredients_per_recipe):
+    ingredients = []
+    for line in ingredient_lines(rng, ingredients_per_recipe):
+        quantity, unit, name = parse_ingredient_line(line)
+        ingredients.append({'name': name, 'quantity': quantity, 'unit': unit})
+    words = rng.sample(WORDS, 2)
+    return {
+        'title': f"{words[0].title()} {words[1]} {rng.randrange(10 ** 9)}",
+        'description': f"Load-test recipe with {words[0]} and {words[1]}",
+        'instructions': "Stir the pot and simmer gently. " * 10,
+        'cooking_time': rng.randint(5, 180),
+        'servings': rng.randint(1, 8),
+        'category_id': rng.choice(category_ids),
+        'ingredients_data': ingredients,
+    }
+
+def seed_user(number, recipes_per_user, ingredients_per_recipe):
+    """Create one load-test user with its recipes, unless the user already exists."""
+    repo = get_repository()
+    username = f"{LOAD_USER_PREFIX}{number}"
+    if not repo.create_user(username, hash_password(LOAD_PASSWORD)):
+        return 0
+    user_id = repo.get_user(username)['id']
+    rng = random.Random(number)
+    category_ids = [category['id'] for category in repo.get_categories()]
+    for _ in range(recipes_per_user):
+        repo.add_recipe(user_id=user_id, **random_recipe(rng, category_ids, ingredients_per_recipe))
+    return recipes_per_user
+
+def seed(users, recipes_per_user, ingredients_per_recipe, workers):
+    """Seed every load-test user in parallel; returns [(user_id, username)]."""
+    repo = get_repository()
+    repo.init_db()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        created = sum(pool.map(
+            lambda number: seed_user(number, recipes_per_user, ingredients_per_recipe), range(1, users + 1)
+        ))
+    if created:
+        print(f"Seeded {created} recipes in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return [
+        (repo.get_user(f"{LOAD_USER_PREFIX}{number}")['id'], f"{LOAD_USER_PREFIX}{number}")
+        for number in range(1, users + 1)
+    ]
+
+def op_login(repo, user, rng, args):
+    if verify_credentials(user[1], LOAD_PASSWORD) is None:
+        raise RuntimeError(f"login failed for {user[1]}")
+
+def op_list(repo, user, rng, args):
+    if args.cold:
+        invalidate_user_recipes(user[0])
+    recipes, _ = repo.load_recipe_pages(user[0], None, 1, args.page_size)
+    # The View Recipes scale/metric mode, which converts every quantity through UnitConverter
+    scale_recipes(recipes, rng.randint(1, 8), metric=True)
+
+def op_search(repo, user, rng, args):
+    if args.cold:
+        invalidate_user_recipes(user[0])
+    repo.search_recipes(user[0], rng.choice(WORDS), limit=args.page_size)
+
+def op_add(repo, user, rng, args):
+    category_ids = [category['id'] for category in repo.get_categories()]
+    repo.add_recipe(user_id=user[0], **random_recipe(rng, category_ids, args.ingredients_per_recipe))
+
+OPERATIONS = {'login': op_login, 'list': op_list, 'search': op_search, 'add': op_add}
+
+def run_worker(args, worker, users):
+    """Run weighted random operations for args.duration seconds; returns (op, ms, ok) samples."""
+    repo = get_repository()
+    rng = random.Random(args.seed * 1000 + worker)
+    names, weights = zip(*args.mix.items())
+    samples = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            OPERATIONS[name](repo, rng.choice(users), rng, args)
+            ok = True
+        except Exception:
+            ok = False
+        samples.append((name, (time.perf_counter() - start) * 1000, ok))
+    return samples
+
+def run_app_session(args, session, users):
+    """Drive main.py headlessly as one logged-in user; returns (op, ms, ok) samples per rerun."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(args.seed * 1000 + session)
+    user_id, username = rng.choice(users)
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=args.app_timeout)
+    at.session_state['authenticated'] = True
+    at.session_state['user_id'] = user_id
+    at.session_state['username'] = username
+
+    samples = []
+    def timed(name, action):
+        start = time.perf_counter()
+        try:
+            action()
+            ok = not at.exception and not at.error
+        except Exception:
+            ok = False
+        samples.append((name, (time.perf_counter() - start) * 1000, ok))
+
+    timed('app:first_run', at.run)
+    for _ in range(args.app_reruns):
+        page = rng.choice(APP_PAGES)
+        timed(f'app:{page}', lambda: at.sidebar.radio[0].set_value(page).run())
+        if page == "View Recipes":
+            timed('app:search', lambda: at.text_input[0].set_value(rng.choice(WORDS)).run())
+    return samples
+
+def summarize(samples, seconds):
+    """Latency percentiles and throughput per operation, and over all operations."""
+    by_op = {}
+    for name, ms, ok in samples:
+        by_op.setdefault(name, ([], []))[0 if ok else 1].append(ms)
+    by_op['all'] = (
+        [ms for _, ms, ok in samples if ok], [ms for _, ms, ok in samples if not ok]
+    )
+
+    results = {}
+    for name, (latencies, failures) in by_op.items():
+        stats = {'count': len(latencies), 'errors': len(failures), 'throughput_per_s': len(latencies) / seconds}
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats.update(mean_ms=float(np.mean(latencies)), p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99))
+        results[name] = stats
+    return results
+
+def find_regressions(results, baseline, tolerance):
+    """Operations whose p95 latency grew, or throughput fell, by more than `tolerance`."""
+    regressions = []
+    for section in ('operations', 'app'):
+        for name, stats in results.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not before or 'p95_ms' not in stats or 'p95_ms' not in before:
+                continue
+            if stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{section}/{name}: p95 {before['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+            if section == 'operations' and stats['throughput_per_s'] < before['throughput_per_s'] * (1 - tolerance):
+                regressions.append(
+                    f"{section}/{name}: throughput {before['throughput_per_s']:.1f} -> "
+                    f"{stats['throughput_per_s']:.1f}/s"
+                )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20, help="synthetic users to seed and act as")
+    parser.add_argument('--recipes-per-user', type=int, default=100)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+    parser.add_argument('--seed-workers', type=int, default=4)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--workers', type=int, default=8, help="concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=10, help="seconds each worker runs")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--cold', action='store_true', help="evict the user's cached queries before each read")
+    parser.add_argument('--app-sessions', type=int, default=0, help="headless streamlit.testing sessions to run")
+    parser.add_argument('--app-reruns', type=int, default=10, help="page changes per app session")
+    parser.add_argument('--app-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--baseline', help="earlier --json output to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed regression against the baseline")
+    args = parser.parse_args()
+
+    users = seed(args.users, args.recipes_per_user, args.ingredients_per_recipe, args.seed_workers)
+
+    # Spawned processes each open their own pool instead of inheriting the parent's connections
+    if args.executor == 'process':
+        executor = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        executor = ThreadPoolExecutor(args.workers)
+    start = time.perf_counter()
+    with executor:
+        worker_samples = list(executor.map(run_worker, [args] * args.workers, range(args.workers), [users] * args.workers))
+    elapsed = time.perf_counter() - start
+
+    results = {
+        'config': {
+            'backend': get_repository().name,
+            'executor': args.executor,
+            'workers': args.workers,
+            'duration_s': args.duration,
+            'users': args.users,
+            'recipes_per_user': args.recipes_per_user,
+            'mix': args.mix,
+            'cold': args.cold,
+        },
+        'operations': summarize([sample for samples in worker_samples for sample in samples], elapsed),
+    }
+
+    if args.app_sessions:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.app_sessions) as pool:
+            app_samples = list(pool.map(
+                run_app_session, [args] * args.app_sessions, range(args.app_sessions), [users] * args.app_sessions
+            ))
+        results['app'] = summarize(
+            [sample for samples in app_samples for sample in samples], time.perf_counter() - start
+        )
+
+    for section in ('operations', 'app'):
+        for name, stats in results.get(section, {}).items():
+            if 'p50_ms' in stats:
+                print(f"{section}/{name}: {stats['count']} ok, {stats['errors']} errors, "
+                      f"{stats['throughput_per_s']:.1f}/s, p50 {stats['p50_ms']:.2f} ms, "
+                      f"p95 {stats['p95_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms", file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
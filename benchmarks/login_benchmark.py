@@ -0,0 +1,110 @@
+"""Login throughput and latency under concurrency, against session-token checks.
+
+A login (auth.verify_credentials) looks the user up and checks an scrypt hash
+on the bounded password-hash pool, so its throughput levels off at
+PASSWORD_HASH_WORKERS (or the CPU count) while latency grows with the queue.
+Restoring a session (auth.validate_session_token) is an HMAC check with no
+database query. Seeds --users synthetic users on first run, using whichever
+backend DB_BACKEND selects:
+
+    python -m benchmarks.login_benchmark --concurrency 1,2,4,8,16 --duration 5
+    PASSWORD_HASH_WORKERS=2 DB_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db python -m benchmarks.login_benchmark --json login.json
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from auth import (
+    PASSWORD_HASH_WORKERS, SCRYPT_N, SCRYPT_P, SCRYPT_R,
+    create_session_token, hash_password, validate_session_token, verify_credentials
+)
+from repository import get_repository
+
+LOGIN_USER_PREFIX = 'bench_login_user_'
+LOGIN_PASSWORD = 'login-benchmark-password'
+
+def seed(users):
+    """Create the benchmark users (one hash each) unless they exist; returns [(user_id, username)]."""
+    repo = get_repository()
+    repo.init_db()
+    seeded = []
+    for number in range(1, users + 1):
+        username = f"{LOGIN_USER_PREFIX}{number}"
+        user = repo.get_user(username)
+        if user is None:
+            repo.create_user(username, hash_password(LOGIN_PASSWORD))
+            user = repo.get_user(username)
+        seeded.append((user['id'], username))
+    return seeded
+
+def run_threads(operation, threads, duration):
+    """Call operation(thread) in a loop on each thread for `duration` seconds; returns ms per call."""
+    def worker(thread):
+        latencies = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            operation(thread)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = [ms for thread_latencies in pool.map(worker, range(threads)) for ms in thread_latencies]
+    return latencies, time.perf_counter() - start
+
+def summarize(latencies, seconds):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'count': len(latencies),
+        'throughput_per_s': len(latencies) / seconds,
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=16, help="synthetic users to seed and log in as")
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help="comma-separated thread counts")
+    parser.add_argument('--duration', type=float, default=5, help="seconds per concurrency level")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    users = seed(args.users)
+    tokens = [create_session_token(user_id, username) for user_id, username in users]
+
+    def login(thread):
+        if verify_credentials(users[thread % len(users)][1], LOGIN_PASSWORD) is None:
+            raise RuntimeError("login failed")
+
+    def restore(thread):
+        if validate_session_token(tokens[thread % len(tokens)]) is None:
+            raise RuntimeError("session token rejected")
+
+    results = {
+        'config': {
+            'backend': get_repository().name,
+            'scrypt': {'n': SCRYPT_N, 'r': SCRYPT_R, 'p': SCRYPT_P},
+            'hash_workers': PASSWORD_HASH_WORKERS,
+            'duration_s': args.duration,
+        },
+        'login': {},
+        'session_token': {},
+    }
+    for threads in [int(level) for level in args.concurrency.split(',')]:
+        for name, operation in (('login', login), ('session_token', restore)):
+            stats = summarize(*run_threads(operation, threads, args.duration))
+            results[name][threads] = stats
+            print(f"{name} x{threads}: {stats['throughput_per_s']:.1f}/s, p50 {stats['p50_ms']:.3f} ms, "
+                  f"p95 {stats['p95_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms", file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Ingredient-line parsing and scaling throughput (lines/sec) for utils.py.
+
+Runs without a database:
+
+    python -m benchmarks.parser_benchmark --lines 200000 --distinct 2000
+"""
+import argparse
+import json
+import random
+import time
+from utils import iter_scaled_ingredients, parse_ingredient_line
+
+QUANTITIES = ['1', '2', '12', '1.5', '.25', '1/2', '3/4', '1 1/2', '2 1/4', '½', '1½', '2 ¾', '']
+UNITS = ['cups', 'cup', 'tbsp', 'Tbsp.', 'tsp', 'g', 'kg', 'ml', 'l', 'oz', 'fl oz', 'lb',
+         'cloves', 'pinch', 'large', '']
+NAMES = ['flour', 'sugar', 'brown sugar', 'butter', 'eggs', 'whole milk', 'olive oil', 'salt',
+         'garlic', 'onion, finely chopped', 'baking powder', 'vanilla extract', 'canned tomatoes']
+
+def make_lines(count, distinct, rng):
+    """`count` ingredient lines drawn from `distinct` unique ones."""
+    vocabulary = [
+        ' '.join(part for part in (rng.choice(QUANTITIES), rng.choice(UNITS), rng.choice(NAMES)) if part)
+        for _ in range(distinct)
+    ]
+    return [rng.choice(vocabulary) for _ in range(count)]
+
+def measure(func, lines):
+    start = time.perf_counter()
+    func(lines)
+    seconds = time.perf_counter() - start
+    return {'lines': len(lines), 'seconds': seconds, 'lines_per_sec': len(lines) / seconds}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=200_000)
+    parser.add_argument('--distinct', type=int, default=2000, help="unique lines in the sample")
+    parser.add_argument('--scale', type=float, default=2.0)
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines, args.distinct, random.Random(0))
+    results = {
+        'parse_uncached': measure(lambda ls: [parse_ingredient_line(l, use_cache=False) for l in ls], lines),
+        'parse_cached': measure(lambda ls: [parse_ingredient_line(l) for l in ls], lines),
+        'scale_streaming': measure(lambda ls: sum(1 for _ in iter_scaled_ingredients(ls, args.scale)), lines),
+    }
+
+    for name, stats in results.items():
+        print(f"{name}: {stats['lines_per_sec']:,.0f} lines/s ({stats['lines']} lines in {stats['seconds']:.2f}s)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
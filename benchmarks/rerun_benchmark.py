@@ -0,0 +1,78 @@
+"""Startup and idle-rerun cost of main.py, driven headlessly with streamlit.testing.
+
+The first run in a fresh process pays for imports and the one-time setup in
+start_app(); every later run of an unchanged page is an idle rerun, which
+should cost little more than re-emitting the page. Uses whichever backend
+DB_BACKEND selects, logging in as --username (created, without recipes, if
+missing):
+
+    python -m benchmarks.rerun_benchmark --reruns 50
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db python -m benchmarks.rerun_benchmark --username bench_backend_user
+"""
+import argparse
+import json
+import os
+import time
+
+PAGES = ["View Recipes", "What Can I Cook", "Add New Recipe", "Shopping List", "Unit Converter"]
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--username', default='bench_rerun_user')
+    parser.add_argument('--reruns', type=int, default=30, help="idle reruns timed per page")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds allowed per run")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Nothing from the app is imported before the first run, so it measures a cold start
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=args.timeout)
+    start = time.perf_counter()
+    at.run()
+    first_run_ms = (time.perf_counter() - start) * 1000
+
+    from auth import hash_password
+    from benchmarks.index_benchmark import time_calls
+    from instrumentation import app_timings
+    from repository import get_repository
+
+    def idle_reruns():
+        """Wall-clock stats of idle reruns, plus the mean time main.py itself measured."""
+        count, total = app_timings.reruns.count, app_timings.reruns.sum
+        stats = time_calls(at.run, [()] * args.reruns)
+        stats['script_mean_ms'] = (app_timings.reruns.sum - total) / (app_timings.reruns.count - count) * 1000
+        return stats
+
+    repo = get_repository()
+    repo.create_user(args.username, hash_password(os.urandom(16).hex()))
+    results = {
+        'backend': repo.name,
+        'first_run_ms': first_run_ms,
+        'startup_ms': {step: seconds * 1000 for step, seconds in app_timings.startup.items()},
+        'idle_rerun': {'Login': idle_reruns()},
+    }
+
+    at.session_state['authenticated'] = True
+    at.session_state['user_id'] = repo.get_user(args.username)['id']
+    at.session_state['username'] = args.username
+    at.run()
+    for page in PAGES:
+        at.sidebar.radio[0].set_value(page).run()
+        results['idle_rerun'][page] = idle_reruns()
+    if at.exception or at.error:
+        parser.error(f"the app failed: {[e.value for e in at.exception] + [e.value for e in at.error]}")
+
+    print(f"{repo.name} first run: {first_run_ms:.1f} ms ("
+          + ", ".join(f"{step} {ms:.1f} ms" for step, ms in results['startup_ms'].items()) + ")")
+    for page, stats in results['idle_rerun'].items():
+        print(f"{repo.name} idle rerun of {page}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+              f"p95 {stats['p95_ms']:.2f} ms over {stats['calls']} reruns, "
+              f"{stats['script_mean_ms']:.2f} ms of it in main.py")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
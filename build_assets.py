@@ -0,0 +1,59 @@
+"""Write static/asset-manifest.json: a content hash for every PWA asset.
+
+The service worker names its cache after the manifest's version and
+precaches the hashed URLs, so a build with any changed asset replaces the
+old cache; pwa.py serves hashed URLs as immutable. Run it whenever static/
+changes, as part of the deploy:
+
+    python build_assets.py
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+MANIFEST_NAME = 'asset-manifest.json'
+# Served without a hash and revalidated on every load, so browsers notice new builds
+UNVERSIONED = ('service-worker.js', MANIFEST_NAME)
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def build_manifest(static_dir=STATIC_DIR):
+    """{'version': ..., 'assets': {name: 'name?v=<hash>'}} for the files in static_dir.
+
+    The version also covers the service worker, so changing it alone starts a new cache.
+    """
+    hashes = {
+        name: file_hash(os.path.join(static_dir, name))
+        for name in sorted(os.listdir(static_dir))
+        if name != MANIFEST_NAME and os.path.isfile(os.path.join(static_dir, name))
+    }
+    version = hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()[:12]
+    return {
+        'version': version,
+        'assets': {name: f"{name}?v={digest}" for name, digest in hashes.items() if name not in UNVERSIONED},
+    }
+
+def load_manifest(static_dir=STATIC_DIR):
+    """The built manifest, or one computed now (with a warning) if the build step was skipped."""
+    try:
+        with open(os.path.join(static_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning("%s is missing; run `python build_assets.py` before deploying", MANIFEST_NAME)
+        return build_manifest(static_dir)
+
+def main():
+    manifest = build_manifest()
+    with open(os.path.join(STATIC_DIR, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    print(f"Wrote {MANIFEST_NAME} version {manifest['version']} with {len(manifest['assets'])} assets")
+
+if __name__ == "__main__":
+    main()
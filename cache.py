@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=128, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on invalidation so a load that raced with it is not stored
+        self._generation = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() to fill it on a miss."""
+        now = time.monotonic()
+        hit, value, generation = self._lookup(key, now)
+        if hit:
+            return value
+        # Load outside the lock so a slow query does not block other keys
+        return self._store(key, loader(), generation, now)
+
+    async def get_or_load_async(self, key, loader):
+        """Like get_or_load(), for a loader that returns an awaitable."""
+        now = time.monotonic()
+        hit, value, generation = self._lookup(key, now)
+        if hit:
+            return value
+        return self._store(key, await loader(), generation, now)
+
+    def _lookup(self, key, now):
+        """(True, value, None) on a hit, else (False, None, current generation)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return True, entry[0], None
+            self._stats['misses'] += 1
+            return False, None, self._generation
+
+    def _store(self, key, value, generation, now):
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or every entry when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def invalidate_prefix(self, prefix):
+        """Drop every tuple key that starts with the given tuple prefix."""
+        with self._lock:
+            for key in [key for key in self._entries if key[:len(prefix)] == prefix]:
+                del self._entries[key]
+            self._generation += 1
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """Hit/miss counters plus the current size."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
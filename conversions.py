@@ -1,58 +1,183 @@
+from functools import lru_cache
+import numpy as np
+
 class UnitConverter:
-    # Conversion ratios for common recipe measurements
-    CONVERSIONS = {
-        # Volume conversions
-        'ml_to_cups': 0.00422675,
-        'ml_to_tbsp': 0.067628,
-        'ml_to_tsp': 0.202884,
-        'cups_to_ml': 236.588,
-        'tbsp_to_ml': 14.7868,
-        'tsp_to_ml': 4.92892,
-        
-        # Weight conversions
-        'g_to_oz': 0.035274,
-        'g_to_lb': 0.00220462,
-        'oz_to_g': 28.3495,
-        'lb_to_g': 453.592,
-        
-        # Temperature conversions
-        'c_to_f': lambda c: (c * 9/5) + 32,
-        'f_to_c': lambda f: (f - 32) * 5/9
+    DIMENSIONS = ('Volume', 'Weight', 'Temperature')
+    BASE_UNITS = {'Volume': 'ml', 'Weight': 'g', 'Temperature': 'C'}
+
+    # Every unit is defined against its dimension's base unit (ml, g, C):
+    # base_value = value * scale + offset
+    UNITS = {
+        # Volume (base: ml)
+        'ml': ('Volume', 1.0, 0.0),
+        'l': ('Volume', 1000.0, 0.0),
+        'tsp': ('Volume', 4.92892, 0.0),
+        'tbsp': ('Volume', 14.7868, 0.0),
+        'fl oz': ('Volume', 29.5735, 0.0),
+        'cups': ('Volume', 236.588, 0.0),
+        'pints': ('Volume', 473.176, 0.0),
+        'quarts': ('Volume', 946.353, 0.0),
+        'gallons': ('Volume', 3785.41, 0.0),
+
+        # Weight (base: g)
+        'mg': ('Weight', 0.001, 0.0),
+        'g': ('Weight', 1.0, 0.0),
+        'kg': ('Weight', 1000.0, 0.0),
+        'oz': ('Weight', 28.3495, 0.0),
+        'lb': ('Weight', 453.592, 0.0),
+
+        # Temperature (base: C), affine rather than purely proportional
+        'C': ('Temperature', 1.0, 0.0),
+        'F': ('Temperature', 5 / 9, -32 * 5 / 9),
+        'K': ('Temperature', 1.0, -273.15),
     }
-    
+
+    # Temperature symbols, matched case-sensitively: a lowercase 'c' is a cup, not Celsius
+    SYMBOLS = {'C': 'C', 'F': 'F', 'K': 'K'}
+
+    # Alternative spellings, matched case-insensitively after trimming a trailing '.'
+    # and, failing that, a plural 's'
+    ALIASES = {
+        'milliliter': 'ml', 'millilitre': 'ml', 'mls': 'ml',
+        'liter': 'l', 'litre': 'l',
+        'teaspoon': 'tsp', 'tsps': 'tsp',
+        'tablespoon': 'tbsp', 'tbsps': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp',
+        'fluid ounce': 'fl oz', 'fl. oz': 'fl oz', 'floz': 'fl oz',
+        'cup': 'cups', 'c': 'cups',
+        'pint': 'pints', 'pt': 'pints',
+        'quart': 'quarts', 'qt': 'quarts',
+        'gallon': 'gallons', 'gal': 'gallons',
+        'milligram': 'mg',
+        'gram': 'g', 'gr': 'g', 'grams': 'g',
+        'kilogram': 'kg', 'kilo': 'kg', 'kgs': 'kg',
+        'ounce': 'oz',
+        'pound': 'lb', 'lbs': 'lb',
+        'celsius': 'C', '°c': 'C',
+        'fahrenheit': 'F', '°f': 'F',
+        'kelvin': 'K',
+    }
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _lookup(cls):
+        lookup = {name.lower(): name for name in cls.UNITS if name not in cls.SYMBOLS}
+        lookup.update(cls.ALIASES)
+        return lookup
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def canonical_unit(cls, unit):
+        """Canonical name for a unit or one of its aliases/plurals, or None if unknown."""
+        if not isinstance(unit, str):
+            return None
+        symbol = unit.strip().rstrip('.')
+        if symbol in cls.SYMBOLS:
+            return cls.SYMBOLS[symbol]
+        lookup = cls._lookup()
+        key = symbol.lower()
+        if key in lookup:
+            return lookup[key]
+        if key.endswith('s') and key[:-1] in lookup:
+            return lookup[key[:-1]]
+        return None
+
+    @classmethod
+    def dimension(cls, unit):
+        """Dimension name ('Volume', 'Weight', 'Temperature') of a unit, or None if unknown."""
+        canonical = cls.canonical_unit(unit)
+        return cls.UNITS[canonical][0] if canonical else None
+
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _factors(cls, from_unit, to_unit):
+        """(multiplier, addend) such that converted = value * multiplier + addend."""
+        source = cls.canonical_unit(from_unit)
+        target = cls.canonical_unit(to_unit)
+        if source is None or target is None or cls.UNITS[source][0] != cls.UNITS[target][0]:
+            raise ValueError(f"No conversion found for {from_unit} to {to_unit}")
+        _, source_scale, source_offset = cls.UNITS[source]
+        _, target_scale, target_offset = cls.UNITS[target]
+        return source_scale / target_scale, (source_offset - target_offset) / target_scale
+
     @classmethod
     def convert(cls, value, from_unit, to_unit):
         """Convert between units"""
         if from_unit == to_unit:
             return value
-            
-        # Handle temperature conversions
-        if from_unit.lower() == 'c' and to_unit.lower() == 'f':
-            return cls.CONVERSIONS['c_to_f'](value)
-        elif from_unit.lower() == 'f' and to_unit.lower() == 'c':
-            return cls.CONVERSIONS['f_to_c'](value)
-            
-        # Handle other conversions
-        conversion_key = f'{from_unit.lower()}_to_{to_unit.lower()}'
-        if conversion_key in cls.CONVERSIONS:
-            return value * cls.CONVERSIONS[conversion_key]
-        
-        # If direct conversion not found, try reverse
-        reverse_key = f'{to_unit.lower()}_to_{from_unit.lower()}'
-        if reverse_key in cls.CONVERSIONS:
-            return value / cls.CONVERSIONS[reverse_key]
-            
-        raise ValueError(f"No conversion found for {from_unit} to {to_unit}")
+        multiplier, addend = cls._factors(from_unit, to_unit)
+        return value * multiplier + addend
+
+    @classmethod
+    def _resolve(cls, unit):
+        """(dimension code, scale, offset) for a unit; unknown units get code -1."""
+        canonical = cls.canonical_unit(unit)
+        if canonical is None:
+            return -1, 1.0, 0.0
+        dimension, scale, offset = cls.UNITS[canonical]
+        return cls.DIMENSIONS.index(dimension), scale, offset
+
+    @classmethod
+    def _unit_table(cls, units, size):
+        """Per-element (dimension code, scale, offset) arrays for a unit or sequence of units.
+
+        Each distinct unit string is resolved once and then gathered by index.
+        """
+        if units is None or isinstance(units, str):
+            code, scale, offset = cls._resolve(units)
+            return np.full(size, code), np.full(size, scale), np.full(size, offset)
+        if not size:
+            return np.empty(0, dtype=int), np.empty(0), np.empty(0)
+        index = {}
+        inverse = np.fromiter(
+            (index.setdefault(unit, len(index)) for unit in units), dtype=np.intp, count=size
+        )
+        codes, scales, offsets = (np.array(column) for column in zip(*map(cls._resolve, index)))
+        return codes[inverse], scales[inverse], offsets[inverse]
+
+    @classmethod
+    def convert_many(cls, values, from_units, to_units, strict=True):
+        """Vectorized convert() over arrays.
+
+        `from_units` and `to_units` may each be one unit or a sequence matching
+        `values`. Incompatible or unknown pairs raise ValueError, or become NaN
+        when strict is False.
+        """
+        values = np.asarray(values, dtype=float)
+        flat = values.reshape(-1)
+        from_codes, from_scales, from_offsets = cls._unit_table(from_units, flat.size)
+        to_codes, to_scales, to_offsets = cls._unit_table(to_units, flat.size)
+
+        invalid = (from_codes < 0) | (from_codes != to_codes)
+        if strict and invalid.any():
+            index = int(np.argmax(invalid))
+            from_unit = from_units if isinstance(from_units, str) else from_units[index]
+            to_unit = to_units if isinstance(to_units, str) else to_units[index]
+            raise ValueError(f"No conversion found for {from_unit} to {to_unit}")
+
+        result = ((flat * from_scales + from_offsets) - to_offsets) / to_scales
+        result[invalid] = np.nan
+        return result.reshape(values.shape)
+
+    @classmethod
+    def to_base_many(cls, values, units):
+        """Convert values to their dimension's base unit (ml, g, C).
+
+        Returns (base_values, base_units); unknown units keep their value and unit.
+        """
+        values = np.asarray(values, dtype=float).reshape(-1)
+        codes, scales, offsets = cls._unit_table(units, values.size)
+        units = np.broadcast_to(np.asarray(units, dtype=object), values.shape)
+        # Unknown units have code -1, which indexes the trailing None
+        base_names = np.array([cls.BASE_UNITS[d] for d in cls.DIMENSIONS] + [None], dtype=object)
+        known = codes >= 0
+        base_values = np.where(known, values * scales + offsets, values)
+        base_units = np.where(known, base_names[codes], units)
+        return base_values, base_units
 
     @classmethod
     def get_supported_units(cls):
         """Get lists of supported units"""
-        volume_units = ['ml', 'cups', 'tbsp', 'tsp']
-        weight_units = ['g', 'oz', 'lb']
-        temp_units = ['C', 'F']
-        
-        return {
-            'Volume': volume_units,
-            'Weight': weight_units,
-            'Temperature': temp_units
-        }
+        supported = {}
+        for unit, (dimension, _, _) in cls.UNITS.items():
+            supported.setdefault(dimension, []).append(unit)
+        return supported
@@ -1,53 +1,424 @@
+import atexit
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions, pool
+from psycopg2.extras import RealDictCursor, execute_values
+from cache import TTLCache
+from conversions import UnitConverter
+from instrumentation import InstrumentedConnection, instrument, record_acquire, stats_sources
+from utils import METRIC_UPGRADES
 
-def get_db_connection():
-    """Create a database connection using environment variables."""
-    conn = psycopg2.connect(
-        host=os.getenv('PGHOST'),
-        database=os.getenv('PGDATABASE'),
-        user=os.getenv('PGUSER'),
-        password=os.getenv('PGPASSWORD'),
-        port=os.getenv('PGPORT')
-    )
-    return conn
+# Pool sizing and health checks, overridable through the environment
+POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+POOL_HEALTHCHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', '30'))
 
-def init_db():
-    """Initialize the database with the schema."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+# Set DB_AUTO_MIGRATE=0 to leave migrations to `python migrate.py`
+AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', '1') != '0'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_ID = 72_410_001
+
+REFERENCE_CACHE_TTL = float(os.getenv('REFERENCE_CACHE_TTL', '300'))
+REFERENCE_CACHE_SIZE = int(os.getenv('REFERENCE_CACHE_SIZE', '64'))
+RECIPE_CACHE_TTL = float(os.getenv('RECIPE_CACHE_TTL', '600'))
+RECIPE_CACHE_SIZE = int(os.getenv('RECIPE_CACHE_SIZE', '2048'))
+
+# Write paths publish cache-invalidation events on this channel (see notifications.py)
+CACHE_CHANNEL = 'cache_invalidation'
+
+def get_connection_params():
+    """Connection parameters taken from the standard PG* environment variables."""
+    return {
+        'host': os.getenv('PGHOST'),
+        'database': os.getenv('PGDATABASE'),
+        'user': os.getenv('PGUSER'),
+        'password': os.getenv('PGPASSWORD'),
+        'port': os.getenv('PGPORT'),
+    }
+
+class ConnectionPool:
+    """Thread-safe connection pool that blocks when saturated and records usage counters."""
+
+    def __init__(self, minconn, maxconn, timeout=POOL_TIMEOUT,
+                 healthcheck_interval=POOL_HEALTHCHECK_INTERVAL, **conn_params):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **conn_params)
+        # ThreadedConnectionPool raises as soon as it is exhausted; the semaphore
+        # makes callers queue for a free slot instead.
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'timeouts': 0,
+            'healthcheck_failures': 0,
+            'in_use': 0,
+            'max_in_use': 0,
+        }
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to `timeout` seconds for a free slot."""
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise pool.PoolError(
+                    f"Timed out after {self.timeout}s waiting for a database connection"
+                )
+        waited = time.perf_counter() - start
+
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                with self._lock:
+                    self._stats['healthcheck_failures'] += 1
+                self._discard(conn)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            self._stats['in_use'] += 1
+            self._stats['max_in_use'] = max(self._stats['max_in_use'], self._stats['in_use'])
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool, discarding it if it is broken."""
+        try:
+            close = bool(conn.closed)
+            if not close and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            if close:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def _is_healthy(self, conn):
+        """Ping connections that have been idle longer than the health-check interval."""
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def stats(self):
+        """Snapshot of the pool counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_size'] = self.maxconn
+        stats['saturation'] = stats['in_use'] / self.maxconn
+        return stats
+
+    def closeall(self):
+        self._pool.closeall()
+        self._last_used.clear()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    POOL_MIN_SIZE, POOL_MAX_SIZE, connection_factory=InstrumentedConnection,
+                    **get_connection_params()
+                )
+    return _pool
+
+def close_pool():
+    """Close every pooled connection."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+atexit.register(close_pool)
+
+def get_pool_stats():
+    """Pool wait-time and saturation counters, or None if the pool has not been created yet."""
+    return _pool.stats() if _pool is not None else None
+
+# Served by the metrics endpoint; 'waits' counts checkouts that found every connection in use
+stats_sources.register('pool', get_pool_stats, {
+    'checkouts': ('recipe_pool_checkouts_total', 'counter'),
+    'waits': ('recipe_pool_saturated_total', 'counter'),
+    'wait_seconds_total': ('recipe_pool_wait_seconds_total', 'counter'),
+    'wait_seconds_max': ('recipe_pool_wait_seconds_max', 'gauge'),
+    'timeouts': ('recipe_pool_timeouts_total', 'counter'),
+    'healthcheck_failures': ('recipe_pool_healthcheck_failures_total', 'counter'),
+    'in_use': ('recipe_pool_in_use', 'gauge'),
+    'max_in_use': ('recipe_pool_max_in_use', 'gauge'),
+    'max_size': ('recipe_pool_max_size', 'gauge'),
+    'saturation': ('recipe_pool_saturation', 'gauge'),
+})
+
+@contextmanager
+def get_db_connection():
+    """Borrow a pooled connection; commits on success and rolls back on error."""
+    start = time.perf_counter()
+    db_pool = get_pool()
+    conn = db_pool.getconn()
+    record_acquire(time.perf_counter() - start)
     try:
-        # Read and execute the schema file
-        with open('schema.sql', 'r') as f:
-            cur.execute(f.read())
-        
+        yield conn
         conn.commit()
-        print("Database schema successfully initialized")
-    except Exception as e:
-        conn.rollback()
-        raise Exception(f"Failed to initialize database: {str(e)}")
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
     finally:
-        cur.close()
-        conn.close()
+        db_pool.putconn(conn)
+
+def _load_migrations():
+    """List (version, name, path) for every migration file, ordered by version."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        if not filename.endswith('.sql'):
+            continue
+        version, _, name = filename[:-4].partition('_')
+        migrations.append((int(version), name, os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(migrations)
+
+@instrument()
+def get_migration_status():
+    """Return (applied, pending) migration versions."""
+    versions = [version for version, _, _ in _load_migrations()]
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_version')")
+        if cur.fetchone()[0] is None:
+            return [], versions
+        cur.execute("SELECT version FROM schema_version ORDER BY version")
+        applied = [row[0] for row in cur.fetchall()]
+    return applied, [version for version in versions if version not in applied]
+
+@instrument()
+def apply_migrations():
+    """Apply pending migrations in order and return the versions applied.
+
+    An advisory lock serializes replicas that start at the same time; each
+    migration commits together with its schema_version row.
+    """
+    applied = []
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(200) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+            
+            cur.execute("SELECT version FROM schema_version")
+            done = {row[0] for row in cur.fetchall()}
+            for version, name, path in _load_migrations():
+                if version in done:
+                    continue
+                with open(path, 'r') as f:
+                    cur.execute(f.read())
+                cur.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                conn.commit()
+                applied.append(version)
+            if applied:
+                notify_change(cur, 'all')
+                conn.commit()
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return applied
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def init_db():
+    """Bring the schema up to date once per process; later calls do no database work."""
+    global _schema_ready
+    if _schema_ready or not AUTO_MIGRATE:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            applied = apply_migrations()
+        except Exception as e:
+            raise Exception(f"Failed to initialize database: {str(e)}")
+        if applied:
+            invalidate_all_caches()
+            print(f"Applied database migrations: {', '.join(map(str, applied))}")
+        _schema_ready = True
+
+# Reference data (categories, ingredient names) changes rarely; writers invalidate explicitly
+reference_cache = TTLCache(maxsize=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_TTL)
+
+# Per-user recipe lists and details, keyed (user_id, kind, *args)
+recipe_cache = TTLCache(maxsize=RECIPE_CACHE_SIZE, ttl=RECIPE_CACHE_TTL)
 
+def invalidate_reference_data(key=None):
+    """Drop cached reference data, e.g. 'categories' or 'ingredient_names'; everything when key is None."""
+    reference_cache.invalidate(key)
+
+def invalidate_user_recipes(user_id):
+    """Drop every cached recipe query for a user, and the unscoped (all users) queries."""
+    recipe_cache.invalidate_prefix((user_id,))
+    recipe_cache.invalidate_prefix((None,))
+
+def invalidate_all_caches():
+    """Drop every cached entry in this process."""
+    reference_cache.invalidate()
+    recipe_cache.invalidate()
+
+def handle_invalidation(event):
+    """Apply a cache-invalidation event published by notify_change()."""
+    entity = event.get('entity')
+    if entity == 'recipes':
+        invalidate_user_recipes(event.get('user_id'))
+    elif entity in ('categories', 'ingredient_names'):
+        invalidate_reference_data(entity)
+    else:
+        invalidate_all_caches()
+
+def notify_change(cur, entity, user_id=None):
+    """Publish a cache-invalidation event; Postgres delivers it to listeners on commit."""
+    cur.execute(
+        "SELECT pg_notify(%s, %s)",
+        (CACHE_CHANNEL, json.dumps({'entity': entity, 'user_id': user_id}))
+    )
+
+def get_cache_stats():
+    """Hit and miss statistics for the reference-data and recipe caches."""
+    return {'reference': reference_cache.stats(), 'recipes': recipe_cache.stats()}
+
+stats_sources.register('caches', get_cache_stats, {
+    'hits': ('recipe_cache_hits_total', 'counter'),
+    'misses': ('recipe_cache_misses_total', 'counter'),
+    'evictions': ('recipe_cache_evictions_total', 'counter'),
+    'invalidations': ('recipe_cache_invalidations_total', 'counter'),
+    'size': ('recipe_cache_entries', 'gauge'),
+    'hit_ratio': ('recipe_cache_hit_ratio', 'gauge'),
+}, label='cache')
+
+@instrument()
+def create_user(username, password_hash):
+    """Insert a user; returns False when the username is already taken."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (username, password_hash) VALUES (%s, %s)
+            ON CONFLICT (username) DO NOTHING
+            RETURNING id
+        """, (username, password_hash))
+        return cur.fetchone() is not None
+
+@instrument()
+def get_user(username):
+    """The user's id, username and password_hash, or None."""
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT id, username, password_hash FROM users WHERE username = %s", (username,))
+        return cur.fetchone()
+
+@instrument()
+def update_password_hash(user_id, password_hash):
+    """Replace a user's stored password hash, e.g. to upgrade it to the current scheme."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+
+CATEGORIES_QUERY = "SELECT * FROM categories ORDER BY name"
+
+def _load_categories():
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(CATEGORIES_QUERY)
+        return cur.fetchall()
+
+@instrument()
 def get_categories():
-    """Get all categories from the database."""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM categories ORDER BY name")
-    categories = cur.fetchall()
-    cur.close()
-    conn.close()
-    return categories
+    """Get all categories, served from the reference-data cache."""
+    return list(reference_cache.get_or_load('categories', _load_categories))
 
+def _load_ingredient_names():
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT name FROM ingredients ORDER BY name")
+        return [row[0] for row in cur.fetchall()]
+
+@instrument()
+def get_ingredient_names():
+    """Get every known ingredient name, served from the reference-data cache."""
+    return list(reference_cache.get_or_load('ingredient_names', _load_ingredient_names))
+
+def merge_ingredients(ingredients_data):
+    """Map each ingredient name to a single (quantity, unit).
+
+    A recipe can reference an ingredient only once, so repeated names are summed,
+    converting to the unit of the first occurrence when the units differ.
+    """
+    merged = {}
+    for ingredient in ingredients_data:
+        name = ingredient['name'].strip()
+        quantity, unit = ingredient['quantity'], ingredient['unit']
+        if name not in merged:
+            merged[name] = (quantity, unit)
+            continue
+        
+        total, total_unit = merged[name]
+        if (unit or '') != (total_unit or ''):
+            try:
+                quantity = UnitConverter.convert(float(quantity), unit, total_unit)
+            except (ValueError, AttributeError):
+                raise ValueError(
+                    f"Ingredient '{name}' is listed more than once with incompatible units "
+                    f"({total_unit} and {unit})"
+                )
+        merged[name] = (float(total) + float(quantity), total_unit)
+    return merged
+
+@instrument()
 def add_recipe(title, description, instructions, cooking_time, servings, category_id, ingredients_data, user_id):
     """Add a new recipe with ingredients."""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    try:
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
         # Insert recipe with user_id
         cur.execute("""
             INSERT INTO recipes (title, description, instructions, cooking_time, servings, category_id, user_id)
@@ -59,101 +430,514 @@ def add_recipe(title, description, instructions, cooking_time, servings, categor
             raise Exception("Failed to create recipe")
         recipe_id = result['id']
         
-        # Process ingredients
-        for ingredient in ingredients_data:
-            cur.execute("SELECT id FROM ingredients WHERE name = %s", (ingredient['name'],))
-            result = cur.fetchone()
-            
-            if result is None:
-                cur.execute("INSERT INTO ingredients (name) VALUES (%s) RETURNING id", 
-                          (ingredient['name'],))
-                result = cur.fetchone()
-                if not result:
-                    raise Exception("Failed to create ingredient")
-                ingredient_id = result['id']
-            else:
-                ingredient_id = result['id']
+        # Resolve every ingredient name in one upsert, then write the junction rows in one statement
+        ingredients = merge_ingredients(ingredients_data)
+        new_ingredients = False
+        if ingredients:
+            # xmax = 0 marks rows this statement inserted rather than updated
+            rows = execute_values(cur, """
+                INSERT INTO ingredients (name) VALUES %s
+                ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                RETURNING id, name, (xmax = 0) AS inserted
+            """, [(name,) for name in sorted(ingredients)], fetch=True)
+            ingredient_ids = {row['name']: row['id'] for row in rows}
+            new_ingredients = any(row['inserted'] for row in rows)
             
-            cur.execute("""
+            execute_values(cur, """
                 INSERT INTO recipe_ingredients (recipe_id, ingredient_id, quantity, unit)
-                VALUES (%s, %s, %s, %s)
-            """, (recipe_id, ingredient_id, ingredient['quantity'], ingredient['unit']))
+                VALUES %s
+            """, [
+                (recipe_id, ingredient_ids[name], quantity, unit)
+                for name, (quantity, unit) in ingredients.items()
+            ])
         
-        conn.commit()
-        return recipe_id
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
+        # Other replicas evict their caches when this commits
+        notify_change(cur, 'recipes', user_id)
+        if new_ingredients:
+            notify_change(cur, 'ingredient_names')
+    
+    # Only after commit, so no reader can re-cache the old data in between
+    invalidate_user_recipes(user_id)
+    if new_ingredients:
+        invalidate_reference_data('ingredient_names')
+    return recipe_id
+
+def like_pattern(text):
+    """Escape LIKE wildcards so user input is matched literally as a substring."""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
 
-def get_recipes(user_id=None):
-    """Get all recipes with their categories."""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+def recipes_query(user_id=None, search=None, category_id=None, after=None, limit=None):
+    """Build the (query, params) pair used by get_recipes()."""
+    query = """
+        SELECT r.id, r.title, r.description, r.cooking_time, r.servings,
+               r.category_id, c.name as category_name
+        FROM recipes r
+        LEFT JOIN categories c ON r.category_id = c.id
+        WHERE TRUE
+    """
+    params = []
     
     if user_id:
-        cur.execute("""
-            SELECT r.*, c.name as category_name
-            FROM recipes r
-            LEFT JOIN categories c ON r.category_id = c.id
-            WHERE r.user_id = %s
-            ORDER BY r.title
-        """, (user_id,))
-    else:
-        cur.execute("""
-            SELECT r.*, c.name as category_name
-            FROM recipes r
-            LEFT JOIN categories c ON r.category_id = c.id
-            ORDER BY r.title
-        """)
-    recipes = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    return recipes
+        query += " AND r.user_id = %s"
+        params.append(user_id)
+    if search:
+        query += " AND r.title ILIKE %s"
+        params.append(like_pattern(search))
+    if category_id:
+        query += " AND r.category_id = %s"
+        params.append(category_id)
+    if after:
+        query += " AND (r.title, r.id) > (%s, %s)"
+        params.extend(after)
+    query += " ORDER BY r.title, r.id"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
 
-def get_recipe_ingredients(recipe_id):
-    """Get ingredients for a specific recipe."""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+@instrument()
+def get_recipes(user_id=None, search=None, category_id=None, after=None, limit=None):
+    """Get recipe list rows, filtered and ordered by (title, id) in SQL.
+
+    `after` is the (title, id) of the last row already shown; rows after it are
+    returned (keyset pagination). Only the columns the list view needs are
+    selected, so the instructions text is not transferred.
+    """
+    query, params = recipes_query(user_id, search, category_id, after, limit)
     
-    cur.execute("""
-        SELECT i.name, ri.quantity, ri.unit
-        FROM recipe_ingredients ri
-        JOIN ingredients i ON ri.ingredient_id = i.id
-        WHERE ri.recipe_id = %s
-    """, (recipe_id,))
-    ingredients = cur.fetchall()
+    def load():
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
     
-    cur.close()
-    conn.close()
-    return ingredients
+    key = (user_id, 'list', search, category_id, tuple(after) if after else None, limit)
+    return list(recipe_cache.get_or_load(key, load))
 
-def get_recipe(recipe_id, user_id=None):
-    """Get a specific recipe with all its details."""
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+def search_query(user_id, query, limit=50, category_id=None):
+    """Build the (query, params) pair used by search_recipes()."""
+    sql = """
+        WITH q AS (
+            SELECT websearch_to_tsquery('english', %(query)s) AS tsq
+        ), fuzzy_recipes AS (
+            -- Filtered to this user here, so a common ingredient does not pull in every user's rows
+            SELECT ri.recipe_id
+            FROM ingredients i
+            JOIN recipe_ingredients ri ON ri.ingredient_id = i.id
+            JOIN recipes fr ON fr.id = ri.recipe_id
+            WHERE %(query)s <%% i.name
+              AND fr.user_id = %(user_id)s
+        )
+        SELECT r.id, r.title, r.description, r.cooking_time, r.servings,
+               r.category_id, c.name as category_name,
+               ts_rank_cd(r.search_vector, q.tsq) + word_similarity(%(query)s, r.title) AS rank
+        FROM recipes r
+        CROSS JOIN q
+        LEFT JOIN categories c ON r.category_id = c.id
+        WHERE r.user_id = %(user_id)s
+          AND (r.search_vector @@ q.tsq
+               OR %(query)s <%% r.title
+               OR r.id IN (SELECT recipe_id FROM fuzzy_recipes))
+    """
+    params = {'query': query, 'user_id': user_id, 'limit': limit}
     
-    query = """
-        SELECT r.*, c.name as category_name
+    if category_id:
+        sql += " AND r.category_id = %(category_id)s"
+        params['category_id'] = category_id
+    sql += " ORDER BY rank DESC, r.title, r.id LIMIT %(limit)s"
+    return sql, params
+
+@instrument()
+def search_recipes(user_id, query, limit=50, category_id=None):
+    """Ranked full-text search with trigram fallback for typos.
+
+    Matches title, description, instructions and ingredient names through the
+    indexed search_vector column, and also titles or ingredient names that are
+    trigram-similar to the query.
+    """
+    sql, params = search_query(user_id, query, limit, category_id)
+    
+    def load():
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+    
+    return list(recipe_cache.get_or_load((user_id, 'search', query, limit, category_id), load))
+
+RECIPE_INGREDIENTS_QUERY = """
+    SELECT ri.recipe_id, i.name, ri.quantity, ri.unit
+    FROM recipe_ingredients ri
+    JOIN ingredients i ON ri.ingredient_id = i.id
+    WHERE ri.recipe_id = ANY(%s)
+"""
+
+def group_ingredients(recipe_ids, rows):
+    """Group RECIPE_INGREDIENTS_QUERY rows by recipe id, with an entry for every id."""
+    grouped = {recipe_id: [] for recipe_id in recipe_ids}
+    for row in rows:
+        grouped[row.pop('recipe_id')].append(row)
+    return grouped
+
+def _fetch_ingredients_by_recipe(cur, recipe_ids):
+    """Load ingredients for many recipes in one query, grouped by recipe id."""
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if not recipe_ids:
+        return {}
+    cur.execute(RECIPE_INGREDIENTS_QUERY, (recipe_ids,))
+    return group_ingredients(recipe_ids, cur.fetchall())
+
+def _attach_ingredients(cur, recipes):
+    """Set recipe['ingredients'] on every recipe using a single batched query."""
+    grouped = _fetch_ingredients_by_recipe(cur, [recipe['id'] for recipe in recipes])
+    for recipe in recipes:
+        recipe['ingredients'] = grouped[recipe['id']]
+    return recipes
+
+@instrument()
+def get_recipe_ingredients(recipe_id):
+    """Get ingredients for a specific recipe."""
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        return _fetch_ingredients_by_recipe(cur, [recipe_id])[recipe_id]
+
+# Columns of a full recipe row on every backend; leaves out search_vector and ingredient_ids
+RECIPE_DETAIL_COLUMNS = (
+    "r.id, r.title, r.description, r.instructions, r.cooking_time, r.servings, "
+    "r.category_id, r.user_id, r.created_at, r.updated_at"
+)
+
+def recipe_details_query(user_id=None, recipe_ids=None):
+    """Build the (query, params) pair for full recipe rows used by get_recipes_with_ingredients()."""
+    query = f"""
+        SELECT {RECIPE_DETAIL_COLUMNS}, c.name as category_name
         FROM recipes r
         LEFT JOIN categories c ON r.category_id = c.id
-        WHERE r.id = %s
+        WHERE TRUE
     """
-    params = [recipe_id]
+    params = []
     
     if user_id:
         query += " AND r.user_id = %s"
         params.append(user_id)
+    if recipe_ids is not None:
+        query += " AND r.id = ANY(%s)"
+        params.append(list(recipe_ids))
+    query += " ORDER BY r.title"
+    return query, params
+
+@instrument()
+def get_recipes_with_ingredients(user_id=None, recipe_ids=None):
+    """Get recipes with their categories and ingredients in two set-based queries."""
+    query, params = recipe_details_query(user_id, recipe_ids)
+    
+    def load():
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            return _attach_ingredients(cur, cur.fetchall())
+    
+    key = (user_id, 'details', tuple(recipe_ids) if recipe_ids is not None else None)
+    return list(recipe_cache.get_or_load(key, load))
+
+def with_details(user_id, recipes):
+    """Full recipes with ingredients for the given list rows, keeping their order."""
+    details = {
+        recipe['id']: recipe
+        for recipe in get_recipes_with_ingredients(
+            user_id=user_id, recipe_ids=[recipe['id'] for recipe in recipes]
+        )
+    }
+    return [details[recipe['id']] for recipe in recipes]
+
+def load_recipe_pages(user_id, category_id, pages, page_size):
+    """Load the first `pages` keyset pages of a user's recipes with ingredients.
+
+    Returns (recipes, has_more). Every page comes from the recipe cache, so
+    reruns do not query the database until a write invalidates it.
+    """
+    recipes, after, has_more = [], None, False
+    for _ in range(pages):
+        page = get_recipes(user_id=user_id, category_id=category_id, after=after, limit=page_size + 1)
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        recipes.extend(with_details(user_id, page))
+        if not has_more:
+            break
+        after = (page[-1]['title'], page[-1]['id'])
+    return recipes, has_more
+
+def get_recipe(recipe_id, user_id=None):
+    """Get a specific recipe with all its details."""
+    recipes = get_recipes_with_ingredients(user_id=user_id, recipe_ids=[recipe_id])
+    return recipes[0] if recipes else None
+
+SNAPSHOT_VERSION_QUERY = """
+    SELECT count(*), COALESCE(max(id), 0), max(updated_at)::text
+    FROM recipes
+    WHERE user_id = %s
+"""
+
+# Offline copies of a user's recipes, or those changed after a cursor; two flat
+# queries grouped in Python are several times faster than aggregating per recipe
+SNAPSHOT_RECIPES_QUERY = """
+    SELECT r.id, r.title, r.description, r.instructions, r.cooking_time, r.servings,
+           c.name AS category_name, r.updated_at::text AS updated_at
+    FROM recipes r
+    LEFT JOIN categories c ON r.category_id = c.id
+    WHERE r.user_id = %s AND (%s::timestamp IS NULL OR r.updated_at > %s::timestamp)
+    ORDER BY r.id
+"""
+
+SNAPSHOT_INGREDIENTS_QUERY = """
+    SELECT ri.recipe_id, i.name, ri.quantity::float8, ri.unit
+    FROM recipes r
+    JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+    JOIN ingredients i ON i.id = ri.ingredient_id
+    WHERE r.user_id = %s AND (%s::timestamp IS NULL OR r.updated_at > %s::timestamp)
+"""
+
+def snapshot_version(count, max_id, cursor):
+    """Opaque version of a user's recipes, usable as an ETag; any add or edit changes it."""
+    return f"{count}-{max_id}-{cursor or ''}"
+
+def attach_snapshot_ingredients(recipes, rows):
+    """Set each recipe's 'ingredients' from (recipe_id, name, quantity, unit) tuples, sorted by name."""
+    grouped = {recipe['id']: [] for recipe in recipes}
+    for recipe_id, name, quantity, unit in rows:
+        grouped[recipe_id].append({'name': name, 'quantity': quantity, 'unit': unit})
+    for recipe in recipes:
+        recipe['ingredients'] = sorted(grouped[recipe['id']], key=lambda ingredient: ingredient['name'])
+    return recipes
+
+@instrument()
+def get_snapshot_version(user_id):
+    """The user's snapshot version and cursor (the latest updated_at), without loading recipes."""
+    def load():
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(SNAPSHOT_VERSION_QUERY, (user_id,))
+            count, max_id, cursor = cur.fetchone()
+        return {'version': snapshot_version(count, max_id, cursor), 'cursor': cursor}
+
+    return dict(recipe_cache.get_or_load((user_id, 'snapshot_version'), load))
+
+@instrument()
+def get_recipe_snapshot(user_id, since=None):
+    """A user's recipes with ingredients, for clients that keep an offline copy.
+
+    Returns 'version' and 'cursor' (see get_snapshot_version), 'ids' of every
+    current recipe, so a client can drop deleted ones, and 'recipes': all of
+    them, or with `since` (an earlier cursor) only those changed after it.
+    """
+    def load():
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(SNAPSHOT_VERSION_QUERY, (user_id,))
+                count, max_id, cursor = cur.fetchone()
+                cur.execute("SELECT id FROM recipes WHERE user_id = %s ORDER BY id", (user_id,))
+                ids = [row[0] for row in cur.fetchall()]
+                cur.execute(SNAPSHOT_INGREDIENTS_QUERY, (user_id, since, since))
+                ingredients = cur.fetchall()
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(SNAPSHOT_RECIPES_QUERY, (user_id, since, since))
+                recipes = attach_snapshot_ingredients(cur.fetchall(), ingredients)
+        return {
+            'version': snapshot_version(count, max_id, cursor),
+            'cursor': cursor,
+            'since': since,
+            'ids': ids,
+            'recipes': recipes,
+        }
+
+    return dict(recipe_cache.get_or_load((user_id, 'snapshot', since), load))
+
+SHOPPING_LIST_QUERY = """
+    SELECT i.name, ri.unit,
+           SUM(ri.quantity * COALESCE(s.servings::numeric / NULLIF(r.servings, 0), 1)) AS quantity
+    FROM unnest(%s::int[], %s::int[]) AS s(recipe_id, servings)
+    JOIN recipes r ON r.id = s.recipe_id
+    JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+    JOIN ingredients i ON i.id = ri.ingredient_id
+    WHERE %s::int IS NULL OR r.user_id = %s
+    GROUP BY i.name, ri.unit
+    ORDER BY i.name, ri.unit
+"""
+
+def merge_shopping_rows(rows):
+    """Combine (name, unit) totals whose units convert into each other.
+
+    An ingredient bought in a single unit keeps it; one bought in several
+    compatible units is summed in its base unit (ml, g, C), shown as l/kg once
+    large enough. Unknown units are only merged with the same spelling.
+    """
+    quantities = np.fromiter((float(row['quantity']) for row in rows), dtype=float, count=len(rows))
+    units = [row['unit'] for row in rows]
+    base_values, base_units = UnitConverter.to_base_many(quantities, units)
+    
+    groups = {}
+    inverse = np.fromiter(
+        (groups.setdefault((row['name'], unit), len(groups)) for row, unit in zip(rows, base_units)),
+        dtype=np.intp, count=len(rows)
+    )
+    totals = np.bincount(inverse, weights=base_values, minlength=len(groups))
+    counts = np.bincount(inverse, minlength=len(groups))
+    _, first_rows = np.unique(inverse, return_index=True)
+    
+    items = []
+    for (name, base_unit), total, count, first in zip(groups, totals, counts, first_rows):
+        if count == 1:
+            quantity, unit = quantities[first], units[first]
+        else:
+            quantity, unit = total, base_unit
+            larger_unit, size = METRIC_UPGRADES.get(unit, (None, None))
+            if larger_unit and quantity >= size:
+                quantity, unit = quantity / size, larger_unit
+        items.append({'name': name, 'quantity': float(quantity), 'unit': unit})
+    return items
+
+@instrument()
+def get_shopping_list(user_id, recipe_ids, servings=None):
+    """Consolidated shopping list for several recipes.
+
+    `servings` scales every recipe to that many servings, or maps recipe ids to
+    their own target; recipes without servings are used as written. Quantities
+    are summed per ingredient and unit in one grouped query, then compatible
+    units are merged.
+    """
+    recipe_ids = list(recipe_ids)
+    if isinstance(servings, dict):
+        targets = [servings.get(recipe_id) for recipe_id in recipe_ids]
+    else:
+        targets = [servings] * len(recipe_ids)
     
-    cur.execute(query, params)
-    recipe = cur.fetchone()
+    def load():
+        if not recipe_ids:
+            return []
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(SHOPPING_LIST_QUERY, (recipe_ids, targets, user_id, user_id))
+            return merge_shopping_rows(cur.fetchall())
     
-    if recipe:
-        recipe['ingredients'] = get_recipe_ingredients(recipe_id)
+    key = (user_id, 'shopping', tuple(recipe_ids), tuple(targets))
+    return list(recipe_cache.get_or_load(key, load))
+
+PANTRY_DETAILS_QUERY = """
+    SELECT r.id, r.title, r.description, r.cooking_time, r.servings, r.category_id,
+           c.name AS category_name,
+           ARRAY(
+               SELECT i.name
+               FROM unnest(r.ingredient_ids) AS x(id)
+               JOIN ingredients i ON i.id = x.id
+               WHERE x.id <> ALL(%s)
+               ORDER BY i.name
+           ) AS missing
+    FROM recipes r
+    LEFT JOIN categories c ON r.category_id = c.id
+    WHERE r.id = ANY(%s)
+"""
+
+def build_pantry_index(recipe_ids, totals, flat):
+    """Inverted index from ingredient id to recipes, in CSR form.
+
+    Takes each recipe's id and ingredient count, plus all their ingredient ids
+    concatenated in the same order: `postings[offsets[k]:offsets[k + 1]]` are
+    the positions, in `recipe_ids`, of the recipes using ingredient
+    `ingredient_ids[k]`.
+    """
+    positions = np.repeat(np.arange(len(recipe_ids), dtype=np.int32), totals)
+    order = np.argsort(flat, kind='stable')
+    ingredient_ids, starts = np.unique(flat[order], return_index=True)
+    return {
+        'recipe_ids': recipe_ids,
+        'totals': totals,
+        'ingredient_ids': ingredient_ids,
+        'offsets': np.append(starts, flat.size),
+        'postings': positions[order],
+    }
+
+def _load_pantry_index(user_id):
+    """The user's pantry index, built from recipes.ingredient_ids (kept current
+    by the recipe_ingredients triggers)."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, ingredient_ids FROM recipes WHERE user_id = %s AND cardinality(ingredient_ids) > 0",
+            (user_id,)
+        )
+        rows = cur.fetchall()
+    
+    recipe_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    totals = np.fromiter((len(row[1]) for row in rows), dtype=np.int32, count=len(rows))
+    flat = np.fromiter(
+        (ingredient_id for row in rows for ingredient_id in row[1]), dtype=np.int64, count=int(totals.sum())
+    )
+    return build_pantry_index(recipe_ids, totals, flat)
+
+@instrument()
+def get_pantry_index(user_id):
+    """The user's cached pantry index; any write to their recipes rebuilds it on next use."""
+    return recipe_cache.get_or_load((user_id, 'pantry_index'), lambda: _load_pantry_index(user_id))
+
+def rank_pantry_matches(index, pantry_ids, min_coverage, limit):
+    """Best `limit` recipes of a pantry index for the given ingredient ids.
+
+    Returns dicts with the recipe id and its matched/total counts and coverage,
+    ordered by coverage, then matched count, then recipe id.
+    """
+    keys = np.searchsorted(index['ingredient_ids'], pantry_ids)
+    found = keys < index['ingredient_ids'].size
+    keys = keys[found][index['ingredient_ids'][keys[found]] == np.asarray(pantry_ids)[found]]
+    if not keys.size:
+        return []
+    offsets, postings = index['offsets'], index['postings']
+    hits = np.concatenate([postings[offsets[k]:offsets[k + 1]] for k in keys])
+    matched = np.bincount(hits, minlength=index['totals'].size)
+    coverage = matched / index['totals']
+    
+    candidates = np.flatnonzero((matched > 0) & (coverage >= min_coverage))
+    ranked = candidates[np.lexsort((
+        index['recipe_ids'][candidates], -matched[candidates], -coverage[candidates]
+    ))][:limit]
+    return [
+        {
+            'id': int(index['recipe_ids'][position]),
+            'matched': int(matched[position]),
+            'total': int(index['totals'][position]),
+            'coverage': float(coverage[position]),
+        }
+        for position in ranked
+    ]
+
+def attach_pantry_details(ranked, rows):
+    """Recipe detail rows in rank_pantry_matches() order, with its counts added."""
+    details = {row['id']: row for row in rows}
+    results = []
+    for match in ranked:
+        recipe = details.get(match['id'])
+        if recipe is not None:
+            recipe.update(match)
+            results.append(recipe)
+    return results
+
+@instrument()
+def find_recipes_by_pantry(user_id, ingredient_names, min_coverage=0.5, limit=50):
+    """Recipes ranked by the share of their ingredients found in the pantry.
+
+    Per-recipe match counts come from the in-process inverted index, so only the
+    returned recipes are read from the database. Each row carries matched/total
+    counts, coverage and the names of the missing ingredients.
+    """
+    names = sorted({name.strip().lower() for name in ingredient_names if name.strip()})
+    
+    def load():
+        if not names:
+            return []
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id FROM ingredients WHERE lower(name) = ANY(%s)", (names,))
+            pantry_ids = [row[0] for row in cur.fetchall()]
+        
+        ranked = rank_pantry_matches(get_pantry_index(user_id), pantry_ids, min_coverage, limit)
+        if not ranked:
+            return []
+        
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(PANTRY_DETAILS_QUERY, (pantry_ids, [match['id'] for match in ranked]))
+            return attach_pantry_details(ranked, cur.fetchall())
     
-    cur.close()
-    conn.close()
-    return recipe
+    key = (user_id, 'pantry', tuple(names), min_coverage, limit)
+    return list(recipe_cache.get_or_load(key, load))
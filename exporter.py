@@ -0,0 +1,159 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from psycopg2.extras import RealDictCursor
+from database import get_db_connection
+
+EXPORT_FORMATS = ('jsonl', 'csv', 'sql')
+EXPORT_FIELDS = ['title', 'description', 'instructions', 'cooking_time', 'servings', 'category', 'ingredients']
+# CSV keeps the readable ingredient lines and adds one aligned, newline-separated column per
+# field, which importer.py reads back exactly (units such as "tin" are not in the parser's list)
+CSV_FIELDS = EXPORT_FIELDS + ['ingredient_quantities', 'ingredient_units', 'ingredient_names']
+DEFAULT_ITERSIZE = 2000
+
+# One row per recipe with its ingredients aggregated, so rows can be written as they stream in
+EXPORT_QUERY = """
+    SELECT r.id, r.title, r.description, r.instructions, r.cooking_time, r.servings,
+           c.name AS category,
+           COALESCE(ing.items, '[]') AS ingredients
+    FROM recipes r
+    LEFT JOIN categories c ON r.category_id = c.id
+    LEFT JOIN LATERAL (
+        SELECT json_agg(
+            json_build_object('name', i.name, 'quantity', ri.quantity, 'unit', ri.unit)
+            ORDER BY i.name
+        ) AS items
+        FROM recipe_ingredients ri
+        JOIN ingredients i ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = r.id
+    ) ing ON TRUE
+    WHERE r.user_id = %s
+    ORDER BY r.id
+"""
+
+def _format_quantity(quantity):
+    if isinstance(quantity, float) and quantity.is_integer():
+        quantity = int(quantity)
+    return str(quantity)
+
+def format_ingredient_line(ingredient):
+    """Render an ingredient as a readable 'quantity unit name' line."""
+    quantity = _format_quantity(ingredient['quantity'])
+    if ingredient['unit']:
+        return f"{quantity} {ingredient['unit']} {ingredient['name']}"
+    return f"{quantity} {ingredient['name']}"
+
+def _write_jsonl(rows, f, **_):
+    for row in rows:
+        f.write(json.dumps({field: row[field] for field in EXPORT_FIELDS}) + '\n')
+        yield
+
+def _write_csv(rows, f, **_):
+    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        ingredients = row['ingredients']
+        row['ingredients'] = '\n'.join(format_ingredient_line(i) for i in ingredients)
+        row['ingredient_quantities'] = '\n'.join(_format_quantity(i['quantity']) for i in ingredients)
+        row['ingredient_units'] = '\n'.join(i['unit'] or '' for i in ingredients)
+        row['ingredient_names'] = '\n'.join(i['name'] for i in ingredients)
+        writer.writerow(row)
+        yield
+
+def _write_sql(rows, f, conn, username):
+    """Emit a self-contained script that recreates the recipes for the same username."""
+    with conn.cursor() as cur:
+        f.write("BEGIN;\n")
+        for row in rows:
+            ingredients = row['ingredients']
+            if ingredients:
+                f.write(cur.mogrify(
+                    "INSERT INTO ingredients (name) SELECT unnest(%s::varchar[]) ON CONFLICT (name) DO NOTHING;\n",
+                    ([i['name'] for i in ingredients],)
+                ).decode())
+            f.write(cur.mogrify("""WITH new_recipe AS (
+    INSERT INTO recipes (title, description, instructions, cooking_time, servings, category_id, user_id)
+    VALUES (%s, %s, %s, %s, %s,
+            (SELECT id FROM categories WHERE name = %s),
+            (SELECT id FROM users WHERE username = %s))
+    RETURNING id
+)
+INSERT INTO recipe_ingredients (recipe_id, ingredient_id, quantity, unit)
+SELECT new_recipe.id, i.id, v.quantity, v.unit
+FROM new_recipe
+CROSS JOIN unnest(%s::varchar[], %s::decimal[], %s::varchar[]) AS v(name, quantity, unit)
+JOIN ingredients i ON i.name = v.name;
+""", (
+                row['title'], row['description'], row['instructions'], row['cooking_time'],
+                row['servings'], row['category'], username,
+                [i['name'] for i in ingredients],
+                [i['quantity'] for i in ingredients],
+                [i['unit'] for i in ingredients],
+            )).decode())
+            yield
+        f.write("COMMIT;\n")
+
+_WRITERS = {'jsonl': _write_jsonl, 'csv': _write_csv, 'sql': _write_sql}
+
+def export_recipes(user_id, f, fmt, itersize=DEFAULT_ITERSIZE, progress=None, progress_every=10_000):
+    """Stream every recipe of a user to an open text file.
+
+    Rows come from a server-side cursor `itersize` at a time, so memory stays
+    flat however large the library is. `progress` is called with the running
+    stats every `progress_every` recipes. Returns the final stats.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    stats = {'recipes': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT username FROM users WHERE id = %s", (user_id,))
+            user = cur.fetchone()
+        if user is None:
+            raise ValueError(f"Unknown user id {user_id}")
+
+        with conn.cursor(name='recipe_export', cursor_factory=RealDictCursor) as rows:
+            rows.itersize = itersize
+            rows.execute(EXPORT_QUERY, (user_id,))
+            for _ in _WRITERS[fmt](rows, f, conn=conn, username=user[0]):
+                stats['recipes'] += 1
+                if progress and stats['recipes'] % progress_every == 0:
+                    stats['seconds'] = time.perf_counter() - start
+                    progress(dict(stats))
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def _print_progress(stats):
+    rate = stats['recipes'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"{stats['recipes']} recipes exported ({rate:.0f} recipes/s)", file=sys.stderr)
+
+def main():
+    """Command-line entry point: python exporter.py --username NAME --format jsonl -o FILE"""
+    parser = argparse.ArgumentParser(description="Export a user's recipes as JSON Lines, CSV or SQL.")
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+    parser.add_argument('-o', '--output', help="defaults to standard output")
+    parser.add_argument('--itersize', type=int, default=DEFAULT_ITERSIZE)
+    args = parser.parse_args()
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE username = %s", (args.username,))
+        user = cur.fetchone()
+    if user is None:
+        parser.error(f"unknown user {args.username}")
+
+    f = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        stats = export_recipes(user[0], f, args.format, itersize=args.itersize, progress=_print_progress)
+    finally:
+        if args.output:
+            f.close()
+    _print_progress(stats)
+
+if __name__ == "__main__":
+    main()
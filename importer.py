@@ -0,0 +1,374 @@
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sys
+import time
+from itertools import islice
+import psycopg2
+from database import (
+    get_db_connection, invalidate_reference_data, invalidate_user_recipes,
+    merge_ingredients, notify_change
+)
+from recommendations import rebuild_similar_recipes
+from utils import parse_ingredient_line
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+DEFAULT_BATCH_SIZE = 1000
+# Range of the INTEGER columns (cooking_time, servings)
+INT4_MIN, INT4_MAX = -2 ** 31, 2 ** 31 - 1
+
+def detect_format(path):
+    """Guess the import format from the file extension."""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'ndjson':
+        return 'jsonl'
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(f"Cannot detect import format of {path}; pass one of {', '.join(IMPORT_FORMATS)}")
+    return extension
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,' if started else ' \t\r\n')
+        if started and buffer.startswith(']'):
+            return
+        if buffer and not started:
+            if buffer[0] != '[':
+                raise ValueError("Expected a JSON array of recipes")
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A value ending exactly at the buffer edge may be cut short, so wait for more input
+                if end < len(buffer) or eof:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            raise ValueError("Unexpected end of JSON input")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+def read_records(f, fmt):
+    """Yield (location, record) pairs from an open text file."""
+    if fmt == 'csv':
+        for line_no, record in enumerate(csv.DictReader(f), start=2):
+            yield f"line {line_no}", record
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(f, start=1):
+            if line.strip():
+                yield f"line {line_no}", json.loads(line)
+    elif fmt == 'json':
+        for index, record in enumerate(iter_json_array(f)):
+            yield f"item {index}", record
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+def _optional_int(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{field} must be a whole number")
+    if not INT4_MIN <= number <= INT4_MAX:
+        raise ValueError(f"{field} is out of range")
+    return number
+
+def _parse_ingredients(value):
+    """Turn ingredient lines (or dicts) into ingredient dicts plus rejected lines."""
+    if isinstance(value, str):
+        value = value.splitlines()
+    parsed, rejected = [], []
+    for item in value or []:
+        if isinstance(item, dict):
+            parsed.append({'name': item['name'], 'quantity': float(item['quantity']), 'unit': item.get('unit')})
+            continue
+        if not item.strip():
+            continue
+        quantity, unit, name = parse_ingredient_line(item)
+        if quantity is None:
+            rejected.append(item)
+        else:
+            parsed.append({'name': name, 'quantity': quantity, 'unit': unit or None})
+    return parsed, rejected
+
+def _ingredient_columns(record):
+    """Ingredient dicts from the aligned ingredient_* columns of an exported CSV, or None without them."""
+    if record.get('ingredient_names') is None:
+        return None
+    columns = [
+        (record.get(f'ingredient_{field}') or '').split('\n') if record.get('ingredient_names') else []
+        for field in ('quantities', 'units', 'names')
+    ]
+    if len({len(column) for column in columns}) > 1:
+        raise ValueError("ingredient_quantities, ingredient_units and ingredient_names differ in length")
+    try:
+        return [
+            {'name': name, 'quantity': float(quantity), 'unit': unit or None}
+            for quantity, unit, name in zip(*columns)
+        ]
+    except ValueError:
+        raise ValueError("ingredient_quantities must be numbers")
+
+def normalize_record(record, category_ids):
+    """Validate one input record.
+
+    Returns (recipe_row, ingredients, rejected_lines) or raises ValueError.
+    """
+    title = (record.get('title') or '').strip()
+    instructions = (record.get('instructions') or '').strip()
+    if not title:
+        raise ValueError("title is required")
+    if len(title) > 200:
+        raise ValueError("title is longer than 200 characters")
+    if not instructions:
+        raise ValueError("instructions are required")
+
+    category = (record.get('category') or '').strip()
+    if category and category not in category_ids:
+        raise ValueError(f"unknown category '{category}'")
+
+    columns = _ingredient_columns(record)
+    ingredients, rejected_lines = _parse_ingredients(record.get('ingredients') if columns is None else columns)
+    recipe = (
+        title,
+        record.get('description') or None,
+        instructions,
+        _optional_int(record.get('cooking_time'), 'cooking_time'),
+        _optional_int(record.get('servings'), 'servings'),
+        category_ids.get(category),
+    )
+    ingredients = merge_ingredients(ingredients)
+    for name, (quantity, unit) in ingredients.items():
+        if not name or len(name) > 100:
+            raise ValueError(f"ingredient name '{name}' must be 1-100 characters")
+        if not math.isfinite(quantity):
+            raise ValueError(f"quantity of '{name}' must be a finite number")
+        if unit and len(unit) > 50:
+            raise ValueError(f"unit '{unit}' is longer than 50 characters")
+    return recipe, ingredients, rejected_lines
+
+def _copy_rows(cur, table, columns, rows):
+    """COPY rows into a table through an in-memory CSV buffer."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def _load_batch(cur, user_id, batch):
+    """Load one batch of normalized recipes through the staging tables.
+
+    Returns the number of ingredient names that did not exist before.
+    """
+    _copy_rows(cur, 'staging_recipes', (
+        'seq', 'title', 'description', 'instructions', 'cooking_time', 'servings', 'category_id'
+    ), ((seq,) + recipe for seq, recipe, _ in batch))
+    _copy_rows(cur, 'staging_ingredients', ('seq', 'name', 'quantity', 'unit'), (
+        (seq, name, quantity, unit)
+        for seq, _, ingredients in batch
+        for name, (quantity, unit) in ingredients.items()
+    ))
+
+    # Reserve recipe ids up front so the junction rows can be joined on seq
+    cur.execute("UPDATE staging_recipes SET recipe_id = nextval(pg_get_serial_sequence('recipes', 'id'))")
+    cur.execute("""
+        INSERT INTO recipes (id, title, description, instructions, cooking_time, servings, category_id, user_id)
+        SELECT recipe_id, title, description, instructions, cooking_time, servings, category_id, %s
+        FROM staging_recipes
+    """, (user_id,))
+    cur.execute("""
+        INSERT INTO ingredients (name)
+        SELECT DISTINCT name FROM staging_ingredients
+        ON CONFLICT (name) DO NOTHING
+    """)
+    new_ingredients = cur.rowcount
+    cur.execute("""
+        INSERT INTO recipe_ingredients (recipe_id, ingredient_id, quantity, unit)
+        SELECT r.recipe_id, i.id, s.quantity, s.unit
+        FROM staging_ingredients s
+        JOIN staging_recipes r ON r.seq = s.seq
+        JOIN ingredients i ON i.name = s.name
+    """)
+    return new_ingredients
+
+def _load_rows(cur, user_id, batch, reject):
+    """Load a batch the database refused one recipe at a time, rejecting the recipes it refuses.
+
+    Returns the loaded recipes and the number of new ingredient names.
+    """
+    loaded, new_ingredients = [], 0
+    for item in batch:
+        cur.execute("SAVEPOINT import_recipe")
+        try:
+            new_ingredients += _load_batch(cur, user_id, [item])
+        except psycopg2.DataError as e:
+            cur.execute("ROLLBACK TO SAVEPOINT import_recipe")
+            reject(item[0], e.diag.message_primary or str(e))
+            continue
+        # The next recipe's load reads the whole staging tables
+        cur.execute("TRUNCATE staging_recipes, staging_ingredients")
+        cur.execute("RELEASE SAVEPOINT import_recipe")
+        loaded.append(item)
+    return loaded, new_ingredients
+
+def import_recipes(f, user_id, fmt, batch_size=DEFAULT_BATCH_SIZE, rejects=None, progress=None):
+    """Stream recipes from an open file into the database in COPY-loaded batches.
+
+    Invalid records and unparseable ingredient lines are skipped and, if
+    `rejects` is a writable file, written to it as JSON lines; so are records
+    the database refuses, found by retrying a failed batch one recipe at a
+    time. `progress` is called with the running stats after every committed batch.
+    """
+    stats = {'read': 0, 'imported': 0, 'rejected': 0, 'rejected_lines': 0, 'new_ingredients': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+
+    def reject(location, reason, record):
+        if rejects is not None:
+            rejects.write(json.dumps({'location': location, 'reason': reason, 'record': record}, default=str) + '\n')
+
+    # Location and input of the current batch's records, by seq, for database rejects
+    pending = {}
+
+    def reject_loaded(seq, reason):
+        stats['rejected'] += 1
+        location, record = pending[seq]
+        reject(location, reason, record)
+
+    def normalized(category_ids):
+        for location, record in read_records(f, fmt):
+            stats['read'] += 1
+            try:
+                recipe, ingredients, rejected_lines = normalize_record(record, category_ids)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                stats['rejected'] += 1
+                reject(location, str(e), record)
+                continue
+            for line in rejected_lines:
+                stats['rejected_lines'] += 1
+                reject(location, "ingredient line has no quantity", line)
+            pending[stats['read']] = (location, record)
+            yield stats['read'], recipe, ingredients
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT name, id FROM categories")
+        category_ids = dict(cur.fetchall())
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staging_recipes (
+                seq INTEGER PRIMARY KEY,
+                recipe_id INTEGER,
+                title VARCHAR(200),
+                description TEXT,
+                instructions TEXT,
+                cooking_time INTEGER,
+                servings INTEGER,
+                category_id INTEGER
+            ) ON COMMIT DELETE ROWS
+        """)
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staging_ingredients (
+                seq INTEGER,
+                name VARCHAR(100),
+                quantity DECIMAL,
+                unit VARCHAR(50)
+            ) ON COMMIT DELETE ROWS
+        """)
+        # Keep the staging tables when a batch is rolled back
+        conn.commit()
+
+        try:
+            records = normalized(category_ids)
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                try:
+                    new_ingredients = _load_batch(cur, user_id, batch)
+                except psycopg2.DataError:
+                    conn.rollback()
+                    batch, new_ingredients = _load_rows(cur, user_id, batch, reject_loaded)
+                pending.clear()
+                notify_change(cur, 'recipes', user_id)
+                if new_ingredients:
+                    notify_change(cur, 'ingredient_names')
+                conn.commit()
+                stats['new_ingredients'] += new_ingredients
+                stats['imported'] += len(batch)
+                stats['seconds'] = time.perf_counter() - start
+                if progress:
+                    progress(dict(stats))
+        finally:
+            # Leave the pooled connection without import state
+            conn.rollback()
+            cur.execute("DROP TABLE IF EXISTS staging_recipes, staging_ingredients")
+            conn.commit()
+            invalidate_user_recipes(user_id)
+            if stats['new_ingredients']:
+                invalidate_reference_data('ingredient_names')
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+def _print_progress(stats):
+    rate = stats['imported'] / stats['seconds'] if stats['seconds'] else 0
+    print(
+        f"{stats['imported']} imported, {stats['rejected']} rejected "
+        f"({rate:.0f} recipes/s)",
+        file=sys.stderr
+    )
+
+def main():
+    """Command-line entry point: python importer.py FILE --username NAME"""
+    parser = argparse.ArgumentParser(description="Bulk import recipes from CSV, JSON or JSON Lines.")
+    parser.add_argument('path', help="file to import")
+    parser.add_argument('--username', required=True, help="owner of the imported recipes")
+    parser.add_argument('--format', choices=IMPORT_FORMATS, help="defaults to the file extension")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--rejects', help="write rejected records to this JSON Lines file")
+    parser.add_argument('--skip-recommendations', action='store_true',
+                        help="do not rebuild similar recipes afterwards (run recommendations.py later)")
+    args = parser.parse_args()
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE username = %s", (args.username,))
+        user = cur.fetchone()
+    if user is None:
+        parser.error(f"unknown user {args.username}")
+
+    rejects = open(args.rejects, 'w') if args.rejects else None
+    try:
+        with open(args.path, 'r', newline='', encoding='utf-8') as f:
+            stats = import_recipes(
+                f, user[0], args.format or detect_format(args.path),
+                batch_size=args.batch_size, rejects=rejects, progress=_print_progress
+            )
+    finally:
+        if rejects:
+            rejects.close()
+
+    print(
+        f"Imported {stats['imported']} of {stats['read']} recipes in {stats['seconds']:.1f}s; "
+        f"{stats['rejected']} recipes and {stats['rejected_lines']} ingredient lines rejected"
+    )
+
+    # A bulk load shifts the term weights of the whole library, so recompute rather than patch
+    if stats['imported'] and not args.skip_recommendations:
+        similar = rebuild_similar_recipes(user[0])
+        print(f"Rebuilt similar recipes for {similar['recipes']} recipes in {similar['seconds']:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+# Set QUERY_METRICS=0 to leave the query helpers unwrapped
+METRICS_ENABLED = os.getenv('QUERY_METRICS', '1') != '0'
+# Calls at least this slow are logged as warnings
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '250'))
+# Set QUERY_LOG=json to log every instrumented call as a JSON line
+QUERY_LOG = os.getenv('QUERY_LOG', '')
+# Serve the histograms in Prometheus text format on this port (0 = off)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Set QUERY_DEBUG=1 to list each rerun's calls in the app sidebar
+DEBUG_SIDEBAR = os.getenv('QUERY_DEBUG', '0') != '0'
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+BYTE_BUCKETS = (1024, 16 * 1024, 256 * 1024, 4 * 1024 ** 2, 64 * 1024 ** 2)
+
+if QUERY_LOG == 'json':
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+
+class Histogram:
+    """Bucketed counts, sum and count, in the Prometheus histogram layout."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, count of observations <= it) pairs, ending with +Inf."""
+        running, pairs = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+class QueryRecord:
+    """One call of an instrumented helper.
+
+    Connection, row and byte counts include those of nested instrumented
+    calls, as the duration does.
+    """
+
+    __slots__ = ('name', 'parent', 'started', 'duration', 'acquire', 'connections', 'rows', 'bytes')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.acquire = 0.0
+        self.connections = 0
+        self.rows = 0
+        self.bytes = 0
+
+    @property
+    def cached(self):
+        """True when the call was answered without borrowing a connection."""
+        return self.connections == 0
+
+    def as_dict(self):
+        return {
+            'query': self.name,
+            'duration_ms': round(self.duration * 1000, 3),
+            'acquire_ms': round(self.acquire * 1000, 3),
+            'connections': self.connections,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'cached': self.cached,
+            'nested': self.parent is not None,
+        }
+
+class QueryMetrics:
+    """Per-query histograms of duration, connection acquire time, rows and bytes.
+
+    Only calls that reached the database are observed; cache hits and slow
+    calls are counted separately.
+    """
+
+    HISTOGRAMS = {
+        'duration_seconds': DURATION_BUCKETS,
+        'connection_acquire_seconds': DURATION_BUCKETS,
+        'rows': ROW_BUCKETS,
+        'bytes': BYTE_BUCKETS,
+    }
+    COUNTERS = ('cache_hits_total', 'slow_total')
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def _histogram(self, metric, name):
+        key = (metric, name)
+        if key not in self._histograms:
+            self._histograms[key] = Histogram(self.HISTOGRAMS[metric])
+        return self._histograms[key]
+
+    def _increment(self, metric, name):
+        self._counters[(metric, name)] = self._counters.get((metric, name), 0) + 1
+
+    def record(self, record):
+        """Add a finished call; returns True when it was slow."""
+        slow = record.duration * 1000 >= self.slow_query_ms
+        with self._lock:
+            if record.cached:
+                self._increment('cache_hits_total', record.name)
+            else:
+                self._histogram('duration_seconds', record.name).observe(record.duration)
+                self._histogram('connection_acquire_seconds', record.name).observe(record.acquire)
+                self._histogram('rows', record.name).observe(record.rows)
+                self._histogram('bytes', record.name).observe(record.bytes)
+            if slow:
+                self._increment('slow_total', record.name)
+        return slow
+
+    def snapshot(self):
+        """JSON-ready summary: per query, count/sum of each histogram and the counters."""
+        queries = {}
+        with self._lock:
+            for (metric, name), histogram in self._histograms.items():
+                queries.setdefault(name, {})[metric] = {'count': histogram.count, 'sum': histogram.sum}
+            for (metric, name), value in self._counters.items():
+                queries.setdefault(name, {})[metric] = value
+        return queries
+
+    def prometheus_text(self, prefix='recipe_query'):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric in self.HISTOGRAMS:
+                lines.append(f"# TYPE {prefix}_{metric} histogram")
+                for (name_metric, name), histogram in sorted(self._histograms.items()):
+                    if name_metric != metric:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f'{prefix}_{metric}_bucket{{query="{name}",le="{le}"}} {count}')
+                    lines.append(f'{prefix}_{metric}_sum{{query="{name}"}} {histogram.sum}')
+                    lines.append(f'{prefix}_{metric}_count{{query="{name}"}} {histogram.count}')
+            for metric in self.COUNTERS:
+                lines.append(f"# TYPE {prefix}_{metric} counter")
+                for (name_metric, name), value in sorted(self._counters.items()):
+                    if name_metric == metric:
+                        lines.append(f'{prefix}_{metric}{{query="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+metrics = QueryMetrics()
+
+class AppTimings:
+    """Wall time of whole script reruns, and of each one-time startup step."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reruns = Histogram(DURATION_BUCKETS)
+        self.startup = {}
+
+    def record_rerun(self, seconds):
+        with self._lock:
+            self.reruns.observe(seconds)
+        if QUERY_LOG == 'json':
+            logger.info(json.dumps({'event': 'rerun', 'duration_ms': round(seconds * 1000, 3)}))
+
+    def record_startup(self, steps):
+        """Set the seconds taken by each startup step, e.g. {'imports': 0.4, 'init_db': 0.1}."""
+        with self._lock:
+            self.startup.update(steps)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'reruns': {'count': self.reruns.count, 'sum': self.reruns.sum},
+                'startup_seconds': dict(self.startup),
+            }
+
+    def prometheus_text(self, prefix='recipe_app'):
+        lines = [f"# TYPE {prefix}_rerun_duration_seconds histogram"]
+        with self._lock:
+            for bound, count in self.reruns.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{prefix}_rerun_duration_seconds_bucket{{le="{le}"}} {count}')
+            lines.append(f'{prefix}_rerun_duration_seconds_sum {self.reruns.sum}')
+            lines.append(f'{prefix}_rerun_duration_seconds_count {self.reruns.count}')
+            lines.append(f"# TYPE {prefix}_startup_seconds gauge")
+            for step, seconds in sorted(self.startup.items()):
+                lines.append(f'{prefix}_startup_seconds{{step="{step}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+app_timings = AppTimings()
+
+class StatsSources:
+    """Point-in-time counters kept by other modules, such as the connection pool and caches.
+
+    Each source is a callable returning its stats dict (or None when there is
+    nothing to report yet); `series` maps a stats key to its Prometheus metric
+    name and type. With a `label`, the callable returns {label value: stats}.
+    database registers its sources here, since this module cannot import it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+
+    def register(self, name, collect, series, label=None):
+        with self._lock:
+            self._sources[name] = (collect, series, label)
+
+    def _collect(self):
+        with self._lock:
+            sources = dict(self._sources)
+        return {name: (collect(), series, label) for name, (collect, series, label) in sources.items()}
+
+    def snapshot(self):
+        return {name: stats for name, (stats, _, _) in self._collect().items()}
+
+    def prometheus_text(self):
+        lines = []
+        for stats, series, label in self._collect().values():
+            groups = (stats or {}).items() if label else [(None, stats or {})]
+            for key, (metric, kind) in series.items():
+                lines.append(f"# TYPE {metric} {kind}")
+                for label_value, values in groups:
+                    if key in values:
+                        labels = f'{{{label}="{label_value}"}}' if label else ''
+                        lines.append(f'{metric}{labels} {values[key]}')
+        return "\n".join(lines) + "\n" if lines else ""
+
+stats_sources = StatsSources()
+
+# The innermost instrumented call in progress, and the records of the current Streamlit rerun
+_current = contextvars.ContextVar('current_query', default=None)
+_rerun = contextvars.ContextVar('rerun_queries', default=None)
+
+def _finish(record, token):
+    record.duration = time.perf_counter() - record.started
+    _current.reset(token)
+    parent = record.parent
+    if parent is not None:
+        parent.acquire += record.acquire
+        parent.connections += record.connections
+        parent.rows += record.rows
+        parent.bytes += record.bytes
+
+    slow = metrics.record(record)
+    rerun = _rerun.get()
+    if rerun is not None:
+        rerun.append(record)
+    if slow:
+        logger.warning(json.dumps({'event': 'slow_query', **record.as_dict()}))
+    elif QUERY_LOG == 'json':
+        logger.info(json.dumps({'event': 'query', **record.as_dict()}))
+
+def instrument(name=None):
+    """Decorator recording each call of a query helper under `name` (default: the function name).
+
+    Works on plain and async functions. Connection and row counts come from
+    record_acquire() and record_rows(), called by the database layers.
+    """
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+        query = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                record = QueryRecord(query, _current.get())
+                token = _current.set(record)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _finish(record, token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = QueryRecord(query, _current.get())
+            token = _current.set(record)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _finish(record, token)
+        return wrapper
+    return decorate
+
+def record_acquire(seconds):
+    """Count a borrowed connection and the time spent waiting for it."""
+    record = _current.get()
+    if record is not None:
+        record.connections += 1
+        record.acquire += seconds
+
+def payload_size(rows):
+    """Approximate bytes of fetched values: text and binary by length, anything else as 8."""
+    size = 0
+    for row in rows:
+        for value in (row.values() if isinstance(row, dict) else row):
+            if isinstance(value, (str, bytes, memoryview)):
+                size += len(value)
+            elif isinstance(value, (list, tuple)):
+                size += 8 * len(value)
+            else:
+                size += 8
+    return size
+
+def record_rows(rows):
+    """Count rows fetched by the current call."""
+    record = _current.get()
+    if record is not None and rows:
+        record.rows += len(rows)
+        record.bytes += payload_size(rows)
+
+_cursor_classes = {}
+
+def _counting_cursor(base):
+    """Subclass of a psycopg2 cursor class whose fetches report to record_rows()."""
+    if base not in _cursor_classes:
+        class CountingCursor(base):
+            def fetchone(self):
+                row = super().fetchone()
+                if row is not None:
+                    record_rows([row])
+                return row
+
+            def fetchmany(self, *args, **kwargs):
+                rows = super().fetchmany(*args, **kwargs)
+                record_rows(rows)
+                return rows
+
+            def fetchall(self):
+                rows = super().fetchall()
+                record_rows(rows)
+                return rows
+
+            def __iter__(self):
+                record = _current.get()
+                for row in super().__iter__():
+                    if record is not None:
+                        record.rows += 1
+                        record.bytes += payload_size([row])
+                    yield row
+
+        CountingCursor.__name__ = f"Counting{base.__name__}"
+        _cursor_classes[base] = CountingCursor
+    return _cursor_classes[base]
+
+class InstrumentedConnection(extensions.connection):
+    """psycopg2 connection whose cursors count fetched rows and bytes for the current call."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _counting_cursor(factory)
+        return super().cursor(*args, **kwargs)
+
+def start_rerun():
+    """Start collecting this rerun's records; returns the list they are appended to."""
+    records = []
+    _rerun.set(records)
+    return records
+
+def bind_context(coro):
+    """Wrap a coroutine so that, run on another thread's event loop, it still
+    reports to the caller's rerun and enclosing call."""
+    rerun, current = _rerun.get(), _current.get()
+
+    async def run():
+        _rerun.set(rerun)
+        _current.set(current)
+        return await coro
+    return run()
+
+def summarize(records):
+    """Totals over a rerun's top-level calls, plus every call as a dict."""
+    top = [record for record in records if record.parent is None]
+    return {
+        'calls': len(top),
+        'database_calls': sum(not record.cached for record in top),
+        'cache_hits': sum(record.cached for record in top),
+        'duration_ms': sum(record.duration for record in top) * 1000,
+        'acquire_ms': sum(record.acquire for record in top) * 1000,
+        'rows': sum(record.rows for record in top),
+        'bytes': sum(record.bytes for record in top),
+        'queries': [record.as_dict() for record in records],
+    }
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = (
+                metrics.prometheus_text() + app_timings.prometheus_text() + stats_sources.prometheus_text()
+            ).encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body = json.dumps({
+                'queries': metrics.snapshot(), 'app': app_timings.snapshot(), **stats_sources.snapshot()
+            }).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread, once per process."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='query-metrics', daemon=True).start()
+    return _server
@@ -1,15 +1,30 @@
+import time
+
+# Wall time of this rerun, from before the imports (only the first run in a process pays for them)
+rerun_started = time.perf_counter()
+
 import streamlit as st
 import streamlit.components.v1 as components
-from database import (
-    init_db, get_categories, add_recipe, get_recipes,
-    get_recipe, get_recipe_ingredients
-)
+from repository import get_repository
+from instrumentation import DEBUG_SIDEBAR, app_timings, start_metrics_server, start_rerun, stats_sources, summarize
 from auth import (
-    register_user, login_user, logout_user,
-    is_authenticated, get_current_user_id
+    SESSION_COOKIE, SESSION_TTL, register_user, login_user, logout_user,
+    restore_session, is_authenticated, get_current_user_id
 )
+from build_assets import load_manifest
 from conversions import UnitConverter
+from pwa import (
+    EXPORT_TYPES, PWA_PORT, PWA_PUBLIC_URL, export_path, register_frame_path, revoke_snapshot_session,
+    start_pwa_server
+)
+from utils import format_quantity, scale_recipes
+import json
 import os
+import tempfile
+from string import Template
+from urllib.parse import urlsplit
+
+import_seconds = time.perf_counter() - rerun_started
 
 # Configure the page
 st.set_page_config(
@@ -18,16 +33,258 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def read_template(path='templates/base.html'):
+    """Template contents, read from disk once per process."""
+    with open(path, 'r') as f:
+        return f.read()
+
+@st.cache_resource
+def read_asset_manifest():
+    """Asset hashes written by build_assets.py, read once per process."""
+    return load_manifest()
+
+def pwa_url(path):
+    """Absolute URL of a path on the PWA server, built like the frame URL in templates/base.html."""
+    if PWA_PUBLIC_URL:
+        return PWA_PUBLIC_URL + path
+    headers = st.context.headers
+    app = urlsplit(headers.get('Origin') or f"http://{headers.get('Host', 'localhost')}")
+    return f"{app.scheme}://{app.hostname}:{PWA_PORT}{path}"
+
 def load_template():
-    with open('templates/base.html', 'r') as f:
-        return components.html(f.read(), height=0)
+    # Re-emitted on every rerun, or Streamlit would remove it; unchanged, the browser keeps the iframe
+    logged_out = st.session_state.get('logged_out', False)
+    frame_path = ''
+    if PWA_PORT:
+        frame_path = register_frame_path(
+            read_asset_manifest(),
+            user_id=get_current_user_id() if is_authenticated() else None,
+            clear=logged_out,
+            session_token=st.session_state.get('session_token')
+        )
+    # The session cookie to set, '' to remove it after a logout, or null to leave it alone
+    session_cookie = None
+    if is_authenticated():
+        session_cookie = st.session_state.get('session_token')
+    elif logged_out:
+        session_cookie = ''
+    html = Template(read_template()).safe_substitute(
+        pwa_frame_path=json.dumps(frame_path),
+        pwa_public_url=json.dumps(PWA_PUBLIC_URL),
+        pwa_port=PWA_PORT,
+        session_cookie=json.dumps(session_cookie),
+        session_cookie_name=SESSION_COOKIE,
+        session_ttl=SESSION_TTL
+    )
+    return components.html(html, height=0)
 
-# Load the PWA template
+# Log back in from the session cookie of an earlier login, then load the PWA template
+restore_session()
 load_template()
 
+RECIPE_PAGE_SIZE = 20
+SEARCH_RESULT_LIMIT = 50
+
+# Storage backend chosen by DB_BACKEND (see repository.py)
+repo = get_repository()
+
+# Every instrumented query helper called during this rerun
+query_records = start_rerun()
+
+def load_recipe_page(user_id, search, category_id, page):
+    """List rows (without ingredients) for one page of the recipe grid, as (rows, has_more).
+
+    Browsing pages by keyset, remembering where each page reached so far
+    starts; ranked search results are paged by slicing.
+    """
+    if search:
+        results = repo.search_recipes(user_id, search, limit=SEARCH_RESULT_LIMIT, category_id=category_id)
+        start = page * RECIPE_PAGE_SIZE
+        return results[start:start + RECIPE_PAGE_SIZE], len(results) > start + RECIPE_PAGE_SIZE
+    
+    cursors = st.session_state.recipe_cursors
+    rows = repo.get_recipes(
+        user_id=user_id, category_id=category_id, after=cursors[page], limit=RECIPE_PAGE_SIZE + 1
+    )
+    has_more = len(rows) > RECIPE_PAGE_SIZE
+    rows = rows[:RECIPE_PAGE_SIZE]
+    if has_more and len(cursors) == page + 1:
+        cursors.append((rows[-1]['title'], rows[-1]['id']))
+    return rows, has_more
+
+def next_recipe_page():
+    st.session_state.recipe_page += 1
+
+def previous_recipe_page():
+    st.session_state.recipe_page -= 1
+
+def open_recipe_details(user_id, rows):
+    """Details and similar recipes of the cards on this page that are open, by recipe id.
+
+    All open cards load in one call; on Postgres with_details reads the
+    recipes and their ingredients concurrently on the async pool.
+    """
+    open_rows = [row for row in rows if st.session_state.get(f"recipe_open_{row['id']}")]
+    if not open_rows:
+        return {}, {}
+    details = {recipe['id']: recipe for recipe in repo.with_details(user_id, open_rows)}
+    return details, repo.get_similar_recipes(user_id, list(details))
+
+def recipe_card(user_id, row, details, similar_recipes):
+    """One recipe card; its details (from open_recipe_details, already scaled) are loaded only while it is open.
+
+    Not a fragment of its own: nested fragments made every rerun of the list
+    twice as slow, and opening a card already reruns only the list.
+    """
+    with st.container(border=True):
+        st.write(f"**{row['title']}** ({row['category_name']})")
+        st.caption(f"{row['cooking_time']} minutes, {row['servings']} servings")
+        if not st.toggle("Show recipe", key=f"recipe_open_{row['id']}"):
+            return
+        
+        recipe = details.get(row['id'])
+        if recipe is None:
+            st.warning("This recipe is no longer available.")
+            return
+        
+        st.write(f"**Description:** {recipe['description']}")
+        st.write(f"**Cooking Time:** {recipe['cooking_time']} minutes")
+        if recipe.get('original_servings') not in (None, recipe['servings']):
+            st.write(f"**Servings:** {recipe['servings']} (scaled from {recipe['original_servings']})")
+        else:
+            st.write(f"**Servings:** {recipe['servings']}")
+        
+        st.write("**Ingredients:**")
+        for ing in recipe['ingredients']:
+            st.write(f"- {format_quantity(ing['quantity'])} {ing['unit'] or ''} {ing['name']}")
+        
+        st.write("**Instructions:**")
+        st.write(recipe['instructions'])
+        
+        similar = similar_recipes.get(recipe['id'])
+        if similar:
+            st.write("**More like this:** " + ", ".join(other['title'] for other in similar))
+        
+        in_list = recipe['id'] in st.session_state.get('shopping_list', {})
+        st.button(
+            "Remove from shopping list" if in_list else "Add to shopping list",
+            key=f"shopping_{recipe['id']}",
+            on_click=toggle_shopping_list,
+            args=(recipe['id'], recipe['title'])
+        )
+
+@st.fragment
+def recipe_list(user_id):
+    """Search, filters and one page of recipe cards for View Recipes.
+
+    Every widget in here reruns only this fragment, not the whole page.
+    """
+    # Search functionality
+    search_col1, search_col2 = st.columns(2)
+    with search_col1:
+        search_query = st.text_input("Search recipes")
+    with search_col2:
+        category_ids = {cat['name']: cat['id'] for cat in repo.get_categories()}
+        category_filter = st.selectbox(
+            "Filter by category",
+            ["All Categories"] + list(category_ids)
+        )
+    
+    # View mode: scale every opened recipe to a serving count and/or show metric units
+    view_col1, view_col2 = st.columns(2)
+    with view_col1:
+        target_servings = st.number_input(
+            "Scale to servings", min_value=0, value=0, step=1,
+            help="0 shows each recipe's own quantities"
+        )
+    with view_col2:
+        to_metric = st.checkbox("Convert to metric")
+    
+    try:
+        category_id = category_ids.get(category_filter)
+        
+        # Paging restarts when the filters change
+        list_key = (user_id, search_query.strip(), category_id)
+        if st.session_state.get('recipe_list_key') != list_key:
+            st.session_state.recipe_list_key = list_key
+            st.session_state.recipe_page = 0
+            st.session_state.recipe_cursors = [None]
+        
+        page = st.session_state.recipe_page
+        rows, has_more = load_recipe_page(user_id, search_query.strip(), category_id, page)
+        if not rows:
+            st.info("No recipes found matching your search criteria.")
+        
+        details, similar_recipes = open_recipe_details(user_id, rows)
+        # All open recipes are scaled and converted in one batch
+        if details and (target_servings or to_metric):
+            details = {
+                recipe['id']: recipe
+                for recipe in scale_recipes(list(details.values()), int(target_servings) or None, to_metric)
+            }
+        cols = st.columns(2)
+        for idx, row in enumerate(rows):
+            with cols[idx % 2]:
+                recipe_card(user_id, row, details, similar_recipes)
+        
+        if page or has_more:
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                st.button("Previous", disabled=not page, on_click=previous_recipe_page)
+            with page_col:
+                st.write(f"Page {page + 1}")
+            with next_col:
+                st.button("Next", disabled=not has_more, on_click=next_recipe_page)
+    
+    except Exception as e:
+        st.error(f"Failed to load recipes: {e}")
+
+def show_query_timings(records, rerun_seconds, startup):
+    """Debug sidebar with this rerun's time, the process startup steps and the query calls (QUERY_DEBUG=1)."""
+    summary = summarize(records)
+    with st.sidebar.expander(
+        f"Rerun {rerun_seconds * 1000:.1f} ms; queries: {summary['database_calls']} database, "
+        f"{summary['cache_hits']} cached, {summary['duration_ms']:.1f} ms"
+    ):
+        st.write(
+            f"Connection wait {summary['acquire_ms']:.1f} ms, "
+            f"{summary['rows']} rows, {summary['bytes']} bytes"
+        )
+        st.write("Startup: " + ", ".join(f"{step} {seconds * 1000:.1f} ms" for step, seconds in startup.items()))
+        for name, stats in stats_sources.snapshot().items():
+            if stats:
+                st.write(f"{name.capitalize()}: {stats}")
+        st.dataframe(summary['queries'], hide_index=True)
+
+def toggle_shopping_list(recipe_id, title):
+    selected = st.session_state.setdefault('shopping_list', {})
+    if selected.pop(recipe_id, None) is None:
+        selected[recipe_id] = title
+
+@st.cache_resource
+def start_app(_import_seconds):
+    """One-time process setup: schema, cache listener, metrics and PWA servers; returns each step's seconds.
+
+    A failure is not cached, so the next rerun tries again.
+    """
+    startup = {'imports': _import_seconds}
+    for step, func in (
+        ('init_db', repo.init_db),
+        ('cache_listener', repo.start_cache_listener),
+        ('metrics_server', start_metrics_server),
+        ('pwa_server', start_pwa_server),
+    ):
+        started = time.perf_counter()
+        func()
+        startup[step] = time.perf_counter() - started
+    app_timings.record_startup(startup)
+    return startup
+
 # Initialize the database
+startup = {}
 try:
-    init_db()
+    startup = start_app(import_seconds)
 except Exception as e:
     st.error(f"Database initialization failed: {e}")
 
@@ -104,13 +361,15 @@ else:
     # Sidebar navigation
     st.sidebar.title(f"Welcome, {st.session_state.username}!")
     if st.sidebar.button("Logout"):
+        # Also removes the session cookie and has the service worker drop this user's offline recipes
+        revoke_snapshot_session(st.session_state.get('session_token'))
         logout_user()
         st.rerun()
     
-    selected_page = st.sidebar.radio(
-        "Choose a page",
-        ["View Recipes", "Add New Recipe", "Unit Converter"]
-    )
+    pages = ["View Recipes", "What Can I Cook", "Add New Recipe", "Shopping List", "Unit Converter"]
+    if repo.export_formats:
+        pages.append("Export Recipes")
+    selected_page = st.sidebar.radio("Choose a page", pages)
     
     # Add install button to sidebar
     st.sidebar.markdown("""
@@ -121,57 +380,40 @@ else:
         </button>
     </div>
     """, unsafe_allow_html=True)
+    if PWA_PORT:
+        # The service worker lives on the PWA server's origin, so offline browsing happens on its page
+        st.sidebar.link_button("Offline recipes", pwa_url('/offline.html'))
+        st.sidebar.caption("Open this page once while online and bookmark or install it; it shows your recipes without a connection.")
 
     if selected_page == "View Recipes":
         st.subheader("Your Recipes")
+        recipe_list(get_current_user_id())
+
+    elif selected_page == "What Can I Cook":
+        st.subheader("What Can I Cook?")
         
-        # Search functionality
-        search_col1, search_col2 = st.columns(2)
-        with search_col1:
-            search_query = st.text_input("Search recipes by title")
-        with search_col2:
-            category_filter = st.selectbox(
-                "Filter by category",
-                ["All Categories"] + [cat['name'] for cat in get_categories()]
-            )
+        pantry = st.multiselect("Ingredients you have", repo.get_ingredient_names())
+        min_coverage = st.slider(
+            "Minimum share of a recipe's ingredients you have", 0, 100, 50, step=10, format="%d%%"
+        )
         
-        try:
-            recipes = get_recipes(user_id=get_current_user_id())
-            filtered_recipes = recipes
-            
-            if search_query:
-                filtered_recipes = [
-                    recipe for recipe in filtered_recipes 
-                    if search_query.lower() in recipe['title'].lower()
-                ]
-            
-            if category_filter != "All Categories":
-                filtered_recipes = [
-                    recipe for recipe in filtered_recipes 
-                    if recipe['category_name'] == category_filter
-                ]
-            
-            if not filtered_recipes:
-                st.info("No recipes found matching your search criteria.")
-            
-            cols = st.columns(2)
-            for idx, recipe in enumerate(filtered_recipes):
-                with cols[idx % 2]:
-                    with st.expander(f"{recipe['title']} ({recipe['category_name']})"):
-                        st.write(f"**Description:** {recipe['description']}")
+        if pantry:
+            try:
+                matches = repo.find_recipes_by_pantry(get_current_user_id(), pantry, min_coverage / 100)
+                if not matches:
+                    st.info("No recipes match your pantry yet.")
+                for recipe in matches:
+                    with st.expander(
+                        f"{recipe['title']} ({recipe['matched']}/{recipe['total']} ingredients, "
+                        f"{recipe['coverage']:.0%})"
+                    ):
                         st.write(f"**Cooking Time:** {recipe['cooking_time']} minutes")
-                        st.write(f"**Servings:** {recipe['servings']}")
-                        
-                        st.write("**Ingredients:**")
-                        ingredients = get_recipe_ingredients(recipe['id'])
-                        for ing in ingredients:
-                            st.write(f"- {ing['quantity']} {ing['unit']} {ing['name']}")
-                        
-                        st.write("**Instructions:**")
-                        st.write(recipe['instructions'])
-
-        except Exception as e:
-            st.error(f"Failed to load recipes: {e}")
+                        if recipe['missing']:
+                            st.write("**Missing:** " + ", ".join(recipe['missing']))
+                        else:
+                            st.write("You have everything you need.")
+            except Exception as e:
+                st.error(f"Failed to match recipes: {e}")
 
     elif selected_page == "Add New Recipe":
         st.subheader("Add New Recipe")
@@ -186,7 +428,7 @@ else:
             with col2:
                 servings = st.number_input("Servings", min_value=1)
             
-            categories = get_categories()
+            categories = repo.get_categories()
             category_options = {cat['name']: cat['id'] for cat in categories}
             category = st.selectbox("Category", options=list(category_options.keys()))
             
@@ -218,7 +460,7 @@ else:
                     st.error("Please fill in all required fields")
                 else:
                     try:
-                        recipe_id = add_recipe(
+                        recipe_id = repo.add_recipe(
                             title=title,
                             description=description,
                             instructions=instructions,
@@ -228,11 +470,41 @@ else:
                             ingredients_data=ingredients_data,
                             user_id=get_current_user_id()
                         )
+                        try:
+                            repo.update_similar_recipes(get_current_user_id(), [recipe_id])
+                        except Exception as e:
+                            st.warning(f"Recipe saved, but similar recipes were not updated: {e}")
                         st.success("Recipe added successfully!")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Failed to add recipe: {e}")
 
+    elif selected_page == "Shopping List":
+        st.subheader("Shopping List")
+        
+        selected = st.session_state.get('shopping_list', {})
+        if not selected:
+            st.info("Add recipes to your shopping list from the View Recipes page.")
+        else:
+            st.write("**Recipes:** " + ", ".join(selected.values()))
+            list_servings = st.number_input(
+                "Servings per recipe", min_value=0, value=0, step=1,
+                help="0 uses each recipe's own servings"
+            )
+            
+            try:
+                items = repo.get_shopping_list(
+                    get_current_user_id(), list(selected), servings=int(list_servings) or None
+                )
+                for item in items:
+                    st.write(f"- {format_quantity(item['quantity'])} {item['unit'] or ''} {item['name']}")
+            except Exception as e:
+                st.error(f"Failed to build shopping list: {e}")
+            
+            if st.button("Clear shopping list"):
+                st.session_state.shopping_list = {}
+                st.rerun()
+
     elif selected_page == "Unit Converter":
         st.subheader("Measurement Converter")
         st.write("Convert between different units of measurement commonly used in recipes.")
@@ -279,3 +551,50 @@ else:
         | 1 pound | grams | 453.59 g |
         | 1 ounce | grams | 28.35 g |
         """)
+
+    elif selected_page == "Export Recipes":
+        st.subheader("Export Recipes")
+        st.write("Download your whole recipe library as a backup or to move it elsewhere.")
+        
+        export_format = st.selectbox(
+            "Format",
+            repo.export_formats,
+            format_func={'jsonl': "JSON Lines", 'csv': "CSV", 'sql': "SQL script"}.get
+        )
+        
+        if PWA_PORT:
+            # Streamed from the database by the PWA server as it downloads
+            st.link_button("Download export", pwa_url(export_path(get_current_user_id(), export_format)))
+        elif st.button("Prepare export"):
+            # Without the PWA server, Streamlit serves the download from memory; the temporary file
+            # only keeps the rows from piling up while the export is written
+            path = None
+            try:
+                with tempfile.NamedTemporaryFile(
+                    'w', suffix=f'.{export_format}', newline='', encoding='utf-8', delete=False
+                ) as f:
+                    path = f.name
+                    stats = repo.export_recipes(get_current_user_id(), f, export_format)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                rate = stats['recipes'] / stats['seconds'] if stats['seconds'] else 0
+                st.success(
+                    f"Exported {stats['recipes']} recipes in {stats['seconds']:.1f}s "
+                    f"({rate:.0f} recipes/s)"
+                )
+                st.download_button(
+                    "Download export",
+                    data=data,
+                    file_name=f"recipes.{export_format}",
+                    mime=EXPORT_TYPES[export_format]
+                )
+            except Exception as e:
+                st.error(f"Failed to export recipes: {e}")
+            finally:
+                if path:
+                    os.unlink(path)
+
+rerun_seconds = time.perf_counter() - rerun_started
+app_timings.record_rerun(rerun_seconds)
+if DEBUG_SIDEBAR:
+    show_query_timings(query_records, rerun_seconds, startup)
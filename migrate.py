@@ -0,0 +1,23 @@
+import argparse
+from database import apply_migrations, get_migration_status
+
+def main():
+    """Apply pending schema migrations, or report their status."""
+    parser = argparse.ArgumentParser(description="Manage database schema migrations.")
+    parser.add_argument('--status', action='store_true', help="show applied and pending migrations")
+    args = parser.parse_args()
+    
+    if args.status:
+        applied, pending = get_migration_status()
+        print(f"Applied: {', '.join(map(str, applied)) or 'none'}")
+        print(f"Pending: {', '.join(map(str, pending)) or 'none'}")
+        return
+    
+    applied = apply_migrations()
+    if applied:
+        print(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        print("Database schema is up to date")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+-- Full-text and fuzzy search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Weighted document: title, ingredient names, description, instructions
+CREATE OR REPLACE FUNCTION recipe_search_vector(p_recipe_id INTEGER, p_title TEXT, p_description TEXT, p_instructions TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(p_title, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce((
+               SELECT string_agg(i.name, ' ')
+               FROM recipe_ingredients ri
+               JOIN ingredients i ON ri.ingredient_id = i.id
+               WHERE ri.recipe_id = p_recipe_id
+           ), '')), 'B') ||
+           setweight(to_tsvector('english', coalesce(p_description, '')), 'C') ||
+           setweight(to_tsvector('english', coalesce(p_instructions, '')), 'D');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION recipes_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := recipe_search_vector(NEW.id, NEW.title, NEW.description, NEW.instructions);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Ingredient rows are written after their recipe, so refresh the affected recipes once per statement
+CREATE OR REPLACE FUNCTION recipe_ingredients_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE recipes r
+        SET search_vector = recipe_search_vector(r.id, r.title, r.description, r.instructions)
+        WHERE r.id IN (SELECT DISTINCT recipe_id FROM changed_rows);
+    ELSE
+        UPDATE recipes r
+        SET search_vector = recipe_search_vector(r.id, r.title, r.description, r.instructions)
+        WHERE r.id IN (SELECT DISTINCT recipe_id FROM removed_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS recipes_search_vector_update ON recipes;
+CREATE TRIGGER recipes_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description, instructions ON recipes
+    FOR EACH ROW EXECUTE FUNCTION recipes_search_vector_trigger();
+
+DROP TRIGGER IF EXISTS recipe_ingredients_search_vector_insert ON recipe_ingredients;
+CREATE TRIGGER recipe_ingredients_search_vector_insert
+    AFTER INSERT ON recipe_ingredients
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_vector_trigger();
+
+DROP TRIGGER IF EXISTS recipe_ingredients_search_vector_delete ON recipe_ingredients;
+CREATE TRIGGER recipe_ingredients_search_vector_delete
+    AFTER DELETE ON recipe_ingredients
+    REFERENCING OLD TABLE AS removed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_search_vector_trigger();
+
+-- Backfill rows created before the column existed
+UPDATE recipes
+SET search_vector = recipe_search_vector(id, title, description, instructions)
+WHERE search_vector IS NULL;
+
+CREATE INDEX IF NOT EXISTS recipes_search_vector_idx ON recipes USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS recipes_title_trgm_idx ON recipes USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ingredients_name_trgm_idx ON ingredients USING GIN (name gin_trgm_ops);
@@ -0,0 +1,24 @@
+-- Per-user recipe listing: WHERE user_id = ? ORDER BY title, id with keyset paging
+CREATE INDEX IF NOT EXISTS recipes_user_title_idx ON recipes (user_id, title, id);
+
+-- Category filter and the categories foreign key
+CREATE INDEX IF NOT EXISTS recipes_category_id_idx ON recipes (category_id);
+
+-- Ingredient -> recipes lookups and the ingredients foreign key
+-- (recipe_id lookups are already served by the primary key)
+CREATE INDEX IF NOT EXISTS recipe_ingredients_ingredient_id_idx ON recipe_ingredients (ingredient_id);
+
+-- Keep updated_at current on every change to a recipe row
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS recipes_set_updated_at ON recipes;
+CREATE TRIGGER recipes_set_updated_at
+    BEFORE UPDATE ON recipes
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,53 @@
+-- Pantry matching ("what can I cook"): every recipe keeps the sorted ids of its
+-- ingredients, from which the app builds its in-process ingredient -> recipes index
+ALTER TABLE recipes ADD COLUMN IF NOT EXISTS ingredient_ids INTEGER[] NOT NULL DEFAULT '{}';
+
+CREATE OR REPLACE FUNCTION recipe_ingredient_ids(p_recipe_id INTEGER)
+RETURNS INTEGER[] AS $$
+    SELECT coalesce(array_agg(ingredient_id ORDER BY ingredient_id), '{}')
+    FROM recipe_ingredients
+    WHERE recipe_id = p_recipe_id;
+$$ LANGUAGE sql STABLE;
+
+-- Replaces the search-vector-only triggers from 0002 so each affected recipe is
+-- rewritten once per statement with both derived columns
+CREATE OR REPLACE FUNCTION recipe_ingredients_sync_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE recipes r
+        SET search_vector = recipe_search_vector(r.id, r.title, r.description, r.instructions),
+            ingredient_ids = recipe_ingredient_ids(r.id)
+        WHERE r.id IN (SELECT DISTINCT recipe_id FROM changed_rows);
+    ELSE
+        UPDATE recipes r
+        SET search_vector = recipe_search_vector(r.id, r.title, r.description, r.instructions),
+            ingredient_ids = recipe_ingredient_ids(r.id)
+        WHERE r.id IN (SELECT DISTINCT recipe_id FROM removed_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS recipe_ingredients_search_vector_insert ON recipe_ingredients;
+DROP TRIGGER IF EXISTS recipe_ingredients_search_vector_delete ON recipe_ingredients;
+DROP FUNCTION IF EXISTS recipe_ingredients_search_vector_trigger();
+
+DROP TRIGGER IF EXISTS recipe_ingredients_sync_insert ON recipe_ingredients;
+CREATE TRIGGER recipe_ingredients_sync_insert
+    AFTER INSERT ON recipe_ingredients
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_sync_trigger();
+
+DROP TRIGGER IF EXISTS recipe_ingredients_sync_delete ON recipe_ingredients;
+CREATE TRIGGER recipe_ingredients_sync_delete
+    AFTER DELETE ON recipe_ingredients
+    REFERENCING OLD TABLE AS removed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredients_sync_trigger();
+
+-- Backfill recipes created before the column existed
+UPDATE recipes r
+SET ingredient_ids = recipe_ingredient_ids(r.id)
+WHERE EXISTS (SELECT 1 FROM recipe_ingredients ri WHERE ri.recipe_id = r.id);
+
+-- Pantry names are matched case-insensitively
+CREATE INDEX IF NOT EXISTS ingredients_lower_name_idx ON ingredients (lower(name));
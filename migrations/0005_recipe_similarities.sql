@@ -0,0 +1,15 @@
+-- Precomputed "more like this" neighbours, written by recommendations.py
+CREATE TABLE IF NOT EXISTS recipe_similarities (
+    recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    similar_recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+    PRIMARY KEY (recipe_id, similar_recipe_id)
+);
+
+-- Render-time lookup: a recipe's neighbours, best first
+CREATE INDEX IF NOT EXISTS recipe_similarities_recipe_score_idx
+    ON recipe_similarities (recipe_id, score DESC);
+
+-- The similar_recipe_id foreign key
+CREATE INDEX IF NOT EXISTS recipe_similarities_similar_recipe_id_idx
+    ON recipe_similarities (similar_recipe_id);
@@ -0,0 +1,3 @@
+-- Offline snapshots: a user's latest change, and the recipes changed since a cursor
+CREATE INDEX IF NOT EXISTS recipes_user_updated_at_idx
+    ON recipes (user_id, updated_at);
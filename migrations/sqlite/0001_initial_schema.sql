@@ -0,0 +1,73 @@
+-- SQLite schema for sqlite_backend.py: the Postgres schema from migrations/
+-- 0001-0004, with an FTS5 table in place of the search_vector column
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    description TEXT,
+    instructions TEXT NOT NULL,
+    cooking_time INTEGER,
+    servings INTEGER,
+    category_id INTEGER REFERENCES categories(id),
+    user_id INTEGER REFERENCES users(id),
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ingredients (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    recipe_id INTEGER REFERENCES recipes(id) ON DELETE CASCADE,
+    ingredient_id INTEGER REFERENCES ingredients(id) ON DELETE CASCADE,
+    quantity REAL NOT NULL,
+    unit TEXT,
+    PRIMARY KEY (recipe_id, ingredient_id)
+);
+
+INSERT OR IGNORE INTO categories (name) VALUES
+    ('Breakfast'),
+    ('Lunch'),
+    ('Dinner'),
+    ('Dessert'),
+    ('Snack');
+
+-- Hot-path indexes, as in 0003_hot_path_indexes.sql and 0004_pantry_index.sql
+CREATE INDEX IF NOT EXISTS recipes_user_title_idx ON recipes (user_id, title, id);
+CREATE INDEX IF NOT EXISTS recipes_category_id_idx ON recipes (category_id);
+CREATE INDEX IF NOT EXISTS recipe_ingredients_ingredient_id_idx ON recipe_ingredients (ingredient_id);
+CREATE INDEX IF NOT EXISTS ingredients_lower_name_idx ON ingredients (lower(name));
+
+CREATE TRIGGER IF NOT EXISTS recipes_set_updated_at
+    AFTER UPDATE ON recipes
+    FOR EACH ROW WHEN OLD.updated_at IS NEW.updated_at
+BEGIN
+    UPDATE recipes SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+END;
+
+-- Full-text search, one row per recipe (rowid = recipes.id). Columns follow the
+-- weights of the Postgres search_vector: title, ingredient names, description,
+-- instructions. add_recipe() writes the row once the ingredients are known.
+CREATE VIRTUAL TABLE IF NOT EXISTS recipe_search USING fts5(
+    title, ingredients, description, instructions,
+    tokenize = 'porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS recipes_search_delete
+    AFTER DELETE ON recipes
+BEGIN
+    DELETE FROM recipe_search WHERE rowid = OLD.id;
+END;
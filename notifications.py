@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import select
+import threading
+import psycopg2
+from database import CACHE_CHANNEL, get_connection_params, handle_invalidation, invalidate_all_caches
+
+logger = logging.getLogger(__name__)
+
+# Set CACHE_LISTENER=0 to run without cross-replica invalidation (e.g. a single replica)
+CACHE_LISTENER_ENABLED = os.getenv('CACHE_LISTENER', '1') != '0'
+
+class CacheInvalidationListener(threading.Thread):
+    """Background thread that LISTENs for cache-invalidation events and evicts local entries.
+
+    It holds its own connection outside the pool. After every (re)connect it
+    clears all caches, since events sent while disconnected are lost.
+    """
+
+    def __init__(self, channel=CACHE_CHANNEL, poll_timeout=5.0, max_reconnect_delay=30.0):
+        super().__init__(name='cache-invalidation-listener', daemon=True)
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stats = {'notifications': 0, 'connects': 0, 'errors': 0}
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        delay = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                self.stats['connects'] += 1
+                invalidate_all_caches()
+                delay = 1.0
+                self._listen(conn)
+            except psycopg2.Error as e:
+                self.stats['errors'] += 1
+                logger.warning("Cache invalidation listener disconnected: %s; retrying in %.0fs", e, delay)
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn):
+        while not self._stop_event.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.stats['notifications'] += 1
+                try:
+                    event = json.loads(notify.payload)
+                except ValueError:
+                    event = None
+                handle_invalidation(event if isinstance(event, dict) else {})
+
+_listener = None
+_listener_lock = threading.Lock()
+
+def start_cache_listener():
+    """Start the process-wide listener once; later calls return the running thread."""
+    global _listener
+    if not CACHE_LISTENER_ENABLED:
+        return None
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = CacheInvalidationListener()
+            _listener.start()
+    return _listener
@@ -0,0 +1,322 @@
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import logging
+import mimetypes
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+from build_assets import STATIC_DIR, UNVERSIONED, file_hash, load_manifest
+from cache import TTLCache
+from database import RECIPE_CACHE_TTL
+from repository import get_repository
+
+logger = logging.getLogger(__name__)
+
+# Serve the service worker, offline page, recipe snapshots and export downloads on this port (0 = off).
+# Streamlit cannot serve JavaScript or HTML with their real content types, so they get their own origin.
+PWA_PORT = int(os.getenv('PWA_PORT', '0'))
+# Address browsers use for that port, e.g. https://recipes.example.com:8502; empty = the app's host
+PWA_PUBLIC_URL = os.getenv('PWA_PUBLIC_URL', '').rstrip('/')
+# Signs snapshot links; set it (the same on every replica) so links survive restarts
+SNAPSHOT_SECRET = os.getenv('SNAPSHOT_SECRET') or secrets.token_hex(32)
+# Seconds a snapshot link stays valid; links are reissued on every visit
+SNAPSHOT_TOKEN_TTL = int(os.getenv('SNAPSHOT_TOKEN_TTL', '86400'))
+# Compressed snapshot bodies kept in memory, keyed by user, version and cursor
+SNAPSHOT_CACHE_SIZE = int(os.getenv('SNAPSHOT_CACHE_SIZE', '64'))
+# Seconds an export download link stays valid; the Export Recipes page issues a fresh one on every rerun
+EXPORT_TOKEN_TTL = int(os.getenv('EXPORT_TOKEN_TTL', '600'))
+
+EXPORT_TYPES = {'jsonl': 'application/jsonl', 'csv': 'text/csv', 'sql': 'application/sql'}
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json')
+
+snapshot_cache = TTLCache(maxsize=SNAPSHOT_CACHE_SIZE, ttl=RECIPE_CACHE_TTL)
+
+def _signature(payload):
+    return hmac.new(SNAPSHOT_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+def snapshot_session_id(session_token):
+    """Short id of the login a session token belongs to; '' for sessions without one."""
+    return hashlib.sha256(session_token.encode()).hexdigest()[:16] if session_token else ''
+
+def sign_snapshot_token(user_id, session_id='', now=None):
+    """A token naming the user and login, valid for one to two SNAPSHOT_TOKEN_TTL periods.
+
+    The expiry is rounded to the period so reruns reuse the same token.
+    """
+    now = time.time() if now is None else now
+    expires = (int(now) // SNAPSHOT_TOKEN_TTL + 2) * SNAPSHOT_TOKEN_TTL
+    payload = f"{user_id}.{expires}.{session_id}"
+    return f"{payload}.{_signature(payload)}"
+
+# Logins whose snapshot tokens were revoked at logout, with the time their last token expires
+_revoked_sessions = {}
+_revoked_lock = threading.Lock()
+
+def revoke_snapshot_session(session_token, now=None):
+    """Reject the snapshot tokens issued to a login from now on, e.g. after a logout.
+
+    Kept in memory, so it applies to this process's PWA server.
+    """
+    session_id = snapshot_session_id(session_token)
+    if not session_id:
+        return
+    now = time.time() if now is None else now
+    with _revoked_lock:
+        for revoked, expires in list(_revoked_sessions.items()):
+            if expires < now:
+                del _revoked_sessions[revoked]
+        _revoked_sessions[session_id] = now + 2 * SNAPSHOT_TOKEN_TTL
+
+def verify_snapshot_token(token, now=None):
+    """The user id a token was signed for, or None if it is forged, malformed, expired or revoked."""
+    parts = token.split('.')
+    if len(parts) != 4:
+        return None
+    user_id, expires, session_id, signature = parts
+    if not (user_id.isdigit() and expires.isdigit()):
+        return None
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    if not hmac.compare_digest(signature.encode(), _signature(f"{user_id}.{expires}.{session_id}").encode()):
+        return None
+    if int(expires) < (time.time() if now is None else now):
+        return None
+    with _revoked_lock:
+        if session_id in _revoked_sessions:
+            return None
+    return int(user_id)
+
+def snapshot_path(user_id, session_id=''):
+    """Path and query of the user's snapshot on the PWA server."""
+    return "/snapshot?" + urlencode({'token': sign_snapshot_token(user_id, session_id)})
+
+def sign_export_token(user_id, fmt, now=None):
+    """A token allowing one user's export in one format for EXPORT_TOKEN_TTL seconds."""
+    expires = int(time.time() if now is None else now) + EXPORT_TOKEN_TTL
+    payload = f"{user_id}.{fmt}.{expires}"
+    # Prefixed so a snapshot token's signature never verifies as an export token, and vice versa
+    return f"{payload}.{_signature('export.' + payload)}"
+
+def verify_export_token(token, now=None):
+    """(user_id, format) a token was signed for, or None if it is forged, malformed or expired."""
+    parts = token.split('.')
+    if len(parts) != 4:
+        return None
+    user_id, fmt, expires, signature = parts
+    if not (user_id.isdigit() and expires.isdigit() and fmt in EXPORT_TYPES):
+        return None
+    if not hmac.compare_digest(signature.encode(), _signature(f"export.{user_id}.{fmt}.{expires}").encode()):
+        return None
+    if int(expires) < (time.time() if now is None else now):
+        return None
+    return int(user_id), fmt
+
+def export_path(user_id, fmt):
+    """Path and query of a download of the user's recipes on the PWA server."""
+    return "/export?" + urlencode({'token': sign_export_token(user_id, fmt)})
+
+def register_frame_path(manifest, user_id=None, clear=False, session_token=None):
+    """Path of register.html for the app's hidden frame.
+
+    It registers the service worker of this asset version and syncs the
+    user's offline snapshot, or removes it after a logout (`clear`).
+    """
+    fragment = {'version': manifest['version']}
+    if clear:
+        fragment['clear'] = '1'
+    elif user_id is not None:
+        fragment['snapshot'] = snapshot_path(user_id, snapshot_session_id(session_token))
+    return f"/{manifest['assets']['register.html']}#{urlencode(fragment)}"
+
+def encode_snapshot(user_id, since, version, compress):
+    """(version, body) of a user's snapshot as JSON, gzipped when `compress`."""
+    def load():
+        snapshot = get_repository().get_recipe_snapshot(user_id, since=since)
+        snapshot['user_id'] = user_id
+        body = json.dumps(snapshot, separators=(',', ':')).encode()
+        return snapshot['version'], body, gzip.compress(body, compresslevel=6)
+
+    current, body, compressed = snapshot_cache.get_or_load((user_id, version, since), load)
+    return current, compressed if compress else body
+
+class _Asset:
+    """A static file read once, with its hash and, for text types, a gzipped copy."""
+
+    def __init__(self, name):
+        path = os.path.join(STATIC_DIR, name)
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        self.hash = file_hash(path)
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if name == 'manifest.json':
+            self.content_type = 'application/manifest+json'
+        self.gzipped = gzip.compress(self.body) if self.content_type.startswith(COMPRESSIBLE_TYPES) else None
+
+class _ChunkedWriter(io.RawIOBase):
+    """Writes an HTTP/1.1 chunked body to a socket file.
+
+    A body cut short by an error lacks the final empty chunk, so clients
+    report a failed download instead of saving a truncated file.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b'%x\r\n' % len(data) + bytes(data) + b'\r\n')
+        return len(data)
+
+    def finish(self):
+        self.wfile.write(b'0\r\n\r\n')
+
+_assets = {}
+_assets_lock = threading.Lock()
+
+def load_assets():
+    """Every asset in the manifest plus the unversioned files, by name."""
+    with _assets_lock:
+        if not _assets:
+            names = list(load_manifest()['assets']) + list(UNVERSIONED)
+            for name in names:
+                if os.path.isfile(os.path.join(STATIC_DIR, name)):
+                    _assets[name] = _Asset(name)
+        return _assets
+
+class _PWAHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body=b'', content_type=None, headers=()):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _accepts_gzip(self):
+        return 'gzip' in self.headers.get('Accept-Encoding', '')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/snapshot':
+            self._snapshot(params)
+        elif url.path == '/export':
+            self._export(params)
+        else:
+            self._asset(url.path.lstrip('/') or 'offline.html', params.get('v', [None])[0])
+
+    do_HEAD = do_GET
+
+    def _asset(self, name, requested_hash):
+        asset = load_assets().get(name)
+        if asset is None:
+            self.send_error(404)
+            return
+        etag = f'"{asset.hash}"'
+        if requested_hash == asset.hash:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'no-cache'
+        headers = [('ETag', etag), ('Cache-Control', cache_control), ('Vary', 'Accept-Encoding')]
+        if name == 'service-worker.js':
+            headers.append(('Service-Worker-Allowed', '/'))
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, headers=headers)
+        elif asset.gzipped is not None and self._accepts_gzip():
+            self._send(200, asset.gzipped, asset.content_type, headers + [('Content-Encoding', 'gzip')])
+        else:
+            self._send(200, asset.body, asset.content_type, headers)
+
+    def _snapshot(self, params):
+        user_id = verify_snapshot_token(params.get('token', [''])[0])
+        if user_id is None:
+            self.send_error(403)
+            return
+        since = params.get('since', [None])[0] or None
+        if since is not None:
+            try:
+                datetime.fromisoformat(since)
+            except ValueError:
+                self.send_error(400, "since must be a cursor from an earlier snapshot")
+                return
+
+        headers = [('Cache-Control', 'private, no-cache'), ('Vary', 'Accept-Encoding')]
+        try:
+            version = get_repository().get_snapshot_version(user_id)['version']
+            if self.headers.get('If-None-Match') == f'"{version}"':
+                self._send(304, headers=headers + [('ETag', f'"{version}"')])
+                return
+            compress = self._accepts_gzip()
+            version, body = encode_snapshot(user_id, since, version, compress)
+        except Exception:
+            logger.exception("Failed to build the recipe snapshot for user %s", user_id)
+            self.send_error(500)
+            return
+        headers.append(('ETag', f'"{version}"'))
+        if compress:
+            headers.append(('Content-Encoding', 'gzip'))
+        self._send(200, body, 'application/json', headers)
+
+    def _export(self, params):
+        grant = verify_export_token(params.get('token', [''])[0])
+        if grant is None:
+            self.send_error(403)
+            return
+        user_id, fmt = grant
+        repo = get_repository()
+        if fmt not in repo.export_formats:
+            self.send_error(404, f"The {repo.name} backend cannot export {fmt}")
+            return
+
+        # Streamed from the database's server-side cursor, so the export is never held in memory or on disk
+        self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-Type', f"{EXPORT_TYPES[fmt]}; charset=utf-8")
+        self.send_header('Content-Disposition', f'attachment; filename="recipes.{fmt}"')
+        self.send_header('Cache-Control', 'private, no-store')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        if self.command == 'HEAD':
+            return
+        body = _ChunkedWriter(self.wfile)
+        try:
+            with io.TextIOWrapper(io.BufferedWriter(body, 1 << 16), encoding='utf-8', newline='') as f:
+                repo.export_recipes(user_id, f, fmt)
+            body.finish()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception:
+            logger.exception("Failed to export recipes for user %s", user_id)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_pwa_server(port=PWA_PORT):
+    """Serve the PWA assets, /snapshot and /export from a daemon thread, once per process."""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            load_assets()
+            _server = ThreadingHTTPServer(('0.0.0.0', port), _PWAHandler)
+            threading.Thread(target=_server.serve_forever, name='pwa-server', daemon=True).start()
+    return _server
@@ -0,0 +1,354 @@
+import argparse
+import csv
+import io
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+import numpy as np
+from psycopg2.extras import RealDictCursor, execute_values
+from cache import TTLCache
+from database import get_db_connection, invalidate_user_recipes, notify_change, recipe_cache
+from instrumentation import instrument
+
+SIMILAR_TOP_K = int(os.getenv('SIMILAR_TOP_K', '10'))
+# Users whose similarity model is kept in memory, so adding a recipe only vectorizes the new rows
+SIMILARITY_MODEL_CACHE_SIZE = int(os.getenv('SIMILARITY_MODEL_CACHE_SIZE', '8'))
+# Seconds before a cached model is rebuilt, bringing its document frequencies up to date
+SIMILARITY_MODEL_TTL = int(os.getenv('SIMILARITY_MODEL_TTL', '3600'))
+
+# Share of the similarity that comes from shared ingredients vs. title/description words
+INGREDIENT_WEIGHT = 0.7
+TEXT_WEIGHT = 0.3
+TITLE_TERM_BOOST = 2
+
+# Features used by more than this share of a library say nothing about similarity
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+# Recipes scored together per vectorized step, and the most postings one step may expand,
+# which bounds its intermediate arrays when recipes share common features
+SCORE_BATCH_SIZE = 256
+MAX_BATCH_POSTINGS = 2_000_000
+
+TOKEN_PATTERN = re.compile(r'[a-z]{3,}')
+STOP_WORDS = frozenset(
+    'and the with for from into this that are was were you your our its all any but not '
+    'recipe recipes made make easy best'.split()
+)
+
+def _terms(title, description):
+    """Term counts for a recipe's title and description; title words count extra."""
+    counts = Counter()
+    for text, boost in ((title, TITLE_TERM_BOOST), (description, 1)):
+        for token in TOKEN_PATTERN.findall((text or '').lower()):
+            if token not in STOP_WORDS:
+                counts[token] += boost
+    return counts
+
+def _ranges(starts, ends):
+    """Concatenation of arange(start, end) for every pair, without a Python loop."""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+class SimilarityModel:
+    """TF-IDF vectors for one user's recipes, stored as a sparse matrix in both
+    row (recipe -> features) and column (feature -> recipes) compressed form.
+
+    Each row is an ingredient block and a text block, each L2-normalised and
+    weighted, so a dot product is INGREDIENT_WEIGHT * ingredient cosine +
+    TEXT_WEIGHT * text cosine. Recipes can be appended with add(); callers
+    sharing a model hold its lock.
+    """
+
+    def __init__(self, recipe_ids, ingredient_ids, terms):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.recipe_ids = np.empty(0, dtype=np.int64)
+        self.positions = {}
+        self.features = {}
+        self.frequency = {'i': Counter(), 't': Counter()}
+        self.row_offsets = np.zeros(1, dtype=np.int64)
+        self.row_cols, self.row_values = np.empty(0, dtype=np.int64), np.empty(0)
+        self.col_offsets = np.zeros(1, dtype=np.int64)
+        self.col_rows, self.col_values = np.empty(0, dtype=np.int64), np.empty(0)
+        self.add(recipe_ids, ingredient_ids, terms)
+
+    def add(self, recipe_ids, ingredient_ids, terms):
+        """Append recipes, weighting them with the document frequencies including them.
+
+        Rows already in the model keep their weights, and features that were
+        too common when first seen stay out until the model is rebuilt.
+        """
+        documents = [(Counter(ids), counts) for ids, counts in zip(ingredient_ids, terms)]
+        first_row = self.count
+        self.count += len(documents)
+        self.recipe_ids = np.concatenate((self.recipe_ids, np.asarray(recipe_ids, dtype=np.int64)))
+        self.positions.update((recipe_id, first_row + row) for row, recipe_id in enumerate(recipe_ids))
+        for document in documents:
+            self.frequency['i'].update(document[0].keys())
+            self.frequency['t'].update(document[1].keys())
+        limit = MAX_DOCUMENT_FREQUENCY * self.count if self.count >= 20 else self.count
+
+        rows, cols, values, lengths = [], [], [], []
+        for row, document in enumerate(documents, start=first_row):
+            length = len(cols)
+            for block, weight, counts in (('i', INGREDIENT_WEIGHT, document[0]), ('t', TEXT_WEIGHT, document[1])):
+                weights = {}
+                for feature, tf in counts.items():
+                    df = self.frequency[block][feature]
+                    if (block, feature) in self.features or df <= limit:
+                        weights[feature] = (1 + math.log(tf)) * (math.log((1 + self.count) / (1 + df)) + 1)
+                norm = math.sqrt(sum(w * w for w in weights.values()))
+                for feature, w in weights.items():
+                    rows.append(row)
+                    cols.append(self.features.setdefault((block, feature), len(self.features)))
+                    values.append(w / norm * math.sqrt(weight))
+            lengths.append(len(cols) - length)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        # Rows were built in order, so they extend the row form as they are
+        self.row_offsets = np.concatenate((self.row_offsets, self.row_offsets[-1] + np.cumsum(lengths, dtype=np.int64)))
+        self.row_cols = np.concatenate((self.row_cols, cols))
+        self.row_values = np.concatenate((self.row_values, values))
+        # New rows come after every existing one, so they go at the end of each column's postings
+        feature_count = len(self.features)
+        old_offsets = np.concatenate((
+            self.col_offsets, np.full(feature_count + 1 - self.col_offsets.size, self.col_offsets[-1])
+        ))
+        order = np.argsort(cols, kind='stable')
+        positions = old_offsets[cols[order] + 1]
+        self.col_rows = np.insert(self.col_rows, positions, rows[order])
+        self.col_values = np.insert(self.col_values, positions, values[order])
+        added = np.bincount(cols, minlength=feature_count)
+        self.col_offsets = old_offsets + np.concatenate(([0], np.cumsum(added)))
+
+    def _batches(self, rows):
+        """Split rows into scoring batches of at most SCORE_BATCH_SIZE rows and,
+        unless a single row needs more, MAX_BATCH_POSTINGS expanded postings."""
+        posting_counts = np.diff(self.col_offsets)[self.row_cols]
+        cumulative = np.concatenate(([0], np.cumsum(posting_counts)))
+        ends = np.cumsum(cumulative[self.row_offsets[rows + 1]] - cumulative[self.row_offsets[rows]])
+        start = 0
+        while start < rows.size:
+            spent = ends[start - 1] if start else 0
+            stop = int(np.searchsorted(ends, spent + MAX_BATCH_POSTINGS, side='right'))
+            stop = min(max(stop, start + 1), start + SCORE_BATCH_SIZE)
+            yield rows[start:stop]
+            start = stop
+
+    def similarities(self, rows):
+        """Sparse cosine similarities of the given rows against every other recipe.
+
+        Returns (owners, targets, values): owners index into `rows`, targets are
+        recipe rows, and pairs without a shared feature are absent.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        entries = _ranges(self.row_offsets[rows], self.row_offsets[rows + 1])
+        owners = np.repeat(np.arange(rows.size), self.row_offsets[rows + 1] - self.row_offsets[rows])
+        cols = self.row_cols[entries]
+        lengths = self.col_offsets[cols + 1] - self.col_offsets[cols]
+        postings = _ranges(self.col_offsets[cols], self.col_offsets[cols + 1])
+        cells = np.repeat(owners, lengths) * self.count + self.col_rows[postings]
+        products = np.repeat(self.row_values[entries], lengths) * self.col_values[postings]
+        cells, inverse = np.unique(cells, return_inverse=True)
+        values = np.bincount(inverse, weights=products)
+        owners, targets = np.divmod(cells, self.count)
+        keep = targets != rows[owners]
+        return owners[keep], targets[keep], values[keep]
+
+    def neighbours(self, rows):
+        """Yield (row, targets, scores) for each row, best match first, in batches."""
+        rows = np.asarray(rows, dtype=np.int64)
+        for chunk in self._batches(rows):
+            owners, targets, values = self.similarities(chunk)
+            order = np.lexsort((targets, -values, owners))
+            owners, targets, values = owners[order], targets[order], values[order]
+            bounds = np.searchsorted(owners, np.arange(chunk.size + 1))
+            for i, row in enumerate(chunk):
+                yield row, targets[bounds[i]:bounds[i + 1]], values[bounds[i]:bounds[i + 1]]
+
+MODEL_QUERY = "SELECT id, title, description, ingredient_ids FROM recipes WHERE user_id = %s"
+
+# Per-user models for update_similar_recipes(); rebuild_similar_recipes() replaces them
+model_cache = TTLCache(maxsize=SIMILARITY_MODEL_CACHE_SIZE, ttl=SIMILARITY_MODEL_TTL)
+
+def _model_rows(rows):
+    return [row[0] for row in rows], [row[3] for row in rows], [_terms(row[1], row[2]) for row in rows]
+
+def load_model(user_id):
+    """Build the similarity model for all of a user's recipes."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(MODEL_QUERY + " ORDER BY id", (user_id,))
+        rows = cur.fetchall()
+    return SimilarityModel(*_model_rows(rows))
+
+def _add_new_recipes(model, user_id, recipe_ids):
+    """Append the given recipes, and any added since the model was built (e.g. by
+    another process), to a cached model; reads only those rows."""
+    last_id = int(model.recipe_ids.max()) if model.count else 0
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            MODEL_QUERY + " AND (id > %s OR id = ANY(%s)) ORDER BY id",
+            (user_id, last_id, list(recipe_ids))
+        )
+        rows = [row for row in cur.fetchall() if row[0] not in model.positions]
+    if rows:
+        model.add(*_model_rows(rows))
+
+def _copy_neighbours(cur, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY recipe_similarities (recipe_id, similar_recipe_id, score) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+@instrument()
+def rebuild_similar_recipes(user_id, k=SIMILAR_TOP_K):
+    """Recompute every neighbour list for a user's library. Returns stats."""
+    start = time.perf_counter()
+    model = load_model(user_id)
+    model_cache.invalidate(user_id)
+    model_cache.get_or_load(user_id, lambda: model)
+    pairs = [
+        (int(model.recipe_ids[row]), int(model.recipe_ids[other]), float(score))
+        for row, targets, scores in model.neighbours(np.arange(model.count))
+        for other, score in zip(targets[:k], scores[:k])
+    ]
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM recipe_similarities s
+            USING recipes r
+            WHERE r.id = s.recipe_id AND r.user_id = %s
+        """, (user_id,))
+        _copy_neighbours(cur, pairs)
+        notify_change(cur, 'recipes', user_id)
+    invalidate_user_recipes(user_id)
+    return {'recipes': model.count, 'pairs': len(pairs), 'seconds': time.perf_counter() - start}
+
+@instrument()
+def update_similar_recipes(user_id, recipe_ids, k=SIMILAR_TOP_K):
+    """Add newly inserted recipes to the neighbour table without a full rebuild.
+
+    The new recipes get their own top-k lists, and each existing recipe that
+    scores above its current k-th neighbour gains them, dropping its weakest.
+    The user's model is cached, so only the new rows are read and vectorized;
+    it is rebuilt after SIMILARITY_MODEL_TTL, and an occasional
+    rebuild_similar_recipes() keeps older lists in step as the library grows.
+    """
+    model = model_cache.get_or_load(user_id, lambda: load_model(user_id))
+    with model.lock:
+        _add_new_recipes(model, user_id, recipe_ids)
+        rows = [model.positions[recipe_id] for recipe_id in recipe_ids if recipe_id in model.positions]
+        if not rows:
+            return
+        new_ids = [int(model.recipe_ids[row]) for row in rows]
+        new_id_set = set(new_ids)
+
+        own, reverse = [], {}
+        for row, targets, scores in model.neighbours(rows):
+            recipe_id = int(model.recipe_ids[row])
+            for rank, (other_id, score) in enumerate(zip(model.recipe_ids[targets].tolist(), scores.tolist())):
+                if rank < k:
+                    own.append((recipe_id, other_id, score))
+                if other_id not in new_id_set:
+                    reverse[(other_id, recipe_id)] = score
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM recipe_similarities WHERE recipe_id = ANY(%s)", (new_ids,))
+        _copy_neighbours(cur, own)
+
+        # Only existing recipes whose k-th best is beaten (or that have fewer than k) change
+        candidates = sorted({other_id for other_id, _ in reverse})
+        cur.execute("""
+            SELECT recipe_id, count(*), min(score)
+            FROM recipe_similarities
+            WHERE recipe_id = ANY(%s)
+            GROUP BY recipe_id
+        """, (candidates,))
+        current = {recipe_id: (count, floor) for recipe_id, count, floor in cur.fetchall()}
+        improved = [
+            (other_id, recipe_id, score)
+            for (other_id, recipe_id), score in reverse.items()
+            if current.get(other_id, (0, 0.0))[0] < k or score > current[other_id][1]
+        ]
+        if improved:
+            execute_values(cur, """
+                INSERT INTO recipe_similarities (recipe_id, similar_recipe_id, score) VALUES %s
+                ON CONFLICT (recipe_id, similar_recipe_id) DO UPDATE SET score = EXCLUDED.score
+            """, improved)
+            cur.execute("""
+                DELETE FROM recipe_similarities s
+                USING (
+                    SELECT recipe_id, similar_recipe_id,
+                           row_number() OVER (PARTITION BY recipe_id ORDER BY score DESC, similar_recipe_id) AS rank
+                    FROM recipe_similarities
+                    WHERE recipe_id = ANY(%s)
+                ) ranked
+                WHERE s.recipe_id = ranked.recipe_id
+                  AND s.similar_recipe_id = ranked.similar_recipe_id
+                  AND ranked.rank > %s
+            """, (sorted({other_id for other_id, _, _ in improved}), k))
+        notify_change(cur, 'recipes', user_id)
+    invalidate_user_recipes(user_id)
+
+@instrument()
+def get_similar_recipes(user_id, recipe_ids, limit=5):
+    """Map each recipe id to its precomputed neighbours (id, title, category_name, score).
+
+    One indexed read of recipe_similarities for all the given recipes.
+    """
+    recipe_ids = list(recipe_ids)
+
+    def load():
+        similar = {recipe_id: [] for recipe_id in recipe_ids}
+        if not recipe_ids:
+            return similar
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("""
+                SELECT n.recipe_id AS source_id, r.id, r.title, c.name AS category_name, n.score
+                FROM unnest(%s::int[]) AS q(recipe_id)
+                CROSS JOIN LATERAL (
+                    SELECT s.recipe_id, s.similar_recipe_id, s.score
+                    FROM recipe_similarities s
+                    WHERE s.recipe_id = q.recipe_id
+                    ORDER BY s.score DESC
+                    LIMIT %s
+                ) n
+                JOIN recipes r ON r.id = n.similar_recipe_id
+                LEFT JOIN categories c ON r.category_id = c.id
+                ORDER BY n.recipe_id, n.score DESC
+            """, (recipe_ids, limit))
+            for row in cur.fetchall():
+                similar[row.pop('source_id')].append(row)
+        return similar
+
+    key = (user_id, 'similar', tuple(recipe_ids), limit)
+    return dict(recipe_cache.get_or_load(key, load))
+
+def main():
+    """Command-line entry point: python recommendations.py --username NAME"""
+    parser = argparse.ArgumentParser(description="Rebuild the similar-recipes table for a user.")
+    parser.add_argument('--username', required=True)
+    parser.add_argument('-k', type=int, default=SIMILAR_TOP_K, help="neighbours kept per recipe")
+    args = parser.parse_args()
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE username = %s", (args.username,))
+        user = cur.fetchone()
+    if user is None:
+        parser.error(f"unknown user {args.username}")
+
+    stats = rebuild_similar_recipes(user[0], args.k)
+    print(f"Stored {stats['pairs']} neighbours for {stats['recipes']} recipes in {stats['seconds']:.1f}s")
+
+if __name__ == "__main__":
+    main()
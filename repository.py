@@ -0,0 +1,179 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+import database
+import recommendations
+from exporter import EXPORT_FORMATS, export_recipes
+from notifications import start_cache_listener
+
+# Storage backend for the app: 'postgres' (default) or 'sqlite' (see sqlite_backend.py)
+DB_BACKEND = os.getenv('DB_BACKEND', 'postgres')
+
+class RecipeRepository(ABC):
+    """The storage operations the app uses, independent of the database engine.
+
+    Rows are dicts with the same keys on every backend, and reads are served
+    from the caches in database.py under the same keys. Features a backend
+    cannot offer have no-op defaults here.
+    """
+
+    name = None
+    # Formats accepted by export_recipes(); empty when the backend cannot export
+    export_formats = ()
+
+    @abstractmethod
+    def init_db(self):
+        """Bring the schema up to date."""
+
+    def start_cache_listener(self):
+        """Start cross-process cache invalidation, if the backend has it."""
+
+    @abstractmethod
+    def create_user(self, username, password_hash):
+        """Insert a user; returns False when the username is already taken."""
+
+    @abstractmethod
+    def get_user(self, username):
+        """The user's id, username and password_hash, or None."""
+
+    @abstractmethod
+    def update_password_hash(self, user_id, password_hash):
+        """Replace a user's stored password hash."""
+
+    @abstractmethod
+    def get_categories(self):
+        """All categories, ordered by name."""
+
+    @abstractmethod
+    def get_ingredient_names(self):
+        """Every known ingredient name, ordered."""
+
+    @abstractmethod
+    def add_recipe(self, title, description, instructions, cooking_time, servings, category_id,
+                   ingredients_data, user_id):
+        """Add a recipe with its ingredients and return its id."""
+
+    @abstractmethod
+    def get_recipes(self, user_id=None, search=None, category_id=None, after=None, limit=None):
+        """Recipe list rows ordered by (title, id), keyset-paged by `after`."""
+
+    @abstractmethod
+    def search_recipes(self, user_id, query, limit=50, category_id=None):
+        """Ranked full-text search over a user's recipes."""
+
+    @abstractmethod
+    def get_recipes_with_ingredients(self, user_id=None, recipe_ids=None):
+        """Full recipe rows, each with an 'ingredients' list."""
+
+    @abstractmethod
+    def get_shopping_list(self, user_id, recipe_ids, servings=None):
+        """Consolidated shopping list for several recipes."""
+
+    @abstractmethod
+    def find_recipes_by_pantry(self, user_id, ingredient_names, min_coverage=0.5, limit=50):
+        """Recipes ranked by the share of their ingredients found in the pantry."""
+
+    @abstractmethod
+    def get_snapshot_version(self, user_id):
+        """{'version', 'cursor'} of a user's recipes; the version changes on every add or edit."""
+
+    @abstractmethod
+    def get_recipe_snapshot(self, user_id, since=None):
+        """A user's recipes with ingredients for offline copies, or only those changed since a cursor."""
+
+    def get_recipe_ingredients(self, recipe_id):
+        """Ingredients of one recipe."""
+        recipes = self.get_recipes_with_ingredients(recipe_ids=[recipe_id])
+        return recipes[0]['ingredients'] if recipes else []
+
+    def get_recipe(self, recipe_id, user_id=None):
+        """A recipe with all its details, or None."""
+        recipes = self.get_recipes_with_ingredients(user_id=user_id, recipe_ids=[recipe_id])
+        return recipes[0] if recipes else None
+
+    def with_details(self, user_id, recipes):
+        """Full recipes with ingredients for the given list rows, keeping their order."""
+        details = {
+            recipe['id']: recipe
+            for recipe in self.get_recipes_with_ingredients(
+                user_id=user_id, recipe_ids=[recipe['id'] for recipe in recipes]
+            )
+        }
+        return [details[recipe['id']] for recipe in recipes]
+
+    def load_recipe_pages(self, user_id, category_id, pages, page_size):
+        """The first `pages` keyset pages of a user's recipes with ingredients, as (recipes, has_more)."""
+        recipes, after, has_more = [], None, False
+        for _ in range(pages):
+            page = self.get_recipes(user_id=user_id, category_id=category_id, after=after, limit=page_size + 1)
+            has_more = len(page) > page_size
+            page = page[:page_size]
+            recipes.extend(self.with_details(user_id, page))
+            if not has_more:
+                break
+            after = (page[-1]['title'], page[-1]['id'])
+        return recipes, has_more
+
+    def get_similar_recipes(self, user_id, recipe_ids, limit=5):
+        """Map recipe ids to their most similar recipes; empty without recommendations."""
+        return {}
+
+    def update_similar_recipes(self, user_id, recipe_ids):
+        """Refresh recommendations after recipes were added."""
+
+    def export_recipes(self, user_id, f, fmt):
+        """Write a user's recipes to f in one of export_formats."""
+        raise NotImplementedError(f"The {self.name} backend does not support exports")
+
+class PostgresRepository(RecipeRepository):
+    """Postgres through database.py, with page loads on the async pool of async_database.py."""
+
+    name = 'postgres'
+    export_formats = EXPORT_FORMATS
+
+    init_db = staticmethod(database.init_db)
+    start_cache_listener = staticmethod(start_cache_listener)
+    create_user = staticmethod(database.create_user)
+    get_user = staticmethod(database.get_user)
+    update_password_hash = staticmethod(database.update_password_hash)
+    get_categories = staticmethod(database.get_categories)
+    get_ingredient_names = staticmethod(database.get_ingredient_names)
+    add_recipe = staticmethod(database.add_recipe)
+    get_recipes = staticmethod(database.get_recipes)
+    search_recipes = staticmethod(database.search_recipes)
+    get_recipes_with_ingredients = staticmethod(database.get_recipes_with_ingredients)
+    get_recipe_ingredients = staticmethod(database.get_recipe_ingredients)
+    get_recipe = staticmethod(database.get_recipe)
+    get_shopping_list = staticmethod(database.get_shopping_list)
+    find_recipes_by_pantry = staticmethod(database.find_recipes_by_pantry)
+    get_snapshot_version = staticmethod(database.get_snapshot_version)
+    get_recipe_snapshot = staticmethod(database.get_recipe_snapshot)
+    get_similar_recipes = staticmethod(recommendations.get_similar_recipes)
+    update_similar_recipes = staticmethod(recommendations.update_similar_recipes)
+    export_recipes = staticmethod(export_recipes)
+
+    # async_database (psycopg 3) is imported on first use, when View Recipes opens a recipe
+    def with_details(self, user_id, recipes):
+        import async_database
+        return async_database.run(async_database.with_details(user_id, recipes))
+
+    def load_recipe_pages(self, user_id, category_id, pages, page_size):
+        import async_database
+        return async_database.run(async_database.load_recipe_pages(user_id, category_id, pages, page_size))
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    """The process-wide repository for the DB_BACKEND environment variable."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if DB_BACKEND == 'postgres':
+                _repository = PostgresRepository()
+            elif DB_BACKEND == 'sqlite':
+                from sqlite_backend import SQLiteRepository
+                _repository = SQLiteRepository()
+            else:
+                raise ValueError(f"Unknown DB_BACKEND '{DB_BACKEND}' (expected 'postgres' or 'sqlite')")
+    return _repository
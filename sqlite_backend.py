@@ -0,0 +1,454 @@
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from database import (
+    RECIPE_DETAIL_COLUMNS, attach_pantry_details, attach_snapshot_ingredients, build_pantry_index,
+    group_ingredients, invalidate_all_caches, invalidate_reference_data, invalidate_user_recipes,
+    like_pattern, merge_ingredients, merge_shopping_rows, rank_pantry_matches, recipe_cache,
+    reference_cache, snapshot_version
+)
+from instrumentation import instrument, record_acquire, record_rows
+from repository import RecipeRepository
+
+# Database file for DB_BACKEND=sqlite; WAL needs a real file, not ':memory:'
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'recipes.db')
+SQLITE_TIMEOUT = float(os.getenv('SQLITE_TIMEOUT', '30'))
+# Compiled statements kept per connection, keyed by SQL text
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv('SQLITE_STATEMENT_CACHE_SIZE', '256'))
+SQLITE_MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations', 'sqlite')
+
+# bm25() column weights for recipe_search, matching the A/B/C/D weights
+# ts_rank_cd gives title, ingredients, description and instructions in Postgres
+SEARCH_WEIGHTS = (1.0, 0.4, 0.2, 0.1)
+
+def _dict_row(cur, row):
+    return {column[0]: value for column, value in zip(cur.description, row)}
+
+def _match_expression(query):
+    """FTS5 query requiring every word of the input, each as a prefix."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query.lower()))
+
+CATEGORIES_QUERY = "SELECT * FROM categories ORDER BY name"
+
+RECIPE_INGREDIENTS_QUERY = """
+    SELECT ri.recipe_id, i.name, ri.quantity, ri.unit
+    FROM recipe_ingredients ri
+    JOIN ingredients i ON ri.ingredient_id = i.id
+    WHERE ri.recipe_id IN (SELECT value FROM json_each(?))
+"""
+
+SHOPPING_LIST_QUERY = """
+    SELECT i.name, ri.unit,
+           SUM(ri.quantity * COALESCE(
+               CAST(json_extract(s.value, '$[1]') AS REAL) / NULLIF(r.servings, 0), 1
+           )) AS quantity
+    FROM json_each(?) AS s
+    JOIN recipes r ON r.id = json_extract(s.value, '$[0]')
+    JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+    JOIN ingredients i ON i.id = ri.ingredient_id
+    WHERE ? IS NULL OR r.user_id = ?
+    GROUP BY i.name, ri.unit
+    ORDER BY i.name, ri.unit
+"""
+
+PANTRY_DETAILS_QUERY = """
+    SELECT r.id, r.title, r.description, r.cooking_time, r.servings, r.category_id,
+           c.name AS category_name,
+           (
+               SELECT json_group_array(name) FROM (
+                   SELECT i.name
+                   FROM recipe_ingredients ri
+                   JOIN ingredients i ON i.id = ri.ingredient_id
+                   WHERE ri.recipe_id = r.id
+                     AND ri.ingredient_id NOT IN (SELECT value FROM json_each(?))
+                   ORDER BY i.name
+               )
+           ) AS missing
+    FROM recipes r
+    LEFT JOIN categories c ON r.category_id = c.id
+    WHERE r.id IN (SELECT value FROM json_each(?))
+"""
+
+SNAPSHOT_VERSION_QUERY = """
+    SELECT count(*) AS count, COALESCE(max(id), 0) AS max_id, max(updated_at) AS cursor
+    FROM recipes
+    WHERE user_id = ?
+"""
+
+SNAPSHOT_RECIPES_QUERY = """
+    SELECT r.id, r.title, r.description, r.instructions, r.cooking_time, r.servings,
+           c.name AS category_name, r.updated_at
+    FROM recipes r
+    LEFT JOIN categories c ON r.category_id = c.id
+    WHERE r.user_id = ? AND (? IS NULL OR r.updated_at > ?)
+    ORDER BY r.id
+"""
+
+SNAPSHOT_INGREDIENTS_QUERY = """
+    SELECT ri.recipe_id, i.name, ri.quantity, ri.unit
+    FROM recipes r
+    JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+    JOIN ingredients i ON i.id = ri.ingredient_id
+    WHERE r.user_id = ? AND (? IS NULL OR r.updated_at > ?)
+"""
+
+class SQLiteRepository(RecipeRepository):
+    """Embedded single-file backend: no server, for single-node deployments and CI.
+
+    Connections run in WAL mode, so readers never block the writer, and are
+    reused across threads from an idle stack. Queries are fixed SQL texts with
+    ? parameters, so each connection's statement cache keeps them prepared.
+    Search uses the FTS5 recipe_search table.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, timeout=SQLITE_TIMEOUT, isolation_level=None,
+            check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = _dict_row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @contextmanager
+    def connection(self, write=False):
+        """Borrow a connection; with write=True the block runs in one IMMEDIATE transaction."""
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        record_acquire(time.perf_counter() - start)
+        try:
+            if write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            if write:
+                conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def _fetch_all(self, query, params=()):
+        with self.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        record_rows(rows)
+        return rows
+
+    @instrument()
+    def apply_migrations(self):
+        """Apply pending migrations/sqlite/*.sql scripts, tracked in PRAGMA user_version."""
+        applied = []
+        with self.connection() as conn:
+            for filename in sorted(os.listdir(SQLITE_MIGRATIONS_DIR)):
+                if not filename.endswith('.sql'):
+                    continue
+                version = int(filename.partition('_')[0])
+                if version <= conn.execute("PRAGMA user_version").fetchone()['user_version']:
+                    continue
+                with open(os.path.join(SQLITE_MIGRATIONS_DIR, filename), 'r') as f:
+                    sql = f.read()
+                conn.executescript(f"BEGIN IMMEDIATE;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;")
+                applied.append(version)
+        return applied
+
+    def init_db(self):
+        """Bring the schema up to date once per process."""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            applied = self.apply_migrations()
+            if applied:
+                invalidate_all_caches()
+                print(f"Applied SQLite migrations: {', '.join(map(str, applied))}")
+            self._schema_ready = True
+
+    @instrument()
+    def create_user(self, username, password_hash):
+        with self.connection(write=True) as conn:
+            cur = conn.execute(
+                "INSERT INTO users (username, password_hash) VALUES (?, ?) ON CONFLICT (username) DO NOTHING",
+                (username, password_hash)
+            )
+            return cur.rowcount > 0
+
+    @instrument()
+    def get_user(self, username):
+        with self.connection() as conn:
+            user = conn.execute(
+                "SELECT id, username, password_hash FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        record_rows([user] if user else [])
+        return user
+
+    @instrument()
+    def update_password_hash(self, user_id, password_hash):
+        with self.connection(write=True) as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+
+    @instrument()
+    def get_categories(self):
+        return list(reference_cache.get_or_load('categories', lambda: self._fetch_all(CATEGORIES_QUERY)))
+
+    @instrument()
+    def get_ingredient_names(self):
+        def load():
+            return [row['name'] for row in self._fetch_all("SELECT name FROM ingredients ORDER BY name")]
+
+        return list(reference_cache.get_or_load('ingredient_names', load))
+
+    @instrument()
+    def add_recipe(self, title, description, instructions, cooking_time, servings, category_id,
+                   ingredients_data, user_id):
+        ingredients = merge_ingredients(ingredients_data)
+        names = sorted(ingredients)
+        with self.connection(write=True) as conn:
+            recipe_id = conn.execute("""
+                INSERT INTO recipes (title, description, instructions, cooking_time, servings, category_id, user_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (title, description, instructions, cooking_time, servings, category_id, user_id)).lastrowid
+
+            new_ingredients = conn.executemany(
+                "INSERT INTO ingredients (name) VALUES (?) ON CONFLICT (name) DO NOTHING",
+                [(name,) for name in names]
+            ).rowcount > 0
+            ingredient_ids = {
+                row['name']: row['id']
+                for row in conn.execute(
+                    "SELECT id, name FROM ingredients WHERE name IN (SELECT value FROM json_each(?))",
+                    (json.dumps(names),)
+                )
+            }
+            conn.executemany("""
+                INSERT INTO recipe_ingredients (recipe_id, ingredient_id, quantity, unit)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (recipe_id, ingredient_ids[name], float(quantity), unit)
+                for name, (quantity, unit) in ingredients.items()
+            ])
+            conn.execute("""
+                INSERT INTO recipe_search (rowid, title, ingredients, description, instructions)
+                VALUES (?, ?, ?, ?, ?)
+            """, (recipe_id, title, ' '.join(names), description or '', instructions))
+
+        invalidate_user_recipes(user_id)
+        if new_ingredients:
+            invalidate_reference_data('ingredient_names')
+        return recipe_id
+
+    @instrument()
+    def get_recipes(self, user_id=None, search=None, category_id=None, after=None, limit=None):
+        query = """
+            SELECT r.id, r.title, r.description, r.cooking_time, r.servings,
+                   r.category_id, c.name as category_name
+            FROM recipes r
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE TRUE
+        """
+        params = []
+
+        if user_id:
+            query += " AND r.user_id = ?"
+            params.append(user_id)
+        if search:
+            query += " AND r.title LIKE ? ESCAPE '\\'"
+            params.append(like_pattern(search))
+        if category_id:
+            query += " AND r.category_id = ?"
+            params.append(category_id)
+        if after:
+            query += " AND (r.title, r.id) > (?, ?)"
+            params.extend(after)
+        query += " ORDER BY r.title, r.id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        key = (user_id, 'list', search, category_id, tuple(after) if after else None, limit)
+        return list(recipe_cache.get_or_load(key, lambda: self._fetch_all(query, params)))
+
+    @instrument()
+    def search_recipes(self, user_id, query, limit=50, category_id=None):
+        """Ranked FTS5 search over title, ingredients, description and instructions.
+
+        Every word must match, as a whole word or a prefix; there is no
+        trigram typo matching as on Postgres.
+        """
+        sql = """
+            SELECT r.id, r.title, r.description, r.cooking_time, r.servings,
+                   r.category_id, c.name as category_name,
+                   -bm25(recipe_search, ?, ?, ?, ?) AS rank
+            FROM recipe_search
+            JOIN recipes r ON r.id = recipe_search.rowid
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE recipe_search MATCH ? AND r.user_id = ?
+        """
+        params = [*SEARCH_WEIGHTS, _match_expression(query), user_id]
+        if category_id:
+            sql += " AND r.category_id = ?"
+            params.append(category_id)
+        sql += " ORDER BY rank DESC, r.title, r.id LIMIT ?"
+        params.append(limit)
+
+        def load():
+            return self._fetch_all(sql, params) if params[len(SEARCH_WEIGHTS)] else []
+
+        return list(recipe_cache.get_or_load((user_id, 'search', query, limit, category_id), load))
+
+    def _fetch_ingredients_by_recipe(self, conn, recipe_ids):
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        if not recipe_ids:
+            return {}
+        rows = conn.execute(RECIPE_INGREDIENTS_QUERY, (json.dumps(recipe_ids),)).fetchall()
+        record_rows(rows)
+        return group_ingredients(recipe_ids, rows)
+
+    @instrument()
+    def get_recipes_with_ingredients(self, user_id=None, recipe_ids=None):
+        query = f"""
+            SELECT {RECIPE_DETAIL_COLUMNS}, c.name as category_name
+            FROM recipes r
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE TRUE
+        """
+        params = []
+        if user_id:
+            query += " AND r.user_id = ?"
+            params.append(user_id)
+        if recipe_ids is not None:
+            query += " AND r.id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(recipe_ids)))
+        query += " ORDER BY r.title"
+
+        def load():
+            with self.connection() as conn:
+                recipes = conn.execute(query, params).fetchall()
+                record_rows(recipes)
+                grouped = self._fetch_ingredients_by_recipe(conn, [recipe['id'] for recipe in recipes])
+            for recipe in recipes:
+                recipe['ingredients'] = grouped[recipe['id']]
+            return recipes
+
+        key = (user_id, 'details', tuple(recipe_ids) if recipe_ids is not None else None)
+        return list(recipe_cache.get_or_load(key, load))
+
+    @instrument()
+    def get_shopping_list(self, user_id, recipe_ids, servings=None):
+        recipe_ids = list(recipe_ids)
+        if isinstance(servings, dict):
+            targets = [servings.get(recipe_id) for recipe_id in recipe_ids]
+        else:
+            targets = [servings] * len(recipe_ids)
+
+        def load():
+            if not recipe_ids:
+                return []
+            rows = self._fetch_all(
+                SHOPPING_LIST_QUERY, (json.dumps(list(zip(recipe_ids, targets))), user_id, user_id)
+            )
+            return merge_shopping_rows(rows)
+
+        key = (user_id, 'shopping', tuple(recipe_ids), tuple(targets))
+        return list(recipe_cache.get_or_load(key, load))
+
+    def _load_pantry_index(self, user_id):
+        with self.connection() as conn:
+            # Plain tuples: this reads one row per recipe ingredient
+            cur = conn.cursor()
+            cur.row_factory = None
+            cur.execute("""
+                SELECT ri.recipe_id, ri.ingredient_id
+                FROM recipe_ingredients ri
+                JOIN recipes r ON r.id = ri.recipe_id
+                WHERE r.user_id = ?
+                ORDER BY ri.recipe_id
+            """, (user_id,))
+            rows = cur.fetchall()
+        record_rows(rows)
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        recipe_ids, totals = np.unique(pairs[:, 0], return_counts=True)
+        return build_pantry_index(recipe_ids, totals.astype(np.int32), pairs[:, 1])
+
+    @instrument()
+    def find_recipes_by_pantry(self, user_id, ingredient_names, min_coverage=0.5, limit=50):
+        names = sorted({name.strip().lower() for name in ingredient_names if name.strip()})
+
+        def load():
+            if not names:
+                return []
+            pantry_ids = [
+                row['id'] for row in self._fetch_all(
+                    "SELECT id FROM ingredients WHERE lower(name) IN (SELECT value FROM json_each(?))",
+                    (json.dumps(names),)
+                )
+            ]
+            index = recipe_cache.get_or_load((user_id, 'pantry_index'), lambda: self._load_pantry_index(user_id))
+            ranked = rank_pantry_matches(index, pantry_ids, min_coverage, limit)
+            if not ranked:
+                return []
+
+            rows = self._fetch_all(
+                PANTRY_DETAILS_QUERY, (json.dumps(pantry_ids), json.dumps([match['id'] for match in ranked]))
+            )
+            for row in rows:
+                row['missing'] = json.loads(row['missing'])
+            return attach_pantry_details(ranked, rows)
+
+        key = (user_id, 'pantry', tuple(names), min_coverage, limit)
+        return list(recipe_cache.get_or_load(key, load))
+
+    @instrument()
+    def get_snapshot_version(self, user_id):
+        def load():
+            row = self._fetch_all(SNAPSHOT_VERSION_QUERY, (user_id,))[0]
+            return {'version': snapshot_version(row['count'], row['max_id'], row['cursor']), 'cursor': row['cursor']}
+
+        return dict(recipe_cache.get_or_load((user_id, 'snapshot_version'), load))
+
+    @instrument()
+    def get_recipe_snapshot(self, user_id, since=None):
+        def load():
+            row = self._fetch_all(SNAPSHOT_VERSION_QUERY, (user_id,))[0]
+            ids = [
+                recipe['id']
+                for recipe in self._fetch_all("SELECT id FROM recipes WHERE user_id = ? ORDER BY id", (user_id,))
+            ]
+            with self.connection() as conn:
+                # Plain tuples: this reads one row per recipe ingredient
+                cur = conn.cursor()
+                cur.row_factory = None
+                ingredients = cur.execute(SNAPSHOT_INGREDIENTS_QUERY, (user_id, since, since)).fetchall()
+            record_rows(ingredients)
+            recipes = attach_snapshot_ingredients(
+                self._fetch_all(SNAPSHOT_RECIPES_QUERY, (user_id, since, since)), ingredients
+            )
+            return {
+                'version': snapshot_version(row['count'], row['max_id'], row['cursor']),
+                'cursor': row['cursor'],
+                'since': since,
+                'ids': ids,
+                'recipes': recipes,
+            }
+
+        return dict(recipe_cache.get_or_load((user_id, 'snapshot', since), load))
@@ -1,21 +1,158 @@
-const CACHE_NAME = 'recipe-app-v1';
-const urlsToCache = [
-  '/',
-  '/static/manifest.json',
-  '/static/icon-192x192.png',
-  '/static/icon-512x512.png'
-];
+// Served by pwa.py. Assets come from asset-manifest.json (written by build_assets.py):
+// the worker is registered with ?v=<manifest version>, so every build installs a new
+// worker with its own cache, and old caches are dropped once it activates.
+const VERSION = new URL(self.location).searchParams.get('v') || 'dev';
+const CACHE_PREFIX = 'recipe-app-';
+const CACHE_NAME = CACHE_PREFIX + VERSION;
+const MANIFEST_URL = '/asset-manifest.json';
+const OFFLINE_PAGE = '/offline.html';
+
+// The latest recipe snapshot of the signed-in user, read by offline.html
+const DB_NAME = 'recipe-app';
+const DB_STORE = 'snapshots';
+const SNAPSHOT_KEY = 'current';
 
 self.addEventListener('install', event => {
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(cache => cache.addAll(urlsToCache))
+    fetch(MANIFEST_URL, { cache: 'no-cache' })
+      .then(response => response.json())
+      .then(manifest => caches.open(CACHE_NAME).then(cache =>
+        cache.addAll(Object.values(manifest.assets).map(path => '/' + path))
+      ))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(names => Promise.all(
+        names
+          .filter(name => name.startsWith(CACHE_PREFIX) && name !== CACHE_NAME)
+          .map(name => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
   );
 });
 
 self.addEventListener('fetch', event => {
-  event.respondWith(
-    caches.match(event.request)
-      .then(response => response || fetch(event.request))
+  const request = event.request;
+  const url = new URL(request.url);
+  if (request.method !== 'GET' || url.origin !== self.location.origin || url.pathname === '/snapshot') {
+    return;
+  }
+  if (request.mode === 'navigate') {
+    event.respondWith(
+      fetch(request).catch(() =>
+        caches.match(request, { ignoreSearch: true })
+          .then(response => response || caches.match(OFFLINE_PAGE, { ignoreSearch: true }))
+      )
+    );
+    return;
+  }
+  event.respondWith(staleWhileRevalidate(event));
+});
+
+// Answer from the cache at once and refresh it in the background; go to the network only on a miss
+function staleWhileRevalidate(event) {
+  return caches.open(CACHE_NAME).then(cache =>
+    cache.match(event.request).then(cached => {
+      const network = fetch(event.request).then(response => {
+        if (response.ok) {
+          cache.put(event.request, response.clone());
+        }
+        return response;
+      });
+      if (cached) {
+        event.waitUntil(network.catch(() => undefined));
+        return cached;
+      }
+      return network;
+    })
   );
+}
+
+self.addEventListener('message', event => {
+  const message = event.data || {};
+  if (message.type === 'sync-snapshot') {
+    event.waitUntil(syncSnapshot(message.url).catch(error => console.log('Snapshot sync failed:', error)));
+  } else if (message.type === 'clear-snapshot') {
+    event.waitUntil(storeSnapshot(null));
+  }
 });
+
+function openDb() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(DB_NAME, 1);
+    request.onupgradeneeded = () => request.result.createObjectStore(DB_STORE);
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+function readSnapshot() {
+  return openDb().then(db => new Promise((resolve, reject) => {
+    const request = db.transaction(DB_STORE).objectStore(DB_STORE).get(SNAPSHOT_KEY);
+    request.onsuccess = () => resolve(request.result || null);
+    request.onerror = () => reject(request.error);
+  }));
+}
+
+function storeSnapshot(snapshot) {
+  return openDb().then(db => new Promise((resolve, reject) => {
+    const transaction = db.transaction(DB_STORE, 'readwrite');
+    const store = transaction.objectStore(DB_STORE);
+    if (snapshot) {
+      store.put(snapshot, SNAPSHOT_KEY);
+    } else {
+      store.delete(SNAPSHOT_KEY);
+    }
+    transaction.oncomplete = () => resolve();
+    transaction.onerror = () => reject(transaction.error);
+  }));
+}
+
+// Bring the stored snapshot up to date: nothing is sent back when its version is current
+// (304), only the recipes changed since its cursor otherwise, and everything when it
+// belongs to another user or a delta leaves gaps.
+async function syncSnapshot(url, full = false) {
+  const stored = await readSnapshot();
+  const userId = Number(new URL(url).searchParams.get('token').split('.')[0]);
+  const current = stored && stored.userId === userId && !full ? stored : null;
+
+  const headers = {};
+  let requestUrl = url;
+  if (current) {
+    headers['If-None-Match'] = '"' + current.version + '"';
+    if (current.cursor) {
+      requestUrl += '&since=' + encodeURIComponent(current.cursor);
+    }
+  }
+  const response = await fetch(requestUrl, { headers, cache: 'no-store' });
+  if (response.status === 304) {
+    return;
+  }
+  if (!response.ok) {
+    throw new Error('HTTP ' + response.status);
+  }
+  const data = await response.json();
+
+  const known = data.since && current ? current.recipes : {};
+  for (const recipe of data.recipes) {
+    known[recipe.id] = recipe;
+  }
+  const recipes = {};
+  for (const id of data.ids) {
+    if (!known[id]) {
+      return full ? undefined : syncSnapshot(url, true);
+    }
+    recipes[id] = known[id];
+  }
+  await storeSnapshot({
+    userId,
+    version: data.version,
+    cursor: data.cursor,
+    recipes,
+    syncedAt: Date.now()
+  });
+}
@@ -1,4 +1,11 @@
+import io
+import os
 import re
+from functools import lru_cache
+import numpy as np
+from conversions import UnitConverter
+
+PARSE_CACHE_SIZE = int(os.getenv('PARSE_CACHE_SIZE', '4096'))
 
 def validate_recipe_input(title, category, ingredients, instructions, cooking_time):
     """Validate recipe input data."""
@@ -30,32 +37,82 @@ def format_time(minutes):
         return f"{hours}h {mins}m" if mins > 0 else f"{hours}h"
     return f"{mins}m"
 
-def parse_ingredient_line(line):
-    """Parse an ingredient line into quantity, unit, and ingredient name."""
-    # Regular expression to match quantity, unit, and ingredient
-    pattern = r'^([\d./\s]+)?\s*([a-zA-Z]+\s+|)(.+)$'
-    match = re.match(pattern, line.strip())
-    
-    if not match:
+UNICODE_FRACTIONS = {
+    '½': 1 / 2, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 1 / 4, '¾': 3 / 4,
+    '⅕': 1 / 5, '⅖': 2 / 5, '⅗': 3 / 5, '⅘': 4 / 5, '⅙': 1 / 6, '⅚': 5 / 6,
+    '⅛': 1 / 8, '⅜': 3 / 8, '⅝': 5 / 8, '⅞': 7 / 8,
+}
+
+# Units that are not measurements UnitConverter can convert, but still aren't part of the name
+COUNT_UNITS = {
+    'pinch', 'pinches', 'dash', 'dashes', 'clove', 'cloves', 'can', 'cans', 'slice', 'slices',
+    'piece', 'pieces', 'bunch', 'bunches', 'handful', 'handfuls', 'package', 'packages',
+    'stick', 'sticks', 'sprig', 'sprigs', 'head', 'heads', 'sheet', 'sheets', 'drop', 'drops',
+}
+
+_FRACTION_CHARS = ''.join(UNICODE_FRACTIONS)
+
+# quantity (mixed number, fraction, unicode fraction or decimal), optional unit word(s), name
+INGREDIENT_PATTERN = re.compile(rf"""
+    ^\s*
+    (?:
+        (?:(?P<whole>\d+)\s+)?(?P<numerator>\d+)\s*/\s*(?P<denominator>\d+)   # 1 1/2, 3/4
+      | (?P<vulgar_whole>\d+)?\s*(?P<vulgar>[{_FRACTION_CHARS}])                # 1½, 1 ½, ½
+      | (?P<decimal>\d+(?:\.\d+)?|\.\d+)                                     # 2, 1.5, .5
+    )?
+    \s*
+    (?P<unit>(?:fl\.?\s*oz|fluid\s+ounces?|[^\W\d_]+)\.?(?=\s))?
+    \s*
+    (?:of\s+)?
+    (?P<name>.*)
+""", re.VERBOSE)
+_GROUPS = ('whole', 'numerator', 'denominator', 'vulgar_whole', 'vulgar', 'decimal', 'unit', 'name')
+
+def _quantity(whole, numerator, denominator, vulgar_whole, vulgar, decimal):
+    """Quantity from the INGREDIENT_PATTERN groups as a float, or None."""
+    if decimal:
+        return float(decimal)
+    if vulgar:
+        return float(vulgar_whole or 0) + UNICODE_FRACTIONS[vulgar]
+    if numerator and int(denominator):
+        return int(whole or 0) + int(numerator) / int(denominator)
+    return None
+
+@lru_cache(maxsize=1024)
+def _is_unit(word):
+    return word.lower().rstrip('.') in COUNT_UNITS or UnitConverter.canonical_unit(word) is not None
+
+def _parse_ingredient_line(line):
+    match = INGREDIENT_PATTERN.match(line)
+    if not match or not line.strip():
         return None, None, line.strip()
     
-    qty_str, unit, ingredient = match.groups()
-    
-    # Convert quantity string to float
-    try:
-        if qty_str:
-            # Handle fractions like "1/2"
-            if '/' in qty_str:
-                num, denom = map(float, qty_str.split('/'))
-                quantity = num / denom
-            else:
-                quantity = float(qty_str)
-        else:
-            quantity = None
-    except ValueError:
-        quantity = None
-    
-    return quantity, unit.strip(), ingredient.strip()
+    *quantity_parts, unit, name = match.group(*_GROUPS)
+    quantity = _quantity(*quantity_parts)
+    if unit and not _is_unit(unit):
+        # An ordinary word such as "large" in "2 large eggs" belongs to the name
+        unit, name = None, line[match.start('unit'):].strip()
+    if not name and unit:
+        unit, name = None, unit
+    return quantity, unit.strip() if unit else '', name.rstrip()
+
+_parse_ingredient_line_cached = lru_cache(maxsize=PARSE_CACHE_SIZE)(_parse_ingredient_line)
+
+def parse_ingredient_line(line, use_cache=True):
+    """Parse an ingredient line into quantity, unit, and ingredient name.
+
+    Handles mixed numbers ("1 1/2 cups flour") and unicode fractions ("½ tsp
+    salt"). Repeated lines are served from an LRU cache unless use_cache is False.
+    """
+    if use_cache:
+        return _parse_ingredient_line_cached(line)
+    return _parse_ingredient_line(line)
+
+def format_quantity(quantity):
+    """Format a quantity without trailing zeros, rounded to 2 decimal places."""
+    if float(quantity).is_integer():
+        return str(int(quantity))
+    return f"{quantity:.2f}".rstrip('0').rstrip('.')
 
 def scale_ingredient_line(line, scale_factor):
     """Scale an ingredient line by the given factor."""
@@ -64,25 +121,68 @@ def scale_ingredient_line(line, scale_factor):
     if quantity is None:
         return line
     
-    scaled_qty = quantity * scale_factor
-    
-    # Format the scaled quantity
-    if scaled_qty.is_integer():
-        qty_str = str(int(scaled_qty))
-    else:
-        # Round to 2 decimal places
-        qty_str = f"{scaled_qty:.2f}".rstrip('0').rstrip('.')
+    qty_str = format_quantity(quantity * scale_factor)
     
     # Reconstruct the ingredient line
     if unit:
         return f"{qty_str} {unit} {ingredient}"
     return f"{qty_str} {ingredient}"
 
+def iter_scaled_ingredients(lines, scale_factor):
+    """Lazily scale an iterable of ingredient lines (e.g. an open file), skipping blank lines."""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield scale_ingredient_line(line, scale_factor)
+
 def scale_ingredients(ingredients_text, scale_factor):
     """Scale all ingredients in a recipe by the given factor."""
     if not ingredients_text:
         return ingredients_text
-        
-    lines = ingredients_text.split('\n')
-    scaled_lines = [scale_ingredient_line(line, scale_factor) for line in lines if line.strip()]
-    return '\n'.join(scaled_lines)
+    
+    return '\n'.join(iter_scaled_ingredients(io.StringIO(ingredients_text), scale_factor))
+
+# Metric base units shown in the next larger unit once they reach it
+METRIC_UPGRADES = {'ml': ('l', 1000.0), 'g': ('kg', 1000.0)}
+
+def scale_recipes(recipes, servings=None, metric=False):
+    """Copies of recipes with ingredients scaled to `servings` and/or converted to metric.
+
+    The structured quantities of all recipes are processed in one vectorized
+    pass. Recipes without a servings count keep their quantities, and
+    temperatures are converted but never scaled.
+    """
+    ingredients = [ingredient for recipe in recipes for ingredient in recipe['ingredients']]
+    quantities = np.fromiter((float(i['quantity']) for i in ingredients), dtype=float, count=len(ingredients))
+    units = [i['unit'] for i in ingredients]
+    factors = np.repeat(
+        [servings / recipe['servings'] if servings and recipe.get('servings') else 1.0 for recipe in recipes],
+        [len(recipe['ingredients']) for recipe in recipes]
+    )
+
+    dimensions = {unit: UnitConverter.dimension(unit) for unit in set(units)}
+    scalable = np.array([dimensions[unit] != 'Temperature' for unit in units], dtype=bool)
+    if metric and ingredients:
+        quantities, units = UnitConverter.to_base_many(quantities, units)
+        for base_unit, (larger_unit, size) in METRIC_UPGRADES.items():
+            upgrade = (units == base_unit) & (np.abs(quantities * factors) >= size)
+            quantities = np.where(upgrade, quantities / size, quantities)
+            units = np.where(upgrade, larger_unit, units)
+    quantities = np.where(scalable, quantities * factors, quantities)
+
+    scaled, position = [], 0
+    for recipe in recipes:
+        count = len(recipe['ingredients'])
+        scaled.append({
+            **recipe,
+            'servings': servings if servings and recipe.get('servings') else recipe.get('servings'),
+            'original_servings': recipe.get('servings'),
+            'ingredients': [
+                {**ingredient, 'quantity': float(quantity), 'unit': unit}
+                for ingredient, quantity, unit in zip(
+                    recipe['ingredients'], quantities[position:position + count], units[position:position + count]
+                )
+            ],
+        })
+        position += count
+    return scaled